@@ -0,0 +1,90 @@
+'''
+Runs full bulk export backfills through MarketoClientBatch against the local simulator (bulk_simulator.py) and
+reports wall time, API calls and bytes moved for each way of driving them:
+- loop: run_batch, then check_batch / process_batch / download_batch until every export is downloaded
+- scheduler: BulkExportScheduler, downloads overlapping the exports still processing
+- scheduler, 4 segments: the same, each file downloaded as 4 parallel byte ranges
+
+usage: python benchmarks/bench_batch.py [days] [records_per_day]
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+from bulk_simulator import BulkExportSimulator
+from marketorestpython.batch import MarketoClientBatch
+from marketorestpython.helper.rate_limiter import RateLimiter
+from marketorestpython.scheduler import BulkExportScheduler
+
+
+FIELDS = ['id', 'email', 'firstName', 'lastName', 'company', 'createdAt', 'updatedAt']
+START = datetime(2018, 1, 1)
+POLL_INTERVAL = 0.05
+
+
+def make_client(simulator, directory):
+    client = MarketoClientBatch('123-ABC-456', 'id', 'secret', api_days_max=29, rate_limiter=RateLimiter(
+        max_calls=100000), ledger=os.path.join(directory, 'ledger.db'))
+    client.host = simulator.host
+    return client
+
+
+def loop(client, days, directory):
+    client.run_batch(START, START + timedelta(days - 1), table='leads', fields=FIELDS)
+    while True:
+        client.check_batch(table='leads')
+        client.process_batch(table='leads')
+        client.download_batch(table='leads')
+        exports = client.ledger.exports(table='leads')
+        if all(export.get('filename') or export.get('status') in ('Failed', 'Cancelled') for export in exports):
+            return len(exports)
+        time.sleep(POLL_INTERVAL)
+
+
+def scheduler(segments):
+    def run(client, days, directory):
+        scheduler = BulkExportScheduler(client, table='leads', fields=FIELDS, path=directory,
+                                        poll_interval=POLL_INTERVAL, max_poll_interval=POLL_INTERVAL * 4,
+                                        daily_quota=None, segments=segments)
+        scheduler.add_date_range(START, START + timedelta(days - 1), days=30)
+        return len(scheduler.run())
+    return run
+
+
+def measure(label, func, days, records_per_day):
+    simulator = BulkExportSimulator(records_per_day=records_per_day, start_delay=0.1, process_rate=20 * 1024 * 1024)
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(directory)  # download_batch writes to the working directory
+    stdout = sys.stdout
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        client = make_client(simulator, directory)
+        start = time.perf_counter()
+        jobs = func(client, days, directory)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(cwd)
+        simulator.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+    stats = simulator.stats()
+    print('{:<22} {:3d} jobs {:7.2f} s {:6d} API calls {:8.1f} MB {:6.1f} MB/s'.format(
+        label, jobs, elapsed, stats['api_calls'], stats['bytes_sent'] / 1024 / 1024,
+        stats['bytes_sent'] / 1024 / 1024 / elapsed))
+
+
+def main(days=365, records_per_day=2000):
+    print('{} days, {} records per day'.format(days, records_per_day))
+    measure('loop', loop, days, records_per_day)
+    measure('scheduler', scheduler(1), days, records_per_day)
+    measure('scheduler, 4 segments', scheduler(4), days, records_per_day)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,95 @@
+'''
+Measures calls/sec against a local stub of the Marketo REST API, comparing the old transport
+(a module level requests.get per call, so a new connection each time) with the pooled session
+that MarketoClient now owns. Both go through the library: HttpLib.get, and MarketoClient.get_lead_by_id
+with its host pointed at the stub (token call, rate limiter and retry policy included).
+
+usage: python benchmarks/bench_http_pool.py [number_of_calls]
+'''
+import json
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from marketorestpython.client import MarketoClient
+from marketorestpython.helper.http_lib import HttpLib, create_session
+from marketorestpython.helper.rate_limiter import RateLimiter
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    disable_nagle_algorithm = True
+    token = json.dumps({'access_token': 'abc', 'token_type': 'bearer', 'expires_in': 3599,
+                        'scope': 'api@example.com'}).encode('utf-8')
+    body = json.dumps({'requestId': '1#1', 'success': True, 'result': [{'id': 1}]}).encode('utf-8')
+
+    def do_GET(self):
+        body = self.token if self.path.startswith('/identity/oauth/token') else self.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def rate_limiter():
+    # no throttling: the transport is what's measured, not the 100 calls / 20 seconds window
+    return RateLimiter(max_calls=10 ** 9)
+
+
+def run(call, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    return calls / (time.perf_counter() - start)
+
+
+def http_lib(host, session, calls):
+    request = HttpLib(session, rate_limiter())
+    return run(lambda: request.get(host + '/rest/v1/lead/1.json', {'access_token': 'abc'}), calls)
+
+
+def client(host, session, calls):
+    mc = MarketoClient('123-FDY-456', 'id', 'secret', session=session, rate_limiter=rate_limiter())
+    mc.host = host
+    mc.authenticate()
+    return run(lambda: mc.get_lead_by_id(1), calls)
+
+
+def main(calls=1000):
+    server = start_stub_server()
+    host = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    results = []
+    try:
+        for label, measure in [('HttpLib.get', http_lib), ('MarketoClient.get_lead_by_id', client)]:
+            # the requests module as the session: a module level requests.get per call, the transport before pooling
+            before = measure(host, requests, calls)
+            session = create_session()
+            after = measure(host, session, calls)
+            session.close()
+            results.append((label, before, after))
+    finally:
+        server.shutdown()
+    for label, before, after in results:
+        print(label)
+        print('  per-call connection: {:8.1f} calls/sec'.format(before))
+        print('  pooled session:      {:8.1f} calls/sec'.format(after))
+        print('  speedup:             {:8.2f}x'.format(after / before))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
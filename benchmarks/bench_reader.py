@@ -0,0 +1,65 @@
+'''
+Measures the throughput of BulkExportReader on a generated leads export: raw csv.reader parsing, typed
+batches and the NDJSON.gz conversion (plus Parquet when pyarrow is installed), in MB of CSV per second.
+
+usage: python benchmarks/bench_reader.py [number_of_rows]
+'''
+import csv
+import os
+import sys
+import tempfile
+import time
+
+from marketorestpython.reader import BulkExportReader
+
+
+TYPES = {'id': 'integer', 'email': 'email', 'score__c': 'float', 'unsubscribed': 'boolean',
+         'createdAt': 'datetime', 'updatedAt': 'datetime', 'company': 'string'}
+
+
+def make_export(file_name, rows):
+    with open(file_name, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(list(TYPES))
+        for i in range(rows):
+            writer.writerow([i, 'lead{}@example.com'.format(i), i % 100 / 3.0, 'true' if i % 2 else 'false',
+                             '2018-01-01T10:00:00Z', '2018-02-01T10:00:00Z', 'Company {}'.format(i % 1000)])
+
+
+def timed(label, size, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{:<16} {:8.1f} MB/s'.format(label, size / elapsed / 1024 / 1024))
+
+
+def main(rows=500000):
+    directory = tempfile.mkdtemp()
+    file_name = os.path.join(directory, 'leads.csv')
+    make_export(file_name, rows)
+    size = os.path.getsize(file_name)
+    print('{} rows, {:.1f} MB'.format(rows, size / 1024 / 1024))
+    reader = BulkExportReader(file_name, TYPES)
+
+    def parse():
+        with open(file_name, newline='', encoding='utf-8') as handle:
+            for _ in csv.reader(handle):
+                pass
+
+    def batches():
+        for _ in reader.batches():
+            pass
+
+    timed('csv.reader', size, parse)
+    timed('typed batches', size, batches)
+    timed('ndjson.gz', size, lambda: reader.to_ndjson(os.path.join(directory, 'leads.ndjson.gz')))
+    try:
+        import pyarrow  # noqa
+    except ImportError:
+        print('parquet          (pyarrow not installed)')
+    else:
+        timed('parquet', size, lambda: reader.to_parquet(os.path.join(directory, 'leads.parquet')))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,233 @@
+'''
+A local stand-in for the Marketo bulk export API (/bulk/v1/<table>/export/...), for benchmarks and offline runs
+of MarketoClientBatch: point client.host at simulator.host.
+
+It models the export queue (max_queue jobs queued or processing, max_processing of them processing), the time a
+job takes (start_delay plus fileSize / process_rate seconds), file sizes (records_per_day records of the date
+filter's window, row_size bytes each), the daily export quota and failed jobs (failure_rate). Files are served
+with Range support. stats() reports the calls per endpoint, the bytes sent and the peak queue length.
+
+usage: python benchmarks/bulk_simulator.py [port]  (serves until interrupted)
+'''
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+ACTIVITY_COLUMNS = ['marketoGUID', 'leadId', 'activityDate', 'activityTypeId', 'campaignId',
+                    'primaryAttributeValueId', 'primaryAttributeValue', 'attributes']
+ROUTE = re.compile(r'/bulk/v1/(\w+|program/members)/export(?:/([^/]+))?(?:/(\w+))?\.json')
+
+
+class BulkExportSimulator:
+    def __init__(self, max_queue=10, max_processing=2, start_delay=0.2, process_rate=50 * 1024 * 1024,
+                 records_per_day=1000, row_size=200, daily_quota=None, failure_rate=0.0, seed=0, port=0):
+        self.max_queue = max_queue
+        self.max_processing = max_processing
+        self.start_delay = start_delay
+        self.process_rate = process_rate
+        self.records_per_day = records_per_day
+        self.row_size = row_size
+        self.daily_quota = daily_quota
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.jobs = {}
+        self.calls = {}
+        self.bytes_sent = 0
+        self.bytes_exported = 0
+        self.peak_queue = 0
+        self.lock = threading.Lock()
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+                status, headers, data = simulator.handle(self.command, url.path, query, body,
+                                                         self.headers.get('Range'))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.host = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --------- jobs ---------
+    def _window_days(self, filter):
+        for value in filter.values():
+            if isinstance(value, dict) and 'startAt' in value and 'endAt' in value:
+                start = datetime.fromisoformat(value['startAt'].replace('Z', '+00:00'))
+                end = datetime.fromisoformat(value['endAt'].replace('Z', '+00:00'))
+                return max(1, int(math.ceil((end - start).total_seconds() / 86400)))
+        return 1
+
+    def _make_file(self, job):
+        columns = job['fields'] or ACTIVITY_COLUMNS
+        records = job['numberOfRecords']
+        lines = [','.join(columns)]
+        filler = 'x' * max(0, self.row_size - 10 * len(columns))
+        start = self.random.randrange(1, 10 ** 7)
+        for number in range(records):
+            values = [str(start + number)] + ['{}{}'.format(column[:4], number) for column in columns[1:]]
+            values[-1] += filler
+            lines.append(','.join(values))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _update(self, now):
+        ''' moves jobs along: queued ones start while there's room, processing ones complete or fail '''
+        for job in self.jobs.values():
+            if job['status'] == 'Processing' and now >= job['done_at']:
+                if self.random.random() < self.failure_rate:
+                    job.update(status='Failed', errorMsg='Simulated failure')
+                else:
+                    job['data'] = self._make_file(job)
+                    job.update(status='Completed', fileSize=len(job['data']),
+                               finishedAt=datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+                    self.bytes_exported += len(job['data'])
+        processing = sum(1 for job in self.jobs.values() if job['status'] == 'Processing')
+        for job in sorted(self.jobs.values(), key=lambda job: job.get('queued_at', 0)):
+            if job['status'] == 'Queued' and processing < self.max_processing:
+                size = job['numberOfRecords'] * self.row_size
+                job.update(status='Processing', done_at=now + self.start_delay + size / float(self.process_rate))
+                processing += 1
+
+    def _public(self, job):
+        return {k: v for k, v in job.items() if k not in ('data', 'fields', 'filter', 'table', 'queued_at',
+                                                          'done_at')}
+
+    def _error(self, code, message):
+        return {'success': False, 'errors': [{'code': code, 'message': message}]}
+
+    def handle(self, method, path, query, body, range_header=None):
+        ''' returns (HTTP status, headers, body bytes) '''
+        with self.lock:
+            now = time.time()
+            self._update(now)
+            if path == '/identity/oauth/token':
+                endpoint, result = 'token', {'access_token': 'simulated', 'token_type': 'bearer',
+                                             'expires_in': 3600, 'scope': 'simulator'}
+            else:
+                match = ROUTE.fullmatch(path)
+                if match is None:
+                    return 404, {'Content-Type': 'application/json'}, json.dumps(self._error('404', path)).encode()
+                table, export_id, action = match.groups()
+                endpoint = action or ('list' if method == 'GET' else 'create')
+                if export_id == 'create':
+                    endpoint, export_id = 'create', None
+                job = self.jobs.get(export_id) if export_id else None
+                if export_id and job is None:
+                    result = self._error('1029', 'Export job not found')
+                elif endpoint == 'file':
+                    self.calls['file'] = self.calls.get('file', 0) + 1
+                    return self._file(job, range_header)
+                else:
+                    result = getattr(self, '_' + endpoint)(table, job, query, body, now)
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            return 200, {'Content-Type': 'application/json'}, json.dumps(result).encode('utf-8')
+
+    def _create(self, table, job, query, body, now):
+        if table in ('leads', 'program/members') and not body.get('fields'):
+            return self._error('1003', 'fields is required')
+        export_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+        days = self._window_days(body.get('filter', {}))
+        records = int(days * self.records_per_day * self.random.uniform(0.5, 1.5))
+        job = {'exportId': export_id, 'status': 'Created', 'format': body.get('format', 'CSV'),
+               'createdAt': datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'), 'table': table,
+               'fields': body.get('fields'), 'filter': body.get('filter'), 'numberOfRecords': records}
+        self.jobs[export_id] = job
+        return {'success': True, 'result': [self._public(job)]}
+
+    def _enqueue(self, table, job, query, body, now):
+        queued = sum(1 for other in self.jobs.values() if other['status'] in ('Queued', 'Processing'))
+        if queued >= self.max_queue:
+            return self._error('1029', 'Too many jobs ({}) in queue'.format(self.max_queue))
+        if self.daily_quota is not None and self.bytes_exported >= self.daily_quota:
+            return self._error('1029', 'Export daily quota exceeded')
+        job.update(status='Queued', queued_at=now)
+        self.peak_queue = max(self.peak_queue, queued + 1)
+        self._update(now)
+        return {'success': True, 'result': [self._public(job)]}
+
+    def _status(self, table, job, query, body, now):
+        return {'success': True, 'result': [self._public(job)]}
+
+    def _cancel(self, table, job, query, body, now):
+        job['status'] = 'Cancelled'
+        return {'success': True, 'result': [self._public(job)]}
+
+    def _list(self, table, job, query, body, now):
+        statuses = query.get('status')
+        jobs = [self._public(job) for job in self.jobs.values()
+                if job['table'] == table and (statuses is None or job['status'] in statuses.split(','))]
+        start = int(query.get('nextPageToken', 0))
+        end = start + min(int(query.get('batchSize', 300)), 300)
+        result = {'success': True, 'result': jobs[start:end]}
+        if end < len(jobs):
+            result['nextPageToken'] = str(end)
+        return result
+
+    def _file(self, job, range_header):
+        if job['status'] != 'Completed':
+            return 404, {'Content-Type': 'application/json'}, json.dumps(
+                self._error('1029', 'Export not completed')).encode('utf-8')
+        data = job['data']
+        headers = {'Content-Type': 'text/csv', 'Accept-Ranges': 'bytes'}
+        if range_header:
+            start, end = range_header.split('=', 1)[1].split('-')
+            start = int(start)
+            end = int(end) if end else len(data) - 1
+            if start >= len(data):
+                return 416, headers, b''
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(data))
+            self.bytes_sent += end - start + 1
+            return 206, headers, data[start:end + 1]
+        self.bytes_sent += len(data)
+        return 200, headers, data
+
+    def stats(self):
+        with self.lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job['status']] = statuses.get(job['status'], 0) + 1
+            return {'calls': dict(self.calls), 'api_calls': sum(count for endpoint, count in self.calls.items()
+                                                                 if endpoint != 'file'),
+                    'bytes_sent': self.bytes_sent, 'bytes_exported': self.bytes_exported,
+                    'peak_queue': self.peak_queue, 'jobs': statuses}
+
+
+if __name__ == '__main__':
+    simulator = BulkExportSimulator(port=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    print('simulating the bulk export API on {}'.format(simulator.host))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.shutdown()
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import inspect
+
+from concurrent.futures import ThreadPoolExecutor
+
+from marketorestpython.client import MarketoClient
+
+
+class AsyncMarketoClient:
+    '''
+    asyncio front end for MarketoClient. Every public MarketoClient method is available as a coroutine,
+    and the *_yield paginators become async generators (use them with "async for").
+
+    Calls run on a pool of max_concurrency worker threads (10 = Marketo's concurrent call limit) against a
+    single MarketoClient, so authentication, retries and rate limiting are exactly the ones from HttpLib.
+    '''
+    def __init__(self, munchkin_id, client_id, client_secret, api_limit=None, max_concurrency=10, client=None,
+                 **kwargs):
+        if client is None:
+            kwargs.setdefault('pool_maxsize', max_concurrency)
+            client = MarketoClient(munchkin_id, client_id, client_secret, api_limit, **kwargs)
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def __getattr__(self, name):
+        # token, host, API_CALLS_MADE, etc. are read from the wrapped client
+        return getattr(self.client, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _iterate(self, func, *args, **kwargs):
+        iterator = await self._run(func, *args, **kwargs)
+        done = object()
+        try:
+            while True:
+                page = await self._run(next, iterator, done)
+                if page is done:
+                    break
+                yield page
+        finally:
+            await self._run(iterator.close)
+
+    def execute(self, method, *args, **kargs):
+        '''
+        same as MarketoClient.execute (including the re-authentication on 601/602); returns an awaitable,
+        or an async iterator for the *_yield methods
+        '''
+        if method.endswith('_yield'):
+            return self._iterate(self.client.execute, method, *args, **kargs)
+        return self._run(self.client.execute, method, *args, **kargs)
+
+    async def authenticate(self):
+        await self._run(self.client.authenticate)
+
+    def _shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    async def close(self):
+        ''' waits for the calls in flight (in a thread, so other coroutines keep running) and closes the client '''
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+
+def _make_coroutine(name):
+    method = getattr(MarketoClient, name)
+
+    @functools.wraps(method)
+    async def coroutine(self, *args, **kwargs):
+        return await self._run(getattr(self.client, name), *args, **kwargs)
+    return coroutine
+
+
+def _make_async_generator(name):
+    method = getattr(MarketoClient, name)
+
+    @functools.wraps(method)
+    async def async_generator(self, *args, **kwargs):
+        async for page in self._iterate(getattr(self.client, name), *args, **kwargs):
+            yield page
+    return async_generator
+
+
+for _name, _method in inspect.getmembers(MarketoClient, inspect.isfunction):
+    if _name.startswith('_') or hasattr(AsyncMarketoClient, _name):
+        continue
+    if inspect.isgeneratorfunction(_method):
+        setattr(AsyncMarketoClient, _name, _make_async_generator(_name))
+    else:
+        setattr(AsyncMarketoClient, _name, _make_coroutine(_name))
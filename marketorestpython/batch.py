@@ -1,6 +1,5 @@
 import time
 import os
-import pickle
 
 from collections import deque
 from datetime import date, datetime, timezone, timedelta
@@ -8,47 +7,65 @@ from dateutil.tz import tzoffset
 from dateutil import tz
 
 from marketorestpython.client import MarketoClient
-from marketorestpython.helper.http_lib import HttpLib
 from marketorestpython.helper.exceptions import MarketoException
-
-xstr = lambda s: s or ''
+from marketorestpython.helper.download import download_file, download_to_sink
+from marketorestpython.ledger import JobLedger
+from marketorestpython.helper.csv_join import join_csv
+from marketorestpython.planner import ExportPlanner, fixed_windows, partition_fields, label_file_name
+
+# date filter used to split each bulk export table into windows; program members also need a programId
+BULK_DATE_FILTERS = {
+    'leads': 'createdAt',
+    'activities': 'createdAt',
+    'program/members': 'updatedAt',
+}
 
 class MarketoClientBatch(MarketoClient):
     def __init__(self, munchkin_id, client_id, client_secret, 
-                api_limit=None, api_size_limit=None, api_days_max=None):
-        super(MarketoClientBatch, self).__init__(munchkin_id, client_id, client_secret, api_limit)
+                api_limit=None, api_size_limit=None, api_days_max=None, session=None, rate_limiter=None,
+                quota_backend=None, retry_policy=None, ledger=None):
+        super(MarketoClientBatch, self).__init__(munchkin_id, client_id, client_secret, api_limit, session=session,
+                                                 rate_limiter=rate_limiter, quota_backend=quota_backend,
+                                                 retry_policy=retry_policy)
 
         # init the batch frameworks...
         self.API_DAYS_MAX = api_days_max
         self.API_SIZE_LIMIT = api_size_limit
         self.API_MAX_QUEUE = 9
         self.API_QUEUE_COUNT = self.API_MAX_QUEUE
-        self.data = {}
         self._name = self.__class__.__name__ #name
         self._pickleName = "{}_{}_batch.pickle".format(self._name, munchkin_id)
+        # job state lives in a SQLite ledger (a JobLedger or a file name), opened on first use
+        self._ledger = ledger if ledger is not None else "{}_{}_batch.db".format(self._name, munchkin_id)
+
+    @property
+    def ledger(self):
+        if not isinstance(self._ledger, JobLedger):
+            ledger = JobLedger(self._ledger)
+            if os.path.exists(self._pickleName):
+                # state saved by earlier versions
+                ledger.migrate_pickle(self._pickleName)
+            self._ledger = ledger
+        return self._ledger
+
+    @property
+    def data(self):
+        ''' snapshot of the ledger in the layout of the old pickle, for display '''
+        return self.ledger.to_dict()
 
     def _api_call(self, method, endpoint, *args, **kwargs):
-        request = HttpLib()
-        print('Request:{}\n\t{}\n\t{}'.format(method, endpoint, *args))
-        result = getattr(request, method)(endpoint, *args, **kwargs)
-        self.API_CALLS_MADE += 1
-        if self.API_LIMIT and self.API_CALLS_MADE >= self.API_LIMIT:
-            raise Exception({'message': '# of API Calls exceeded the limit as specified in the Python script: '
-                                        + str(self.API_LIMIT), 'code': '416'})
-        return result
-
-    def _download_file(self, url, file_name):
-        import requests
-        
-        chunk_size = 8096
-
-        response = requests.get(url, stream=True)
-        bytes_transferred = 0
-        with open(file_name, 'wb') as file_handle:
-            for chunk in response.iter_content(chunk_size):
-                file_handle.write(chunk)
-                bytes_transferred += len(chunk)
-        return bytes_transferred
+        params = args[0] if args else None
+        if isinstance(params, dict) and 'access_token' in params:
+            # don't write the token to the log
+            params = dict(params, access_token='***')
+        print('Request:{}\n\t{}\n\t{}'.format(method, endpoint, params))
+        return super(MarketoClientBatch, self)._api_call(method, endpoint, *args, **kwargs)
+
+    def _download_file(self, url, file_name, file_size=None, chunk_size=None, segments=1, params=None):
+        # resumable, written to file_name only once complete; see helper/download.py
+        return download_file(self.session, url, file_name, expected_size=file_size, chunk_size=chunk_size,
+                             segments=segments, rate_limiter=self.rate_limiter, retry_policy=self.retry_policy,
+                             params=params)
 
     def execute(self, method, *args, **kargs):
         ''' 
@@ -67,6 +84,8 @@ class MarketoClientBatch(MarketoClient):
                 method_map={
                     'create_bulk_extract': self.create_bulk_extract,
                     'get_bulk_jobs': self.get_bulk_jobs,
+                    'get_bulk_jobs_yield': self.get_bulk_jobs_yield,
+                    'get_all_bulk_jobs': self.get_all_bulk_jobs,
                     'start_bulk_job': self.start_bulk_job,
                     'status_bulk_job': self.status_bulk_job,
                     'retrieve_bulk_job': self.retrieve_bulk_job,
@@ -103,24 +122,66 @@ class MarketoClientBatch(MarketoClient):
 
         return {'startAt': start_at, 'endAt': end_at}
 
-    def _load_pickle_data(self):
-        if os.path.exists(self._pickleName):
-            print('Loading Saved Data... [%s]' % self._pickleName)
-            with open(self._pickleName, 'rb') as handle:
-                self.data = pickle.load(handle)
-
-    def _save_pickle_data(self):
-        print('Saving Data... [%s]' % self._pickleName)
-        with open(self._pickleName, 'wb') as handle:
-            pickle.dump(self.data, handle)
+    def _bulk_scope(self, table, filter):
+        '''
+        the table plus the non-date filters, used as the first part of the batch labels so exports of the same
+        dates with other filters (another programId, other activityTypeIds) get their own labels
+        '''
+        scope = table.lower()
+        if filter:
+            items = []
+            for key in sorted(filter):
+                value = filter[key]
+                if isinstance(value, (list, tuple)):
+                    value = ','.join(str(v) for v in value)
+                items.append('{}={}'.format(key, value))
+            scope += '?' + '&'.join(items)
+        return scope.replace(':', '.')
+
+    def _bulk_filter(self, table, start_dt, end_dt, filter_field=None, filter=None):
+        filter_field = filter_field or BULK_DATE_FILTERS.get(table, 'createdAt')
+        window_filter = dict(filter or {})
+        window_filter[filter_field] = self._get_isodate(start_dt, end_dt)
+        return window_filter
+
+    def _bulk_fields(self, table, custom_fields=True):
+        '''
+        the default field list of a bulk export: every field of program members, every field of leads (without
+        the custom __c ones if custom_fields is False); None for activities, which export all their columns
+        '''
+        if table == 'program/members':
+            return [field['name'] for field in self.describe_program_members()[0]['fields']]
+        if table == 'leads':
+            fields = []
+            for r in super().describe():
+                api = r['rest']['name']
+                if api[-3:] != '__c' or custom_fields:
+                    fields.append(api)
+            return fields
+        return None
 
     # --------- batch runner ---------
-    def run_batch(self, start_dt=None, end_dt=None, table=None, fields=None):
+    def run_batch(self, start_dt=None, end_dt=None, table=None, fields=None, target_size=None, probe=False,
+                  filter_field=None, activityTypeIds=None, programId=None, filter=None, custom_fields=True,
+                  max_fields=None):
         '''
         This will create the jobs, then start it.
         It will also query the job queue for running, completed and failed jobs
         For jobs that are completed it will download them only if the file is not present
 
+        table is leads, activities or program/members. Each window filters on filter_field (createdAt for leads
+        and activities, updatedAt for program members), plus activityTypeIds, programId and any other filter
+        given in filter.
+
+        For leads, the default field list has every field, custom (__c) ones included unless custom_fields is
+        False. With max_fields, the fields are split into column groups of at most max_fields fields (each with id)
+        that are exported as separate jobs for every window; join_batch joins their files on id afterwards.
+
+        With target_size (bytes) the windows are sized from the completed exports in the ledger to produce files
+        of about that size (see planner.py); with probe, a one day export is run first when there are none yet.
+        Otherwise, or without any completed exports, the range is split into API_DAYS_MAX day windows.
+
+        Returns the batch record (as in ledger.batches()) with its label and the export_ids this call created.
         '''
         if end_dt < start_dt:
             end_dt, start_dt = start_dt, end_dt
@@ -128,112 +189,124 @@ class MarketoClientBatch(MarketoClient):
         if table is None:
             table = 'leads'
 
+        filter = dict(filter or {})
+        if activityTypeIds is not None:
+            filter['activityTypeIds'] = activityTypeIds
+        if programId is not None:
+            filter['programId'] = programId
+        if table == 'program/members' and 'programId' not in filter and 'programIds' not in filter:
+            raise ValueError("Invalid argument: required argument programId is none.")
+        scope = self._bulk_scope(table, filter)
+
         if fields is None:
-            if table == 'leads':
-                resp = super().describe()
-
-                field_md = []
-                fields = []
-                for r in resp:
-                    field = {}
-                    field['name'] = r['displayName']
-                    field['api'] = r['rest']['name']
-                    field['type'] = r['dataType']
-                    if 'length' in r:
-                        field['length'] = r['length']
-                    field_md.append(field)
-                    if field['api'][-3:] != '__c':
-                        fields.append(field['api'])
-                
-        batch_label = '{}:{}:{}'.format(table.lower(), start_dt.date(), end_dt.date())
+            fields = self._bulk_fields(table, custom_fields)
+
+        groups = partition_fields(fields, max_fields) if max_fields and fields else [fields]
+        batch_label = '{}:{}:{}'.format(scope, start_dt.date(), end_dt.date())
 
         if self.API_DAYS_MAX is None:
             self.API_DAYS_MAX = 30
         
-        # set up the data...
-        if 'requests' not in self.data:
-            self.data['requests'] = {}
-
-        if 'batches' not in self.data:
-            self.data['batches'] = {}
-
-        if batch_label in self.data['batches']:
+        if self.ledger.get_batch(batch_label) is not None:
             # we've already requested this batch
             raise ValueError("{} has already been processed!".format(batch_label))
 
-        self.data['batches'][batch_label] = {
-            'requsted': datetime.now,
+        self.ledger.update_batch(batch_label, {
+            'requested': datetime.now(),
             'table': table, 
             'start': start_dt,
             'end': end_dt
-        }
-
-        # use the step date to batch up the dump into months
-        step_dt = start_dt
-        while step_dt < end_dt:
-            # step_dt is the end of the month or end_dt
-            add_days = self.API_DAYS_MAX
-
-            step_dt = start_dt + timedelta(add_days)   
-            if step_dt > end_dt:
-                step_dt = end_dt
-
-            step_label = '{}:{}:{}'.format(table.lower(), start_dt.strftime("%Y-%m-%d"), step_dt.strftime("%Y-%m-%d"))
-
-            if step_label in self.data['batches']:
+        })
+
+        created = []
+        windows = None
+        if target_size is not None:
+            # fixed windows span API_DAYS_MAX + 1 days, the planner's can't be longer
+            planner = ExportPlanner(self.ledger, table, target_size, max_days=self.API_DAYS_MAX + 1, scope=scope)
+            windows = planner.plan(start_dt, end_dt)
+            if windows is None and probe:
+                self.probe_export(start_dt, table=table, fields=max(groups, key=lambda group: len(group or [])),
+                                  filter_field=filter_field, filter=filter)
+                windows = planner.plan(start_dt, end_dt)
+        if windows is None:
+            # use the step date to batch up the dump into months
+            windows = fixed_windows(start_dt, end_dt, self.API_DAYS_MAX)
+
+        for start_dt, step_dt in windows:
+            step_label = '{}:{}:{}'.format(scope, start_dt.strftime("%Y-%m-%d"), step_dt.strftime("%Y-%m-%d"))
+
+            requested = self.ledger.get_batch(step_label)
+            # a single window has the same label as the batch itself
+            if requested is not None and 'filter' in requested:
                 print('Skipping already requested....')
                 continue
 
             # now to create the job...
-            filter = {
-                "createdAt": self._get_isodate(start_dt, step_dt)
-            }    
-            self.data['batches'][step_label] = {
-                'requested': datetime.now,
+            window_filter = self._bulk_filter(table, start_dt, step_dt, filter_field, filter)
+            self.ledger.update_batch(step_label, {
+                'requested': datetime.now(),
                 'start': start_dt,
                 'end': step_dt,
-                'filter': filter
-            }
+                'filter': window_filter
+            })
             
-            response = self.execute('create_bulk_extract', table=table, filter=filter, fields=fields)
-
-            # we have a response...
-            for result in response:
-                # get the exportID, and save this...
-                '''
-                    {
-                        "exportId": "ce45a7a1-f19d-4ce2-882c-a3c795940a7d",
-                        "status": "Created",
-                        "createdAt": "2017-01-21T11:47:30-08:00",
-                        "queuedAt": "2017-01-21T11:48:30-08:00",
-                        "format": "CSV",
-                    }                
-                '''
-                export_id = result['exportId']
-                self.data['batches'][step_label]['export_id'] = export_id
-
-                if export_id not in self.data:
-                    self.data[export_id] = {}
-                    self.data[export_id]['calls'] = []
-
-                result['startAt'] = start_dt
-                result['endAt'] = step_dt
-                self.data[export_id]['name'] = step_label
-                self.data[export_id]['batch'] = batch_label
-
-                self.data[export_id]['calls'].append(result)
-
-            # set to the next day
-            start_dt = step_dt + timedelta(1)
-
-        self._save_pickle_data()
+            for number, group_fields in enumerate(groups):
+                response = self.execute('create_bulk_extract', table=table, filter=window_filter, fields=group_fields)
+
+                # we have a response...
+                for result in response:
+                    # get the exportID, and save this...
+                    '''
+                        {
+                            "exportId": "ce45a7a1-f19d-4ce2-882c-a3c795940a7d",
+                            "status": "Created",
+                            "createdAt": "2017-01-21T11:47:30-08:00",
+                            "queuedAt": "2017-01-21T11:48:30-08:00",
+                            "format": "CSV",
+                        }                
+                    '''
+                    export_id = result['exportId']
+                    export_ids = self.ledger.get_batch(step_label).get('export_ids', [])
+                    self.ledger.update_batch(step_label, {'export_id': export_id,
+                                                          'export_ids': export_ids + [export_id]})
+
+                    result['startAt'] = start_dt
+                    result['endAt'] = step_dt
+                    export = {'name': step_label, 'batch': batch_label, 'table': table, 'status': result['status'],
+                              'format': result['format']}
+                    if len(groups) > 1:
+                        # column group number of groups, joined by join_batch
+                        export.update(group=number, groups=len(groups))
+                    self.ledger.update_export(export_id, export)
+                    self.ledger.add_call(export_id, result)
+                    created.append(export_id)
 
         # for each job create 
         print('Job Initialized!')
-        return self.data
+        return dict(self.ledger.get_batch(batch_label), label=batch_label, export_ids=created)
+
+    def probe_export(self, start_dt, days=1, table=None, fields=None, poll_interval=30, filter_field=None,
+                     filter=None):
+        '''
+        exports days days from start_dt and waits for it to complete, so its numberOfRecords and fileSize can be
+        used to size the windows of run_batch; the job is kept in the ledger like the ones run_batch creates
+        '''
+        if table is None:
+            table = 'leads'
+        end_dt = start_dt + timedelta(days - 1)
+        label = '{}:{}:{}'.format(self._bulk_scope(table, filter), start_dt.strftime("%Y-%m-%d"),
+                                  end_dt.strftime("%Y-%m-%d"))
+        window_filter = self._bulk_filter(table, start_dt, end_dt, filter_field, filter)
+        export_id = self.create_bulk_extract(table=table, filter=window_filter, fields=fields)[0]['exportId']
+        self.ledger.update_export(export_id, {'name': label, 'batch': 'probe', 'table': table})
+        result = self.start_bulk_job(export_id, table=table)[0]
+        while result['status'] in ['Created', 'Queued', 'Processing']:
+            time.sleep(poll_interval)
+            result = self.status_bulk_job(export_id, table=table)[0]
+        self.ledger.update_export(export_id, result)
+        return result
 
     def check_batch(self, table = None):
-        self._load_pickle_data()
         if table is None:
             table = 'leads'
 
@@ -255,26 +328,20 @@ class MarketoClientBatch(MarketoClient):
             'Rowcount': 0
         }
 
-        response = self.execute('get_bulk_jobs', table=table, status=status)
+        response = self.execute('get_all_bulk_jobs', table=table, status=status)
         for result in response:
             batch_counts['Items'] += 1
             export_id = result['exportId']
-            if export_id not in self.data:
-                self.data[export_id] = {}
-                self.data[export_id]['status'] = 'Init'
-                self.data[export_id]['calls'] = []
-            
             if result['status'] in ['Queued','Processing']:
                 self.API_QUEUE_COUNT -= 1
 
             batch_counts[result['status']] += 1
 
-            if 'status' not in self.data[export_id]:
-                self.data[export_id]['status'] = 'Init'
-
-            if self.data[export_id]['status'] != result['status']:
-                for key in result:
-                    self.data[export_id][key] = result[key]
+            # one row per export, only written when the status moved on
+            saved = self.ledger.get_export(export_id)
+            if saved is None or saved.get('status') != result['status']:
+                result['table'] = table
+                self.ledger.update_export(export_id, result)
 
             if 'fileSize' in result:
                 batch_counts['FileSize'] += result['fileSize']
@@ -282,7 +349,6 @@ class MarketoClientBatch(MarketoClient):
             if 'numberOfRecords' in result:
                 batch_counts['Rowcount'] += result['numberOfRecords']   
 
-        self._save_pickle_data()        
 
         print('\tBatch counts:')
         for key in batch_counts:
@@ -293,7 +359,6 @@ class MarketoClientBatch(MarketoClient):
         '''
         this will start the created jobs...
         '''
-        self._load_pickle_data()
         if table is None:
             table = 'leads'
 
@@ -304,16 +369,11 @@ class MarketoClientBatch(MarketoClient):
         if not self.API_QUEUE_COUNT:
             self.API_QUEUE_COUNT = self.API_MAX_QUEUE
         
-        response = self.execute('get_bulk_jobs', table=table, status=status)
+        response = self.execute('get_all_bulk_jobs', table=table, status=status)
 
         for result in response: #['result']:
             export_id = result['exportId']
 
-            if export_id not in self.data:
-                self.data[export_id] = {}
-                self.data[export_id]['status'] = 'Init'
-                self.data[export_id]['calls'] = []
-
             if result['status'] == 'Created' and self.API_QUEUE_COUNT > 0:
                 print('starting export: [{}]'.format(export_id))
                 try:
@@ -327,57 +387,78 @@ class MarketoClientBatch(MarketoClient):
                     self.API_QUEUE_COUNT = 0
                     break
 
-                for key in r[0]:
-                    self.data[export_id][key] = r[0][key]
-
-                self.data[export_id]['calls'].append(r[0])
+                self.ledger.update_export(export_id, dict(r[0], table=table))
+                self.ledger.add_call(export_id, r[0])
                 self.API_QUEUE_COUNT -= 1
 
             if self.API_QUEUE_COUNT <= 0:
                 print('Too many items in the queue...')
                 break
 
-        self._save_pickle_data()
         return response   
 
-    def download_batch(self, table=None):
+    def download_batch(self, table=None, sink=None):
         '''
         this will download the completed jobs...
+        to local files, or into sink (see retrieve_bulk_job)
         '''
-        self._load_pickle_data()
         if table is None:
             table = 'leads'
 
         status = 'Completed'
         
-        response = self.execute('get_bulk_jobs', table=table, status=status)
+        response = self.execute('get_all_bulk_jobs', table=table, status=status)
         results = []
         for result in response:
             export_id = result['exportId']
             format = result['format'].lower()
             if result['status'] == 'Completed':
-                if export_id not in self.data:
-                    self.data[export_id] = {}
-                    self.data[export_id]['status'] = 'Completed'
-                    self.data[export_id]['calls'] = []
-
                 file_name = '{}.{}'.format(export_id, format)
-                    
-                if 'filename' not in self.data[export_id] and not os.path.exists(file_name):
+                saved = self.ledger.get_export(export_id)
+
+                if (saved is None or not saved.get('filename')) and (sink is not None or not os.path.exists(file_name)):
                     print('fetching {} -> {}'.format(export_id, format))
-                    r = self.retrieve_bulk_job(export_id=export_id, format=format, table=table)
+                    r = self.retrieve_bulk_job(export_id=export_id, format=format, table=table,
+                                               file_size=result.get('fileSize'), sink=sink)
                     for key in r:
                         result[key] = r[key]
-                        self.data[export_id][key] = r[key]
+                    result['table'] = table
+                    self.ledger.update_export(export_id, result)
+                    self.ledger.add_call(export_id, r)
                     results.append(result)
-                    self.data[export_id]['calls'].append(r)
 
-        self._save_pickle_data()      
+        return results
 
+    def join_batch(self, table=None, path=None, chunk_rows=100000):
+        '''
+        joins the downloaded files of the column groups of each window (see max_fields in run_batch) on id into
+        one file named after the window's label, in directory path; windows are joined once, when all their
+        groups are downloaded. Only chunk_rows rows per file are held in memory.
+        '''
+        if table is None:
+            table = 'leads'
+        windows = {}
+        for export in self.ledger.exports(table=table):
+            if export.get('groups'):
+                # a group exported again replaces the earlier export
+                windows.setdefault(export['name'], {})[export['group']] = export
+        results = []
+        for name, groups in windows.items():
+            exports = [groups[number] for number in sorted(groups)]
+            if len(exports) < exports[0]['groups'] or not all(export.get('filename') for export in exports):
+                continue
+            if all(export.get('joined') for export in exports):
+                continue
+            file_name = label_file_name(name, path)
+            print('joining {} -> {}'.format(name, file_name))
+            rows = join_csv([export['filename'] for export in exports], file_name, chunk_rows=chunk_rows)
+            for export in exports:
+                self.ledger.update_export(export['exportId'], {'joined': file_name})
+            results.append({'name': name, 'filename': file_name, 'numberOfRecords': rows,
+                            'exportIds': [export['exportId'] for export in exports]})
         return results
 
     def cancel_batch(self, table= None, batch_label = None, step_label = None):
-        self._load_pickle_data()
         if table is None:
             table = 'leads'
 
@@ -388,7 +469,7 @@ class MarketoClientBatch(MarketoClient):
             pass
 
         status = 'Created,Queued,Processing'
-        response = self.execute('get_bulk_jobs', table=table, status=status)
+        response = self.execute('get_all_bulk_jobs', table=table, status=status)
         results = []
         for result in response:
             export_id = result['exportId']
@@ -420,37 +501,55 @@ class MarketoClientBatch(MarketoClient):
         if format is None:
             format='CSV'
         body['format'] = format
-        if table.lower == 'leads' and fields is None: raise ValueError("Required argument 'fields' is none.")
+        if table.lower() in ['leads', 'program/members'] and fields is None:
+            raise ValueError("Required argument 'fields' is none.")
         result = self._api_call('post', self.host + "/bulk/v1/" + table + "/export/create.json", args, data=body)
         if result is None: raise Exception("Empty Response")
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
     def get_bulk_jobs(self, table=None, status=None, next_page=None, batch_size=None):
+        '''
+        one page of the export jobs of table (from the last 7 days), optionally only those with status (a comma
+        separated list); see get_bulk_jobs_yield for all pages
+        '''
+        return self._get_bulk_jobs_page(table, status, next_page, batch_size)['result']
+
+    def _get_bulk_jobs_page(self, table=None, status=None, next_page=None, batch_size=None):
         self.authenticate()
-        print('=: ' + self.token)
         args = {
             'access_token': self.token
         }
-        q_mark = '?'
-
         if table is None:
             table = 'leads'
         if status is not None:
-            status='{}status={}'.format(q_mark, status)
-            q_mark = '&'
+            args['status'] = status
         if next_page is not None:
-            next_page='{}nextPageToken={}'.format(q_mark,next_page)
-            q_mark = '&'
+            args['nextPageToken'] = next_page
         if batch_size is not None:
-            batch_size='{}batchSize={}'.format(q_mark, batch_size)
-            q_mark = '&'
-        url = '{}/bulk/v1/{}/export.json{}{}{}'.format(self.host, table, xstr(status), xstr(next_page), xstr(batch_size))
-
-        result = self._api_call('get', url, args)
+            args['batchSize'] = batch_size
+        result = self._api_call('get', self.host + "/bulk/v1/" + table + "/export.json", args)
         if result is None: raise Exception("Empty Response")
         if not result['success'] : raise MarketoException(result['errors'][0])
-        return result['result']
+        result.setdefault('result', [])
+        return result
+
+    def get_bulk_jobs_yield(self, table=None, status=None, batch_size=None):
+        '''
+        yields the export jobs of table page by page (lists of jobs), following nextPageToken to the last page
+        '''
+        next_page = None
+        while True:
+            result = self._get_bulk_jobs_page(table, status, next_page, batch_size)
+            if result['result']:
+                yield result['result']
+            if not result['result'] or not result.get('nextPageToken') or result['nextPageToken'] == next_page:
+                break
+            next_page = result['nextPageToken']
+
+    def get_all_bulk_jobs(self, table=None, status=None, batch_size=None):
+        ''' the export jobs of table from every page, as one list '''
+        return [job for page in self.get_bulk_jobs_yield(table, status, batch_size) for job in page]
 
     def start_bulk_job(self, export_id, table=None):
         self.authenticate()
@@ -478,18 +577,41 @@ class MarketoClientBatch(MarketoClient):
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
-    def retrieve_bulk_job(self, export_id, format=None, table=None):
+    def retrieve_bulk_job(self, export_id, format=None, table=None, file_size=None, segments=1, chunk_size=None,
+                          path=None, sink=None):
+        '''
+        downloads the export file to <export_id>.<format> (in directory path, if given). file_size is the job's fileSize, used to verify the
+        download and to split it into segments downloaded in parallel; when None it's read from the job status.
+        An interrupted download is resumed on the next call.
+        With sink (see helper/sinks.py: FileSink, GzipSink, ObjectStoreSink) the bytes are streamed into
+        sink.open('<export_id>.<format>') as they arrive instead, and filename is the location the sink returns;
+        path and segments don't apply, and a failed download starts over.
+        '''
         self.authenticate()
         if export_id is None: raise ValueError("Required argument 'exportId' is none.")
         if table is None:
             table = 'leads'
         if format is None:
             format = 'csv'
+        if file_size is None:
+            file_size = self.status_bulk_job(export_id, table)[0].get('fileSize')
 
-        url = self.host + "/bulk/v1/" + table + "/export/" + export_id + "/file.json?access_token=" + self.token
+        # the token goes as a parameter, so the url returned (and kept in the ledger) doesn't hold it
+        url = self.host + "/bulk/v1/" + table + "/export/" + export_id + "/file.json"
+        args = {
+            'access_token': self.token
+        }
         file_name = '{}.{}'.format(export_id, format)
+        if sink is not None:
+            location, size = download_to_sink(self.session, url, sink, file_name, expected_size=file_size,
+                                              chunk_size=chunk_size, rate_limiter=self.rate_limiter,
+                                              retry_policy=self.retry_policy, params=args)
+            return {'filename': location, 'url': url, 'size': size, 'success': True}
+        if path is not None:
+            file_name = os.path.join(path, file_name)
         result = {'filename': file_name, 'url': url, 'size': 0}
-        result['size'] = self._download_file(url, file_name)
+        result['size'] = self._download_file(url, file_name, file_size=file_size, chunk_size=chunk_size,
+                                             segments=segments, params=args)
         result['success'] = True
         return result
 
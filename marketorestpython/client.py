@@ -1,6 +1,14 @@
+import itertools
 import time
+import threading
 from datetime import datetime
-from marketorestpython.helper.http_lib import HttpLib
+from marketorestpython.helper.http_lib import HttpLib, create_session
+from marketorestpython.helper.rate_limiter import shared_rate_limiter
+from marketorestpython.helper.quota import quota_day
+from marketorestpython.helper.retry import RetryPolicy
+from marketorestpython.helper.prefetch import prefetch_pages
+from marketorestpython.helper.crawler import crawl_offsets
+from marketorestpython.helper.chunked import run_chunked, run_bisecting, split_values
 from marketorestpython.helper.exceptions import MarketoException
 
 def has_empty_warning(result):
@@ -19,26 +27,64 @@ class MarketoClient:
     scope = None
     last_request_id = None # intended to save last request id, but not used right now
 
-    def __init__(self, munchkin_id, client_id, client_secret, api_limit=None):
+    def __init__(self, munchkin_id, client_id, client_secret, api_limit=None, session=None,
+                 pool_connections=1, pool_maxsize=10, rate_limiter=None, quota_backend=None, retry_policy=None):
         assert(munchkin_id is not None)
         assert(client_id is not None)
         assert(client_secret is not None)
         self.valid_until = None
+        self.munchkin_id = munchkin_id
         self.host = "https://" + munchkin_id + ".mktorest.com"
         self.client_id = client_id
         self.client_secret = client_secret
         self.API_CALLS_MADE = 0
         self.API_LIMIT = api_limit
+        self._auth_lock = threading.Lock()
+        # long-lived connection pool shared by every call made through this client
+        if session is None:
+            session = create_session(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session = session
+        # by default all clients for the same instance in this process share one limiter; with a quota backend
+        # (SQLite, Redis) the call window and the daily count are shared with other processes as well
+        self.quota_backend = quota_backend
+        if rate_limiter is None:
+            rate_limiter = shared_rate_limiter(munchkin_id, quota_backend)
+        self.rate_limiter = rate_limiter
+        # backoff, jitter and per error code retry rules for every call, see helper/retry.py
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+
+    def close(self):
+        self.session.close()
 
     def _api_call(self, method, endpoint, *args, **kwargs):
-        request = HttpLib()
+        request = HttpLib(self.session, self.rate_limiter, self.retry_policy)
         result = getattr(request, method)(endpoint, *args, **kwargs)
         self.API_CALLS_MADE += 1
-        if self.API_LIMIT and self.API_CALLS_MADE >= self.API_LIMIT:
+        calls_made = self.API_CALLS_MADE
+        if self.quota_backend is not None:
+            calls_made = self.quota_backend.incr_daily(self.munchkin_id, quota_day())
+        if self.API_LIMIT and calls_made >= self.API_LIMIT:
             raise Exception({'message': '# of API Calls exceeded the limit as specified in the Python script: '
                                         + str(self.API_LIMIT), 'code': '416'})
         return result
 
+    def _get_offset_pages(self, endpoint, args, maxReturn, concurrency=None):
+        '''
+        pages through an asset endpoint with offset/maxReturn; with concurrency > 1 that many offsets are
+        requested at the same time (results keep the serial order, paging stops at the first short page)
+        '''
+        def fetch_page(offset):
+            page_args = dict(args)
+            self.authenticate()
+            page_args['access_token'] = self.token  # for long-running processes, this updates the access token
+            if offset:
+                page_args['offset'] = offset
+            result = self._api_call('get', endpoint, page_args)
+            if result is None: raise Exception("Empty Response")
+            if not result['success']: raise MarketoException(result['errors'][0])
+            return result.get('result')
+        return crawl_offsets(fetch_page, maxReturn, concurrency or 1)
+
     def execute(self, method, *args, **kargs):
         result = None
 
@@ -51,12 +97,14 @@ class MarketoClient:
                 method_map={
                     'get_lead_by_id': self.get_lead_by_id,
                     'get_multiple_leads_by_filter_type': self.get_multiple_leads_by_filter_type,
+                    'get_leads_by_filter_values': self.get_leads_by_filter_values,
                     'get_multiple_leads_by_list_id': self.get_multiple_leads_by_list_id,
                     'get_multiple_leads_by_list_id_yield': self.get_multiple_leads_by_list_id_yield,
                     'get_multiple_leads_by_program_id': self.get_multiple_leads_by_program_id,
                     'get_multiple_leads_by_program_id_yield': self.get_multiple_leads_by_program_id_yield,
                     'change_lead_program_status': self.change_lead_program_status,
                     'create_update_leads': self.create_update_leads,
+                    'create_update_leads_bulk': self.create_update_leads_bulk,
                     'associate_lead': self.associate_lead,
                     'push_lead': self.push_lead,
                     'merge_lead': self.merge_lead,
@@ -66,6 +114,11 @@ class MarketoClient:
                     'add_leads_to_list': self.add_leads_to_list,
                     'remove_leads_from_list': self.remove_leads_from_list,
                     'member_of_list': self.member_of_list,
+                    'add_leads_to_list_bulk': self.add_leads_to_list_bulk,
+                    'remove_leads_from_list_bulk': self.remove_leads_from_list_bulk,
+                    'member_of_list_bulk': self.member_of_list_bulk,
+                    'get_list_member_ids': self.get_list_member_ids,
+                    'sync_list': self.sync_list,
                     'get_campaign_by_id': self.get_campaign_by_id,
                     'get_multiple_campaigns': self.get_multiple_campaigns,
                     'schedule_campaign': self.schedule_campaign,
@@ -75,6 +128,7 @@ class MarketoClient:
                     'get_import_failure_file': self.get_import_failure_file,
                     'get_import_warning_file': self.get_import_warning_file,
                     'describe': self.describe,
+                    'describe_program_members': self.describe_program_members,
                     'get_activity_types': self.get_activity_types,
                     'get_paging_token': self.get_paging_token,
                     'get_lead_activities': self.get_lead_activities,
@@ -87,7 +141,9 @@ class MarketoClient:
                     'get_daily_errors': self.get_daily_errors,
                     'get_last_7_days_errors': self.get_last_7_days_errors,
                     'delete_lead': self.delete_lead,
+                    'delete_lead_bulk': self.delete_lead_bulk,
                     'get_deleted_leads': self.get_deleted_leads,
+                    'get_deleted_leads_yield': self.get_deleted_leads_yield,
                     'update_leads_partition': self.update_leads_partition,
                     'create_folder': self.create_folder,
                     'get_folder_by_id': self.get_folder_by_id,
@@ -253,21 +309,26 @@ class MarketoClient:
         if self.valid_until is not None and \
                                 self.valid_until - time.time() >= 60:
             return
-        args = {
-            'grant_type': 'client_credentials',
-            'client_id': self.client_id,
-            'client_secret': self.client_secret
-        }
-        data = self._api_call('get', self.host + "/identity/oauth/token", args)
-        if data is None: raise Exception("Empty Response")
-        if 'error' in data:
-            if data['error'] in ['unauthorized', 'invalid_client']:
-                raise Exception(data['error_description'])
-        self.token = data['access_token']
-        self.token_type = data['token_type']
-        self.expires_in = data['expires_in']
-        self.valid_until = time.time() + data['expires_in']
-        self.scope = data['scope']
+        with self._auth_lock:
+            # another thread may have refreshed the token while this one was waiting for the lock
+            if self.valid_until is not None and \
+                                    self.valid_until - time.time() >= 60:
+                return
+            args = {
+                'grant_type': 'client_credentials',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret
+            }
+            data = self._api_call('get', self.host + "/identity/oauth/token", args)
+            if data is None: raise Exception("Empty Response")
+            if 'error' in data:
+                if data['error'] in ['unauthorized', 'invalid_client']:
+                    raise Exception(data['error_description'])
+            self.token = data['access_token']
+            self.token_type = data['token_type']
+            self.expires_in = data['expires_in']
+            self.valid_until = time.time() + data['expires_in']
+            self.scope = data['scope']
 
     # --------- LEADS ---------
 
@@ -311,6 +372,44 @@ class MarketoClient:
             args['nextPageToken'] = result['nextPageToken']
         return result_list
 
+    def get_leads_by_filter_values(self, filterType, filterValues, fields=None, batchSize=None, concurrency=None,
+                                   maxValues=100, maxLength=7000):
+        '''
+        get_multiple_leads_by_filter_type for any number of filterValues: the (deduplicated) values are split into
+        queries of at most maxValues values and maxLength characters, run concurrency at a time (default: the rate
+        limiter's concurrent call limit); a query getting error 1003 (too many results) is split in half and run
+        again. filterType must be a lead field, it is added to fields to match the leads back to the values.
+        Returns {value: [leads]} for every value, [] for values no lead matched
+        '''
+        if filterType is None: raise ValueError("Invalid argument: required argument filterType is none.")
+        if filterValues is None: raise ValueError("Invalid argument: required argument filterValues is none.")
+        filterValues = filterValues.split() if type(filterValues) is str else filterValues
+        if fields is not None:
+            fields = fields.split(',') if type(fields) is str else list(fields)
+            if filterType not in fields:
+                fields.append(filterType)
+            fields = ','.join(fields)
+        if concurrency is None:
+            concurrency = getattr(self.rate_limiter, 'max_concurrent', 10)
+        # Marketo matches values case-insensitively (emails), so values are compared lowercased
+        values = {}
+        for value in filterValues:
+            values.setdefault(str(value).lower(), value)
+        mapping = {value: [] for value in values.values()}
+        seen = set()
+
+        def fetch(group):
+            return self.get_multiple_leads_by_filter_type(filterType, [str(value) for value in group], fields,
+                                                          batchSize)
+        for group, leads in run_bisecting(fetch, split_values(list(values.values()), maxValues, maxLength),
+                                          concurrency):
+            for lead in leads:
+                value = values.get(str(lead.get(filterType)).lower())
+                if value is not None and (value, lead.get('id')) not in seen:
+                    seen.add((value, lead.get('id')))
+                    mapping[value].append(lead)
+        return mapping
+
     def get_multiple_leads_by_list_id(self, listId, fields=None, batchSize=None):
         self.authenticate()
         if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
@@ -336,7 +435,10 @@ class MarketoClient:
             args['nextPageToken'] = result['nextPageToken']
         return result_list
 
-    def get_multiple_leads_by_list_id_yield(self, listId, fields=None, batchSize=None):
+    def get_multiple_leads_by_list_id_yield(self, listId, fields=None, batchSize=None, prefetch=None):
+        if prefetch:
+            yield from prefetch_pages(self.get_multiple_leads_by_list_id_yield(listId, fields, batchSize), prefetch)
+            return
         self.authenticate()
         if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
         args = {
@@ -386,7 +488,11 @@ class MarketoClient:
             args['nextPageToken'] = result['nextPageToken']
         return result_list
 
-    def get_multiple_leads_by_program_id_yield(self, programId, fields=None, batchSize=None):
+    def get_multiple_leads_by_program_id_yield(self, programId, fields=None, batchSize=None, prefetch=None):
+        if prefetch:
+            yield from prefetch_pages(self.get_multiple_leads_by_program_id_yield(programId, fields, batchSize),
+                                      prefetch)
+            return
         self.authenticate()
         args = {
             'access_token': self.token,
@@ -453,6 +559,54 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
+    def create_update_leads_bulk(self, leads, action=None, lookupField=None, partitionName=None, batchSize=None,
+                                 concurrency=None, maxRetries=2, fingerprints=None):
+        '''
+        create_update_leads for any number of leads (any iterable): sent in chunks of batchSize (at most 300, the
+        API limit), concurrency chunks at a time (default: the rate limiter's concurrent call limit). Leads skipped
+        with 1022 (object in use) are sent again, up to maxRetries times, see helper/chunked.py; a call that failed
+        as a whole is not, as it may have been applied (a createOnly lead would then come back skipped).
+        With fingerprints (a FingerprintStore), only the lookupField, the store's key and the changed fields of
+        the leads are sent, and leads with no changes are not sent at all; the store is updated with the leads
+        written.
+        Returns one result per lead, in input order: {'id': .., 'status': 'created'/'updated'/'skipped'/'failed',
+        'reasons': [..]}, or {'status': 'unchanged'} for the leads not sent
+        '''
+        if leads is None: raise ValueError("Invalid argument: required argument leads is none.")
+        if batchSize is None or batchSize > 300:
+            batchSize = 300
+        if concurrency is None:
+            concurrency = getattr(self.rate_limiter, 'max_concurrent', 10)
+
+        def send(chunk):
+            results = self.create_update_leads(chunk, action=action, lookupField=lookupField,
+                                               partitionName=partitionName)
+            if fingerprints is not None:
+                fingerprints.record(chunk, results)
+            return results
+        if fingerprints is None:
+            return run_chunked(send, leads, chunk_size=batchSize, max_workers=concurrency, max_retries=maxRetries,
+                               retry_codes=('1022',), retry_calls=False)
+
+        output = []  # one result per lead: {'status': 'unchanged'}, or None until the lead's result comes back
+        positions = []
+
+        def changed_leads():
+            source = iter(leads)
+            for group in iter(lambda: list(itertools.islice(source, 1000)), []):
+                for change in fingerprints.changes(group, keep=[lookupField or 'email']):
+                    if change is None:
+                        output.append({'status': 'unchanged'})
+                    else:
+                        positions.append(len(output))
+                        output.append(None)
+                        yield change
+        results = run_chunked(send, changed_leads(), chunk_size=batchSize, max_workers=concurrency,
+                              max_retries=maxRetries, retry_codes=('1022',), retry_calls=False)
+        for position, result in zip(positions, results):
+            output[position] = result
+        return output
+
     def associate_lead(self, id, cookie):
         self.authenticate()
         if id is None: raise ValueError("Invalid argument: required argument id is none.")
@@ -611,6 +765,64 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
+    def _run_id_chunks(self, func, id, batchSize=None, concurrency=None, maxRetries=2):
+        ''' func(ids) for any number of ids, in concurrent chunks of up to 300 (see run_chunked); one result per id '''
+        ids = list(id)
+        if batchSize is None or batchSize > 300:
+            batchSize = 300
+        if concurrency is None:
+            concurrency = getattr(self.rate_limiter, 'max_concurrent', 10)
+        results = run_chunked(func, ids, chunk_size=batchSize, max_workers=concurrency, max_retries=maxRetries)
+        for lead_id, result in zip(ids, results):
+            result.setdefault('id', lead_id)
+        return results
+
+    def add_leads_to_list_bulk(self, listId, id, batchSize=None, concurrency=None, maxRetries=2):
+        ''' add_leads_to_list for any number of ids, in concurrent chunks; returns one result per id, in order '''
+        if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
+        if id is None: raise ValueError("Invalid argument: required argument id is none.")
+        return self._run_id_chunks(lambda ids: self.add_leads_to_list(listId, ids), id, batchSize, concurrency,
+                                   maxRetries)
+
+    def remove_leads_from_list_bulk(self, listId, id, batchSize=None, concurrency=None, maxRetries=2):
+        ''' remove_leads_from_list for any number of ids, in concurrent chunks; returns one result per id '''
+        if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
+        if id is None: raise ValueError("Invalid argument: required argument id is none.")
+        return self._run_id_chunks(lambda ids: self.remove_leads_from_list(listId, ids), id, batchSize,
+                                   concurrency, maxRetries)
+
+    def member_of_list_bulk(self, listId, id, batchSize=None, concurrency=None, maxRetries=2):
+        ''' member_of_list for any number of ids, in concurrent chunks; returns one result per id, in order '''
+        if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
+        if id is None: raise ValueError("Invalid argument: required argument id is none.")
+        return self._run_id_chunks(lambda ids: self.member_of_list(listId, ids), id, batchSize, concurrency,
+                                   maxRetries)
+
+    def get_list_member_ids(self, listId, batchSize=300, prefetch=None):
+        ''' the ids of all leads in a static list, as a set '''
+        members = set()
+        for page in self.get_multiple_leads_by_list_id_yield(listId, fields='id', batchSize=batchSize,
+                                                             prefetch=prefetch):
+            members.update(lead['id'] for lead in page)
+        return members
+
+    def sync_list(self, listId, id, remove=True, batchSize=None, concurrency=None, maxRetries=2):
+        '''
+        makes static list listId contain exactly the leads in id: reads the current members, then adds the
+        missing ids and (if remove) removes the members not in id, in concurrent chunks.
+        Returns {'added': [result per id], 'removed': [result per id], 'unchanged': number of ids already members}
+        '''
+        if listId is None: raise ValueError("Invalid argument: required argument listId is none.")
+        if id is None: raise ValueError("Invalid argument: required argument id is none.")
+        wanted = list(dict.fromkeys(int(lead_id) for lead_id in id))
+        members = self.get_list_member_ids(listId)
+        to_add = [lead_id for lead_id in wanted if lead_id not in members]
+        to_remove = sorted(members.difference(wanted)) if remove else []
+        added = self.add_leads_to_list_bulk(listId, to_add, batchSize, concurrency, maxRetries) if to_add else []
+        removed = self.remove_leads_from_list_bulk(listId, to_remove, batchSize, concurrency, maxRetries) \
+            if to_remove else []
+        return {'added': added, 'removed': removed, 'unchanged': len(wanted) - len(to_add)}
+
     # --------- CAMPAIGNS ---------
 
     def get_campaign_by_id(self, id):
@@ -770,6 +982,16 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
+    def describe_program_members(self):
+        self.authenticate()
+        args = {
+            'access_token' : self.token
+        }
+        result = self._api_call('get', self.host + "/rest/v1/programs/members/describe.json", args)
+        if result is None: raise Exception("Empty Response")
+        if not result['success'] : raise MarketoException(result['errors'][0])
+        return result['result']
+
     # --------- ACTIVITIES ---------
 
     def get_activity_types(self):
@@ -849,7 +1071,11 @@ class MarketoClient:
         return result_list
 
     def get_lead_activities_yield(self, activityTypeIds, nextPageToken=None, sinceDatetime=None, untilDatetime=None,
-                            batchSize=None, listId=None, leadIds=None):
+                            batchSize=None, listId=None, leadIds=None, prefetch=None):
+        if prefetch:
+            yield from prefetch_pages(self.get_lead_activities_yield(
+                activityTypeIds, nextPageToken, sinceDatetime, untilDatetime, batchSize, listId, leadIds), prefetch)
+            return
         self.authenticate()
         if activityTypeIds is None: raise ValueError("Invalid argument: required argument activityTypeIds is none.")
         if nextPageToken is None and sinceDatetime is None: raise ValueError(
@@ -923,7 +1149,11 @@ class MarketoClient:
         return result_list
 
     def get_lead_changes_yield(self, fields, nextPageToken=None, sinceDatetime=None, untilDatetime=None, batchSize=None,
-                               listId=None):
+                               listId=None, prefetch=None):
+        if prefetch:
+            yield from prefetch_pages(self.get_lead_changes_yield(
+                fields, nextPageToken, sinceDatetime, untilDatetime, batchSize, listId), prefetch)
+            return
         self.authenticate()
         if fields is None: raise ValueError("Invalid argument: required argument fields is none.")
         if nextPageToken is None and sinceDatetime is None: raise ValueError("Either nextPageToken or sinceDatetime needs to be specified.")
@@ -952,6 +1182,8 @@ class MarketoClient:
                         yield new_result
                     if len(new_result) < len(result['result']):
                         break
+                else:
+                    yield result['result']
             if result['moreResult'] is False:
                 break
             args['nextPageToken'] = result['nextPageToken']
@@ -1029,6 +1261,11 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
+    def delete_lead_bulk(self, id, batchSize=None, concurrency=None, maxRetries=2):
+        ''' delete_lead for any number of ids, in concurrent chunks; returns one result per id, in order '''
+        if id is None: raise ValueError("Invalid argument: required argument id is none.")
+        return self._run_id_chunks(self.delete_lead, id, batchSize, concurrency, maxRetries)
+
     def get_deleted_leads(self, nextPageToken=None, sinceDatetime=None, batchSize = None):
         self.authenticate()
         if nextPageToken is None and sinceDatetime is None: raise ValueError("Either nextPageToken or sinceDatetime needs to be specified.")
@@ -1054,6 +1291,32 @@ class MarketoClient:
             args['nextPageToken'] = result['nextPageToken']
         return result_list
 
+    def get_deleted_leads_yield(self, nextPageToken=None, sinceDatetime=None, batchSize=None, prefetch=None):
+        if prefetch:
+            yield from prefetch_pages(self.get_deleted_leads_yield(nextPageToken, sinceDatetime, batchSize), prefetch)
+            return
+        self.authenticate()
+        if nextPageToken is None and sinceDatetime is None: raise ValueError("Either nextPageToken or sinceDatetime needs to be specified.")
+        args = {
+            'access_token' : self.token
+        }
+        if batchSize is not None:
+            args['batchSize'] = batchSize
+        if nextPageToken is None:
+            nextPageToken = self.get_paging_token(sinceDatetime=sinceDatetime)
+        args['nextPageToken'] = nextPageToken
+        while True:
+            self.authenticate()
+            args['access_token'] = self.token  # for long-running processes, this updates the access token
+            result = self._api_call('get', self.host + "/rest/v1/activities/deletedleads.json", args)
+            if result is None: raise Exception("Empty Response")
+            if not result['success']: raise MarketoException(result['errors'][0])
+            if 'result' in result:
+                yield result['result']
+            if result['moreResult'] is False:
+                break
+            args['nextPageToken'] = result['nextPageToken']
+
     def update_leads_partition(self, input):
         self.authenticate()
         if input is None: raise ValueError("Invalid argument: required argument input is none.")
@@ -1119,7 +1382,7 @@ class MarketoClient:
         if not result['success']: raise MarketoException(result['errors'][0])
         return result['result']
 
-    def get_folder_contents(self, id, type, maxReturn=None):
+    def get_folder_contents(self, id, type, maxReturn=None, concurrency=None):
         self.authenticate()
         if id is None: raise ValueError("Invalid argument: required argument id is none.")
         if type is None: raise ValueError("Invalid argument: required argument type is none.")
@@ -1131,24 +1394,8 @@ class MarketoClient:
             args['maxReturn'] = maxReturn
         else:
             maxReturn = 20
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/folder/" + str(id) + "/content.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success']: raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/folder/" + str(id) + "/content.json", args, maxReturn,
+                                      concurrency)
 
     def update_folder(self, id, description=None, name=None, isArchive=None):
         self.authenticate()
@@ -1180,7 +1427,7 @@ class MarketoClient:
         if not result['success']: raise MarketoException(result['errors'][0])
         return result['result']
 
-    def browse_folders(self, root, maxDepth=None, maxReturn=None, workSpace=None):
+    def browse_folders(self, root, maxDepth=None, maxReturn=None, workSpace=None, concurrency=None):
         self.authenticate()
         if root is None: raise ValueError("Invalid argument: required argument root is none.")
         args = {
@@ -1195,24 +1442,7 @@ class MarketoClient:
             maxReturn = 20
         if workSpace is not None:
             args['workSpace'] = workSpace
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/folders.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success'] : raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/folders.json", args, maxReturn, concurrency)
 
     # --------- TOKENS ---------
 
@@ -1530,7 +1760,7 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
-    def get_emails(self, maxReturn=None, status=None, folderId=None, folderType=None):
+    def get_emails(self, maxReturn=None, status=None, folderId=None, folderType=None, concurrency=None):
         self.authenticate()
         args = {
             'access_token': self.token
@@ -1543,24 +1773,7 @@ class MarketoClient:
             args['status'] = status
         if folderId is not None:
             args['folder'] = "{'id': " + str(folderId) + ", 'type': " + folderType + "}"
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/emails.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success'] : raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/emails.json", args, maxReturn, concurrency)
 
     def get_email_content(self, id, status=None):
         self.authenticate()
@@ -1845,7 +2058,7 @@ class MarketoClient:
         if not result['success']: raise MarketoException(result['errors'][0])
         return result['result']
 
-    def get_landing_pages(self, maxReturn=None, status=None, folderId=None, folderType=None):
+    def get_landing_pages(self, maxReturn=None, status=None, folderId=None, folderType=None, concurrency=None):
         self.authenticate()
         args = {
             'access_token': self.token
@@ -1858,25 +2071,7 @@ class MarketoClient:
             args['status'] = status
         if folderId is not None:
             args['folder'] = "{'id': " + str(folderId) + ", 'type': " + folderType + "}"
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/landingPages.json", args)
-            if result is None: raise Exception("Empty Response")
-            #if not result['success']: raise MarketoException(result['errors'][0] + ". Request ID: " + result['requestId'])
-            if not result['success']: raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/landingPages.json", args, maxReturn, concurrency)
 
     def get_landing_page_content(self, id, status=None):
         self.authenticate()
@@ -2245,7 +2440,7 @@ class MarketoClient:
         if not result['success']: raise MarketoException(result['errors'][0])
         return result['result']
 
-    def get_forms(self, maxReturn=None, status=None, folderId=None, folderType=None):
+    def get_forms(self, maxReturn=None, status=None, folderId=None, folderType=None, concurrency=None):
         self.authenticate()
         args = {
             'access_token': self.token
@@ -2258,24 +2453,7 @@ class MarketoClient:
             args['status'] = status
         if folderId is not None:
             args['folder'] = "{'id': " + str(folderId) + ", 'type': " + folderType + "}"
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/forms.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success']: raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/forms.json", args, maxReturn, concurrency)
 
     def get_form_fields(self, id, status=None):
         self.authenticate()
@@ -2501,7 +2679,7 @@ class MarketoClient:
         if not result['success'] : raise MarketoException(result['errors'][0])
         return result['result']
 
-    def list_files(self, folder=None, maxReturn=None):
+    def list_files(self, folder=None, maxReturn=None, concurrency=None):
         self.authenticate()
         args = {
             'access_token' : self.token
@@ -2512,24 +2690,7 @@ class MarketoClient:
             args['maxReturn'] = maxReturn
         else:
             maxReturn = 20
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/files.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success']: raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/files.json", args, maxReturn, concurrency)
 
     def update_file_content(self, id, file):
         self.authenticate()
@@ -3055,7 +3216,7 @@ class MarketoClient:
         if not result['success']: raise MarketoException(result['errors'][0])
         return result['result']
 
-    def browse_programs(self, status=None, maxReturn=None):
+    def browse_programs(self, status=None, maxReturn=None, concurrency=None):
         self.authenticate()
         args = {
             'access_token' : self.token
@@ -3066,24 +3227,7 @@ class MarketoClient:
             args['maxReturn'] = maxReturn
         else:
             maxReturn = 20
-        result_list = []
-        offset = 0
-        while True:
-            self.authenticate()
-            args['access_token'] = self.token  # for long-running processes, this updates the access token
-            result = self._api_call('get', self.host + "/rest/asset/v1/programs.json", args)
-            if result is None: raise Exception("Empty Response")
-            if not result['success'] : raise MarketoException(result['errors'][0])
-            if 'result' in result:
-                if len(result['result']) < maxReturn:
-                    result_list.extend(result['result'])
-                    break
-            else:
-                break
-            result_list.extend(result['result'])
-            offset += maxReturn
-            args['offset'] = offset
-        return result_list
+        return self._get_offset_pages(self.host + "/rest/asset/v1/programs.json", args, maxReturn, concurrency)
 
     def clone_program(self, id, name, folderId, folderType, description=None):
         self.authenticate()
@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, timezone
+from queue import Queue, Empty, Full
+
+from marketorestpython.helper.exceptions import MarketoException
+
+
+def _parse_datetime(value):
+    '''
+    accepts a datetime, a date or a string in YYYY-MM-DDTHH:MM:SS(+HH:MM or Z) or YYYY-MM-DD format; returns a
+    naive UTC datetime (naive values are taken as UTC, aware ones are converted)
+    '''
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    for fmt in ('%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return _parse_datetime(datetime.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError('incorrect datetime format {}, use YYYY-MM-DDTHH:MM:SS[+HH:MM] or YYYY-MM-DD'.format(value))
+
+
+class ShardedActivityExtractor:
+    '''
+    Pulls lead activities for [sinceDatetime, untilDatetime] as several time shards at once instead of walking a
+    single paging token. Each shard gets its own paging token (get_paging_token) and stops at its end; activities
+    past a shard's end are trimmed the same way get_lead_activities trims untilDatetime, so shards don't overlap.
+
+    shards or shard_days set how the window is split; max_workers shards are pulled at the same time (default:
+    the client's concurrent call limit); each shard buffers at most buffer_pages pages ahead of the consumer.
+    With checkpoint (a file name) the paging token of every shard is saved after each page handed out, and a
+    new extractor with the same window and checkpoint resumes where the previous one stopped.
+    '''
+    def __init__(self, client, activityTypeIds, sinceDatetime, untilDatetime, shards=None, shard_days=None,
+                 max_workers=None, batchSize=None, listId=None, leadIds=None, checkpoint=None, buffer_pages=2):
+        if activityTypeIds is None: raise ValueError("Invalid argument: required argument activityTypeIds is none.")
+        if sinceDatetime is None or untilDatetime is None:
+            raise ValueError("Both sinceDatetime and untilDatetime need to be specified.")
+        self.client = client
+        self.activityTypeIds = activityTypeIds.split() if type(activityTypeIds) is str else activityTypeIds
+        self.since = _parse_datetime(sinceDatetime)
+        self.until = _parse_datetime(untilDatetime)
+        if self.until <= self.since: raise ValueError("untilDatetime needs to be after sinceDatetime.")
+        self.batchSize = batchSize
+        self.listId = listId
+        self.leadIds = leadIds
+        self.max_workers = max_workers or client.rate_limiter.max_concurrent
+        self.buffer_pages = buffer_pages
+        self.checkpoint = checkpoint
+        self.shards = self._make_shards(shards, shard_days)
+        self._state = self._load_checkpoint()
+        self._state_lock = threading.Lock()
+
+    def _make_shards(self, shards, shard_days):
+        if shard_days is not None:
+            step = timedelta(days=shard_days)
+        else:
+            # whole seconds, the resolution of activityDate and sinceDatetime
+            seconds = (self.until - self.since).total_seconds() / (shards or self.max_workers)
+            step = timedelta(seconds=math.ceil(seconds))
+        edges = []
+        start = self.since
+        while start < self.until:
+            end = min(start + step, self.until)
+            edges.append((start, end))
+            start = end
+        return edges
+
+    @staticmethod
+    def shard_key(shard):
+        return '{}/{}'.format(shard[0].strftime('%Y-%m-%dT%H:%M:%S'), shard[1].strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def _load_checkpoint(self):
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, 'r') as handle:
+                return json.load(handle)
+        return {}
+
+    def _save_checkpoint(self, shard, nextPageToken, done):
+        with self._state_lock:
+            self._state[self.shard_key(shard)] = {'nextPageToken': nextPageToken, 'done': done}
+            if self.checkpoint is None:
+                return
+            tmp_name = self.checkpoint + '.tmp'
+            with open(tmp_name, 'w') as handle:
+                json.dump(self._state, handle)
+            os.replace(tmp_name, self.checkpoint)
+
+    def _trim(self, result, shard):
+        ''' keeps activities inside [shard start, shard end); the last shard includes untilDatetime itself '''
+        last = shard[1] == self.until
+        kept = []
+        for record in result:
+            activity_date = datetime.strptime(record['activityDate'], '%Y-%m-%dT%H:%M:%SZ')
+            if activity_date < shard[0]:
+                continue
+            if activity_date < shard[1] or (last and activity_date == shard[1]):
+                kept.append(record)
+        return kept
+
+    def _pages(self, shard):
+        ''' yields (page, nextPageToken, done) for one shard, starting from its checkpoint '''
+        client = self.client
+        saved = self._state.get(self.shard_key(shard), {})
+        if saved.get('done'):
+            return
+        nextPageToken = saved.get('nextPageToken')
+        if nextPageToken is None:
+            nextPageToken = client.get_paging_token(sinceDatetime=shard[0].strftime('%Y-%m-%dT%H:%M:%S') + 'Z')
+        args = {
+            'activityTypeIds': ",".join(str(typeId) for typeId in self.activityTypeIds),
+        }
+        if self.listId is not None:
+            args['listId'] = self.listId
+        if self.leadIds is not None:
+            args['leadIds'] = self.leadIds
+        if self.batchSize is not None:
+            args['batchSize'] = self.batchSize
+        while True:
+            client.authenticate()
+            args['access_token'] = client.token
+            args['nextPageToken'] = nextPageToken
+            result = client._api_call('get', client.host + "/rest/v1/activities.json", args)
+            if result is None: raise Exception("Empty Response")
+            if not result['success']: raise MarketoException(result['errors'][0])
+            page = result.get('result', [])
+            kept = self._trim(page, shard)
+            # pages come in date order, once a page reaches past the shard end the shard is complete
+            past_end = bool(page) and datetime.strptime(page[-1]['activityDate'], '%Y-%m-%dT%H:%M:%SZ') >= shard[1]
+            done = result['moreResult'] is False or past_end
+            nextPageToken = result.get('nextPageToken', nextPageToken)
+            yield kept, nextPageToken, done
+            if done:
+                return
+
+    def run(self, ordered=True):
+        '''
+        generator over the activities. ordered=True yields pages in date order (shard by shard, later shards
+        are fetched in the background meanwhile); ordered=False yields (shard, page) tuples as soon as any
+        shard has a page, shard being the (since, until) pair
+        '''
+        stop = threading.Event()
+        shared = Queue(maxsize=self.buffer_pages * len(self.shards))
+        queues = [Queue(maxsize=self.buffer_pages) if ordered else shared for _ in self.shards]
+
+        def put(queue, item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def pull(index):
+            shard = self.shards[index]
+            try:
+                for page, nextPageToken, done in self._pages(shard):
+                    if stop.is_set() or not put(queues[index], ('page', index, (page, nextPageToken, done))):
+                        return
+            except Exception as e:
+                put(queues[index], ('error', index, e))
+                return
+            put(queues[index], ('done', index, None))
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        for index in range(len(self.shards)):
+            executor.submit(pull, index)
+        try:
+            remaining = len(self.shards)
+            current = 0
+            while remaining:
+                kind, index, value = queues[current if ordered else 0].get()
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    remaining -= 1
+                    current += 1
+                    continue
+                page, nextPageToken, done = value
+                shard = self.shards[index]
+                if page:
+                    yield page if ordered else (shard, page)
+                # the page has been handed out, so a restart can continue after it
+                self._save_checkpoint(shard, nextPageToken, done)
+        finally:
+            stop.set()
+            for queue in set(queues):
+                while True:
+                    try:
+                        queue.get_nowait()
+                    except Empty:
+                        break
+            executor.shutdown(wait=True)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from marketorestpython.reader import BulkExportReader
+
+
+# results of create_update_leads after which the values sent are what Marketo has
+WRITTEN_STATUSES = ('created', 'updated')
+
+
+class FingerprintStore:
+    '''
+    Remembers, in SQLite, a hash of every field value last written to (or exported from) each lead, by the value
+    of its key field (the lookupField of the upserts, compared case-insensitively). changes() drops the fields
+    whose value is unchanged from records about to be upserted, and the records with nothing left to change.
+
+    Values are compared as text, the way a bulk export has them (None and '' are the same, booleans are
+    true/false). Fingerprints older than max_age seconds are ignored, so leads changed in Marketo by something
+    else are written again eventually. record() stores the values of records that were written; seed() and
+    seed_from_export() those of a bulk export of the leads.
+    '''
+    def __init__(self, path, key='email', max_age=None, timeout=30, clock=time.time):
+        self.path = path
+        self.key = key
+        self.max_age = max_age
+        self.timeout = timeout
+        self.clock = clock
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS fingerprints (lead_key TEXT NOT NULL, field TEXT NOT NULL, '
+                     'hash TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (lead_key, field))')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def fingerprint(value):
+        if value is None:
+            text = ''
+        elif isinstance(value, bool):
+            text = 'true' if value else 'false'
+        elif isinstance(value, (dict, list)):
+            text = json.dumps(value, sort_keys=True)
+        else:
+            text = str(value)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _lead_key(self, record):
+        value = record.get(self.key)
+        return None if value is None or value == '' else str(value).lower()
+
+    def _lookup(self, keys):
+        ''' {lead key: {field: hash}} of the fingerprints of keys that aren't older than max_age '''
+        found = {}
+        keys = list(set(keys))
+        oldest = self.clock() - self.max_age if self.max_age is not None else None
+        conn = self._connection()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = 'SELECT lead_key, field, hash, updated_at FROM fingerprints WHERE lead_key IN ({})'.format(
+                ','.join('?' * len(chunk)))
+            for lead_key, field, hash, updated_at in conn.execute(query, chunk):
+                if oldest is None or updated_at >= oldest:
+                    found.setdefault(lead_key, {})[field] = hash
+        return found
+
+    def changes(self, records, keep=None):
+        '''
+        for each record, the record with only its key, the fields in keep (e.g. the lookupField of the upsert) and
+        the changed fields, or None if no field changed (records without a key value are kept whole)
+        '''
+        keep = set(keep or []) | {self.key}
+        stored = self._lookup([key for key in map(self._lead_key, records) if key is not None])
+        changed = []
+        for record in records:
+            lead_key = self._lead_key(record)
+            if lead_key is None:
+                changed.append(record)
+                continue
+            hashes = stored.get(lead_key, {})
+            fields = {field: value for field, value in record.items()
+                      if field not in keep and hashes.get(field) != self.fingerprint(value)}
+            if fields:
+                fields.update((field, record[field]) for field in keep if field in record)
+            changed.append(fields or None)
+        return changed
+
+    def record(self, records, results=None):
+        '''
+        stores the fingerprints of records; with results (one per record, as create_update_leads returns them),
+        only of the records that were created or updated. Returns the number of records stored
+        '''
+        now = self.clock()
+        rows = []
+        count = 0
+        for index, record in enumerate(records):
+            if results is not None and results[index].get('status') not in WRITTEN_STATUSES:
+                continue
+            lead_key = self._lead_key(record)
+            if lead_key is None:
+                continue
+            count += 1
+            rows.extend((lead_key, field, self.fingerprint(value), now) for field, value in record.items()
+                        if field != self.key)
+        if rows:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('INSERT OR REPLACE INTO fingerprints (lead_key, field, hash, updated_at) '
+                                 'VALUES (?, ?, ?, ?)', rows)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return count
+
+    def seed(self, records, fields=None, batch_size=10000):
+        ''' stores the fingerprints of records (dicts, e.g. read from a bulk export), only of fields if given '''
+        count = 0
+        batch = []
+        for record in records:
+            if fields is not None:
+                record = {field: record.get(field) for field in list(fields) + [self.key]}
+            batch.append(record)
+            if len(batch) >= batch_size:
+                count += self.record(batch)
+                batch = []
+        return count + self.record(batch)
+
+    def seed_from_export(self, file_name, fields=None):
+        ''' seed() from a bulk export file of the leads (a CSV with a column for the key field) '''
+        return self.seed(BulkExportReader(file_name), fields)
+
+    def forget(self, keys):
+        ''' drops the fingerprints of the leads with these key values, so they're written again '''
+        conn = self._connection()
+        keys = [str(key).lower() for key in keys]
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            conn.execute('DELETE FROM fingerprints WHERE lead_key IN ({})'.format(','.join('?' * len(chunk))),
+                         chunk)
@@ -0,0 +1,154 @@
+import itertools
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from marketorestpython.helper.exceptions import MarketoException
+
+
+# errors worth sending a record again for: 1022 object in use (another call is changing the same record), and
+# for a whole call 604 timeout, 608 API temporarily unavailable, 611 system error, 713 transient error
+RETRY_CODES = ('1022', '604', '608', '611', '713')
+
+
+def _reason_codes(result):
+    return [str(reason.get('code')) for reason in result.get('reasons') or []]
+
+
+def run_chunked(send, items, chunk_size=300, max_workers=10, max_retries=2, retry_codes=RETRY_CODES, backoff=1,
+                sleep=time.sleep, retry_calls=True):
+    '''
+    sends items of any number (any iterable, read as it goes) with send(chunk) in chunks of at most chunk_size,
+    max_workers chunks at a time. send returns one result dict per item of the chunk, in the same order (as the
+    Marketo calls taking an input list do: {'id': .., 'status': .., 'reasons': [..]}).
+
+    Items whose result has a reason code in retry_codes, and all items of a call that raised a MarketoException
+    with a code in retry_codes (or another exception), are collected and sent again in new chunks, up to
+    max_retries times, waiting backoff * 2 ** (retry - 1) seconds first. With retry_calls=False only the items
+    skipped with a retry code are sent again, never those of a call that raised (for writes that aren't
+    idempotent: the call may have been applied). Items that still fail get {'status': 'failed', 'reasons': [...]}.
+    Returns the results in the order of items.
+    '''
+    results = {}
+    source = iter(items)
+    count = 0
+    retry = deque()  # (attempt, [(index, item), ...]) waiting to be sent again
+    failed_again = {}  # attempt -> [(index, item), ...] collected into chunks for that attempt
+
+    def call(attempt, chunk):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1))
+        return send([item for _, item in chunk])
+
+    def requeue(attempt, entries):
+        pending = failed_again.setdefault(attempt, [])
+        pending.extend(entries)
+        while len(pending) >= chunk_size:
+            retry.append((attempt, pending[:chunk_size]))
+            del pending[:chunk_size]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        exhausted = False
+        while True:
+            while len(futures) < max_workers:
+                if retry:
+                    attempt, chunk = retry.popleft()
+                elif not exhausted:
+                    chunk = list(zip(itertools.count(count), itertools.islice(source, chunk_size)))
+                    count += len(chunk)
+                    attempt = 0
+                    if not chunk:
+                        exhausted = True
+                        continue
+                elif failed_again and not futures:
+                    # nothing else in flight: send the last, partial chunks of failed items
+                    attempt = min(failed_again)
+                    chunk = failed_again.pop(attempt)
+                    if not chunk:
+                        continue
+                else:
+                    break
+                futures[executor.submit(call, attempt, chunk)] = (attempt, chunk)
+            if not futures:
+                break
+
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt, chunk = futures.pop(future)
+                try:
+                    response = future.result()
+                except MarketoException as e:
+                    reason = {'code': e.code, 'message': e.message}
+                    if retry_calls and e.code in retry_codes and attempt < max_retries:
+                        requeue(attempt + 1, chunk)
+                    else:
+                        for index, _ in chunk:
+                            results[index] = {'status': 'failed', 'reasons': [reason]}
+                    continue
+                except Exception as e:
+                    if retry_calls and attempt < max_retries:
+                        requeue(attempt + 1, chunk)
+                    else:
+                        for index, _ in chunk:
+                            results[index] = {'status': 'failed', 'reasons': [{'code': None, 'message': str(e)}]}
+                    continue
+                if len(response) != len(chunk):
+                    raise Exception('Got {} results for {} records'.format(len(response), len(chunk)))
+                again = []
+                for (index, item), result in zip(chunk, response):
+                    if attempt < max_retries and any(code in retry_codes for code in _reason_codes(result)):
+                        again.append((index, item))
+                    else:
+                        results[index] = result
+                if again:
+                    requeue(attempt + 1, again)
+    return [results[index] for index in range(count)]
+
+
+def split_values(values, max_values=100, max_length=7000):
+    '''
+    groups values into lists of at most max_values, whose comma-joined string form is at most max_length
+    characters (a single longer value gets a group of its own)
+    '''
+    groups = []
+    group, length = [], 0
+    for value in values:
+        size = len(str(value)) + (1 if group else 0)
+        if group and (len(group) >= max_values or length + size > max_length):
+            groups.append(group)
+            group, length = [], 0
+            size = len(str(value))
+        group.append(value)
+        length += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def run_bisecting(fetch, groups, max_workers=10, split_codes=('1003',)):
+    '''
+    calls fetch(group) for each group, max_workers at a time. A group whose call raises a MarketoException with a
+    code in split_codes (1003: too many results match the filter) is split in half and both halves are fetched
+    instead; a single value that still fails raises. Returns [(group, result), ...] in completion order.
+    '''
+    results = []
+    pending = deque(group for group in groups if group)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while pending or futures:
+            while pending and len(futures) < max_workers:
+                group = pending.popleft()
+                futures[executor.submit(fetch, group)] = group
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                group = futures.pop(future)
+                try:
+                    results.append((group, future.result()))
+                except MarketoException as e:
+                    if e.code not in split_codes or len(group) < 2:
+                        raise
+                    middle = len(group) // 2
+                    pending.extend([group[:middle], group[middle:]])
+    return results
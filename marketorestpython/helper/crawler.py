@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def crawl_offsets(fetch_page, page_size, max_workers=10):
+    '''
+    collects all pages of an offset-paged endpoint. fetch_page(offset) returns the page as a list, or None
+    when there are no more results. Up to max_workers offsets are requested at the same time; pages are
+    consumed in offset order and the crawl stops at the first short (or empty) page, so the results come
+    back in the same order as a serial crawl. Pages requested past the end are discarded.
+    '''
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        next_page = 0
+        current = 0
+        try:
+            while True:
+                while len(in_flight) < max_workers:
+                    in_flight[next_page] = executor.submit(fetch_page, next_page * page_size)
+                    next_page += 1
+                page = in_flight.pop(current).result()
+                current += 1
+                if page:
+                    results.extend(page)
+                if page is None or len(page) < page_size:
+                    return results
+        finally:
+            for future in in_flight.values():
+                future.cancel()
@@ -0,0 +1,112 @@
+import csv
+import heapq
+import os
+import sys
+import tempfile
+
+
+def _sort_key(value):
+    ''' lead ids sort as numbers; anything else after them, as text '''
+    return (0, int(value), '') if value.isdigit() else (1, 0, value)
+
+
+def raise_field_size_limit():
+    # long text fields (textarea, rich text) can be larger than the csv module's default limit of 128 KB
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def external_sort(file_name, key='id', chunk_rows=100000, tmp_dir=None):
+    '''
+    returns (header, rows) with rows a generator over the data rows of a CSV file ordered by the key column.
+    At most chunk_rows rows are held in memory: larger files are sorted in runs of chunk_rows rows written to
+    temporary files, which are then merged.
+    '''
+    raise_field_size_limit()
+    handle = open(file_name, 'r', newline='', encoding='utf-8')
+    reader = csv.reader(handle)
+    header = next(reader, None)
+    if header is None:
+        handle.close()
+        return [], iter(())
+    index = header.index(key)
+
+    def sort_key(row):
+        return _sort_key(row[index])
+
+    runs = []
+    try:
+        while True:
+            chunk = [row for _, row in zip(range(chunk_rows), reader)]
+            chunk.sort(key=sort_key)
+            if len(chunk) < chunk_rows and not runs:
+                # the whole file fits in one chunk
+                handle.close()
+                return header, iter(chunk)
+            run = tempfile.TemporaryFile('w+', newline='', encoding='utf-8', dir=tmp_dir)
+            csv.writer(run).writerows(chunk)
+            run.seek(0)
+            runs.append(run)
+            if len(chunk) < chunk_rows:
+                break
+    finally:
+        handle.close()
+
+    def merged():
+        try:
+            yield from heapq.merge(*[csv.reader(run) for run in runs], key=sort_key)
+        finally:
+            for run in runs:
+                run.close()
+    return header, merged()
+
+
+def join_csv(file_names, output, key='id', chunk_rows=100000, tmp_dir=None):
+    '''
+    joins CSV files that hold different columns of the same records on the key column, one output row per
+    key value (empty cells where a file has no row for it); the key column is written once, first.
+    Each file is sorted with external_sort, so memory use doesn't grow with the file sizes. The output is
+    written to output + '.part' and renamed when complete. Returns the number of rows written.
+    '''
+    sources = []
+    for file_name in file_names:
+        header, rows = external_sort(file_name, key=key, chunk_rows=chunk_rows, tmp_dir=tmp_dir)
+        if header:
+            sources.append((header, header.index(key), rows))
+    columns = [key]
+    for header, index, _ in sources:
+        columns.extend(column for i, column in enumerate(header) if i != index)
+
+    def tagged(number, index, rows):
+        for row in rows:
+            yield _sort_key(row[index]), number, row
+
+    count = 0
+    part_name = output + '.part'
+    with open(part_name, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(columns)
+        merged = heapq.merge(*[tagged(number, index, rows) for number, (_, index, rows) in enumerate(sources)])
+        current, value, found = None, None, {}
+
+        def write():
+            out = [value]
+            for number, (header, index, _) in enumerate(sources):
+                row = found.get(number)
+                if row is None:
+                    out.extend([''] * (len(header) - 1))
+                else:
+                    out.extend(cell for i, cell in enumerate(row) if i != index)
+            writer.writerow(out)
+
+        for sort_key, number, row in merged:
+            if sort_key != current:
+                if found:
+                    write()
+                    count += 1
+                current, value, found = sort_key, row[sources[number][1]], {}
+            found[number] = row
+        if found:
+            write()
+            count += 1
+    os.replace(part_name, output)
+    return count
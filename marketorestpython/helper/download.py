@@ -0,0 +1,155 @@
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
+
+from marketorestpython.helper.rate_limiter import shared_rate_limiter
+from marketorestpython.helper.retry import RetryPolicy, parse_retry_after
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadSizeError(Exception):
+    ''' the downloaded file does not have the size the export reported '''
+    pass
+
+
+def _part_size(part_name):
+    return os.path.getsize(part_name) if os.path.exists(part_name) else 0
+
+
+def _fetch_range(session, url, part_name, start, end, chunk_size, rate_limiter, retry_policy, params=None):
+    '''
+    downloads bytes start..end (inclusive; end None = to the end of the file) into part_name, continuing
+    after whatever part_name already holds. Returns the number of bytes part_name holds afterwards.
+    '''
+    def attempt():
+        offset = _part_size(part_name)
+        if end is not None and offset >= end - start + 1:
+            return offset, None, None
+        headers = {}
+        if offset or start or end is not None:
+            # byte ranges count bytes of the file itself, so ask for it without transfer compression
+            headers['Range'] = 'bytes={}-{}'.format(start + offset, '' if end is None else end)
+            headers['Accept-Encoding'] = 'identity'
+        else:
+            # first pass over the whole file: let it come compressed, requests decompresses on the fly
+            headers['Accept-Encoding'] = 'gzip'
+        with rate_limiter:
+            response = session.get(url, params=params, stream=True, headers=headers)
+            try:
+                if response.status_code in retry_policy.retry_statuses:
+                    return None, response.status_code, parse_retry_after(response.headers.get('Retry-After'))
+                if response.status_code == 416 and end is None:
+                    # nothing left past offset, the part file is already complete
+                    return offset, None, None
+                if response.status_code == 200 and 'Range' in headers:
+                    if start or end is not None:
+                        raise Exception('Server does not support range requests for {}'.format(url))
+                    # range ignored, the whole file is coming again
+                    offset = 0
+                elif response.status_code not in (200, 206):
+                    response.raise_for_status()
+                    raise Exception('Unexpected status {} for {}'.format(response.status_code, url))
+                with open(part_name, 'ab' if offset else 'wb') as file_handle:
+                    for chunk in response.iter_content(chunk_size):
+                        file_handle.write(chunk)
+                        offset += len(chunk)
+            finally:
+                response.close()
+        return offset, None, None
+
+    while True:
+        before = _part_size(part_name)
+        try:
+            return retry_policy.call('get', url, attempt, raise_on_giveup=True)
+        except Exception:
+            # a dropped connection after some progress starts a fresh round of attempts from where it stopped
+            if _part_size(part_name) > before:
+                continue
+            raise
+
+
+def download_file(session, url, file_name, expected_size=None, chunk_size=None, segments=1, rate_limiter=None,
+                  retry_policy=None, params=None):
+    '''
+    streams url to file_name and returns the file size.
+
+    The data goes to file_name + '.part' first, and only replaces file_name once it's complete (and matches
+    expected_size, when given), so file_name never holds a partial file. An interrupted download, in this
+    call or a later one with the same file_name, continues with a Range request after the bytes already on
+    disk instead of starting over.
+    chunk_size: bytes read from the connection at a time (default 1 MB)
+    segments: with expected_size known, the file is split into this many byte ranges downloaded in parallel
+    (each in its own file_name.part.<n>, joined at the end)
+    params: query parameters sent with every request (the access token, kept out of url)
+    '''
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter()
+    retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+    part_name = file_name + '.part'
+
+    if segments > 1 and expected_size:
+        segment_size = -(-expected_size // segments)
+        ranges = [(start, min(start + segment_size, expected_size) - 1)
+                  for start in range(0, expected_size, segment_size)]
+        names = ['{}.{}'.format(part_name, index) for index in range(len(ranges))]
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(_fetch_range, session, url, name, start, end, chunk_size, rate_limiter,
+                                       retry_policy, params) for name, (start, end) in zip(names, ranges)]
+            for future in futures:
+                future.result()
+        with open(part_name, 'wb') as file_handle:
+            for name in names:
+                with open(name, 'rb') as segment_handle:
+                    shutil.copyfileobj(segment_handle, file_handle, chunk_size)
+        for name in names:
+            os.remove(name)
+    else:
+        _fetch_range(session, url, part_name, 0, None, chunk_size, rate_limiter, retry_policy, params)
+
+    size = _part_size(part_name)
+    if expected_size is not None and size != expected_size:
+        # resuming from a wrong file would only make it worse, so the next call starts over
+        os.remove(part_name)
+        raise DownloadSizeError('Downloaded {} bytes for {}, expected fileSize {}'.format(size, file_name,
+                                                                                         expected_size))
+    os.replace(part_name, file_name)
+    return size
+
+
+def download_to_sink(session, url, sink, name, expected_size=None, chunk_size=None, rate_limiter=None,
+                     retry_policy=None, params=None):
+    '''
+    streams url into sink.open(name) (see helper/sinks.py) as the chunks arrive, without a local copy; returns
+    (location, size). A sink can't be rewound, so a failed attempt is aborted and the next one starts over;
+    the writer is only closed, making the file visible, once all bytes (expected_size, when given) are in.
+    '''
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter()
+    retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+
+    def attempt():
+        with rate_limiter:
+            response = session.get(url, params=params, stream=True, headers={'Accept-Encoding': 'gzip'})
+            try:
+                if response.status_code in retry_policy.retry_statuses:
+                    return None, response.status_code, parse_retry_after(response.headers.get('Retry-After'))
+                response.raise_for_status()
+                writer = sink.open(name)
+                size = 0
+                try:
+                    for chunk in response.iter_content(chunk_size):
+                        writer.write(chunk)
+                        size += len(chunk)
+                    if expected_size is not None and size != expected_size:
+                        raise DownloadSizeError('Downloaded {} bytes for {}, expected fileSize {}'.format(
+                            size, name, expected_size))
+                except BaseException:
+                    writer.abort()
+                    raise
+                return (writer.close(), size), None, None
+            finally:
+                response.close()
+    return retry_policy.call('get', url, attempt, raise_on_giveup=True)
@@ -1,128 +1,85 @@
 import requests
-import time
 import mimetypes
 
+from requests.adapters import HTTPAdapter
+
+from marketorestpython.helper.rate_limiter import shared_rate_limiter
+from marketorestpython.helper.retry import RetryPolicy, parse_retry_after
+
+
+def create_session(pool_connections=1, pool_maxsize=10, pool_block=False):
+    '''
+    builds a requests.Session with keep-alive connection pooling, so repeated calls to the same
+    <munchkin>.mktorest.com host reuse an open TCP/TLS connection instead of doing a new handshake each time
+
+    pool_connections -> number of per-host pools to keep (one per Marketo host is enough)
+    pool_maxsize -> max connections kept open per host (match the 10 concurrent call limit)
+    pool_block -> block when all pooled connections for a host are in use instead of opening extra ones
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
 class HttpLib:
-    max_retries = 3
-    sleep_duration = 3
-    num_calls_per_second = 5  # can run five times per second at most (at 100/20 rate limit)
 
-    def _rate_limited(maxPerSecond):
-        minInterval = 1.0 / float(maxPerSecond)
-        def decorate(func):
-            lastTimeCalled = [0.0]
-            def rateLimitedFunction(*args,**kargs):
-                elapsed = time.clock() - lastTimeCalled[0]
-                leftToWait = minInterval - elapsed
-                if leftToWait>0:
-                    time.sleep(leftToWait)
-                ret = func(*args,**kargs)
-                lastTimeCalled[0] = time.clock()
-                return ret
-            return rateLimitedFunction
-        return decorate
+    def __init__(self, session=None, rate_limiter=None, retry_policy=None):
+        # without a session every call opens its own connection through the module level requests functions
+        self.session = session if session is not None else requests
+        # every attempt (including retries) takes a slot from the limiter shared by get, post and delete
+        self.rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+
+    def _request(self, method, endpoint, send, mode=None, idempotent=True):
+        '''
+        sends the request through the rate limiter and retries it according to the retry policy;
+        returns the JSON response (the response object for mode 'nojson'); if all attempts failed, the last
+        Marketo error response, or None if there is none (an HTTP error status or an exception)
+        '''
+        def attempt():
+            with self.rate_limiter:
+                r = send()
+            retry_after = parse_retry_after(r.headers.get('Retry-After'))
+            if r.status_code in self.retry_policy.retry_statuses:
+                return None, r.status_code, retry_after
+            if mode == 'nojson':
+                return r, None, None
+            r_json = r.json()
+            # if we still hit the rate limiter, the call will be retried; the error is returned if it gives up
+            if r_json.get('success') is False:  # not for the access token call, which has no 'success'
+                print('error from http_lib.py: ' + str(r_json['errors'][0]))
+                error_code = r_json['errors'][0]['code']
+                if error_code in self.retry_policy.code_rules:
+                    # this handles Marketo exceptions; HTTP response is still 200, but error is in the JSON
+                    return r_json, error_code, retry_after
+            # fatal exceptions will still error out; exceptions caught above may be recoverable
+            return r_json, None, None
+        return self.retry_policy.call(method, endpoint, attempt, idempotent=idempotent)
 
-    @_rate_limited(num_calls_per_second)
     def get(self, endpoint, args=None, mode=None):
-        retries = 1
-        while True:
-            if retries > self.max_retries:
-                return None
-            try:
-                headers = {'Accept-Encoding': 'gzip'}
-                r = requests.get(endpoint, params=args, headers=headers)
-                if mode is 'nojson':
-                    return r
-                else:
-                    r_json = r.json()
-                    # if we still hit the rate limiter, do not return anything so the call will be retried
-                    if 'success' in r_json:  # this is for all normal API calls (but not the access token call)
-                        if r_json['success'] == False:
-                            print('error from http_lib.py: ' + str(r_json['errors'][0]))
-                            if r_json['errors'][0]['code'] in ('606', '615', '604'):
-                                # this handles Marketo exceptions; HTTP response is still 200, but error is in the JSON
-                                error_code = r_json['errors'][0]['code']
-                                error_description = {
-                                    '606': 'rate limiter',
-                                    '615': 'concurrent call limit',
-                                    '604': 'timeout'}
-                                if retries < self.max_retries:
-                                    print('Attempt %s. Error %s, %s. Pausing, then trying again.' % (retries, error_code, error_description[error_code]))
-                                else:
-                                    print('Attempt %s. Error %s, %s. This was the final attempt.' % (retries, error_code, error_description[error_code]))
-                                time.sleep(self.sleep_duration)
-                                retries += 1
-                            else:
-                                # fatal exceptions will still error out; exceptions caught above may be recoverable
-                                return r_json
-                        else:
-                            return r_json
-                    else:
-                        return r_json  # this is only for the access token call
-            except Exception as e:
-                print("HTTP Get Exception! Retrying.....")
-                time.sleep(self.sleep_duration)
-                retries += 1
+        headers = {'Accept-Encoding': 'gzip'}
+        return self._request('get', endpoint,
+                             lambda: self.session.get(endpoint, params=args, headers=headers), mode=mode)
 
-    @_rate_limited(num_calls_per_second)
     def post(self, endpoint, args, data=None, files=None, filename=None, mode=None):
-        retries = 1
-        while True:
-            if retries > self.max_retries:
-                return None
-            try:
-                if mode is 'nojsondumps':
-                    r = requests.post(endpoint, params=args, data=data)
-                elif files is None:
-                    headers = {'Content-type': 'application/json'}
-                    r = requests.post(endpoint, params=args, json=data, headers=headers)
-                elif files is not None:
-                    mimetype = mimetypes.guess_type(files)[0]
-                    file = {filename: (files, open(files, 'rb'), mimetype)}
-                    r = requests.post(endpoint, params=args, json=data, files=file)
-                r_json = r.json()
-                # if we still hit the rate limiter, do not return anything so the call will be retried
-                if 'success' in r_json:  # this is for all normal API calls (but not the access token call)
-                    if r_json['success'] == False:
-                        print('error from http_lib.py: ' + str(r_json['errors'][0]))
-                        if r_json['errors'][0]['code'] in ('606', '615', '604'):
-                            # this handles Marketo exceptions; HTTP response is still 200, but error is in the JSON
-                            error_code = r_json['errors'][0]['code']
-                            error_description = {
-                                '606': 'rate limiter',
-                                '615': 'concurrent call limit',
-                                '604': 'timeout'}
-                            if retries < self.max_retries:
-                                print('Attempt %s. Error %s, %s. Pausing, then trying again.' % (
-                                retries, error_code, error_description[error_code]))
-                            else:
-                                print('Attempt %s. Error %s, %s. This was the final attempt.' % (
-                                retries, error_code, error_description[error_code]))
-                            time.sleep(self.sleep_duration)
-                            retries += 1
-                        else:
-                            # fatal exceptions will still error out; exceptions caught above may be recoverable
-                            return r_json
-                    else:
-                        return r_json
-                else:
-                    return r_json
-            except Exception as e:
-                print("HTTP Post Exception! Retrying....."+ str(e))
-                time.sleep(self.sleep_duration)
-                retries += 1
+        def send():
+            if mode == 'nojsondumps':
+                return self.session.post(endpoint, params=args, data=data)
+            elif files is None:
+                headers = {'Content-type': 'application/json'}
+                return self.session.post(endpoint, params=args, json=data, headers=headers)
+            else:
+                mimetype = mimetypes.guess_type(files)[0]
+                with open(files, 'rb') as file_handle:
+                    file = {filename: (files, file_handle, mimetype)}
+                    return self.session.post(endpoint, params=args, json=data, files=file)
+        # POSTs with _method=GET are reads; the others may change data and are retried more carefully
+        idempotent = bool(args) and args.get('_method') == 'GET'
+        return self._request('post', endpoint, send, idempotent=idempotent)
 
-    @_rate_limited(num_calls_per_second)
     def delete(self, endpoint, args, data):
-        retries = 0
-        while True:
-            if retries > self.max_retries:
-                return None
-            try:
-                headers = {'Content-type': 'application/json'}
-                r = requests.delete(endpoint, params=args, json=data, headers=headers)
-                return r.json()
-            except Exception as e:
-                print("HTTP Delete Exception! Retrying....."+ str(e))
-                time.sleep(self.sleep_duration)
-                retries += 1
+        headers = {'Content-type': 'application/json'}
+        return self._request('delete', endpoint,
+                             lambda: self.session.delete(endpoint, params=args, json=data, headers=headers))
@@ -0,0 +1,57 @@
+import threading
+
+from queue import Queue, Empty, Full
+
+
+def prefetch_pages(pages, depth=2):
+    '''
+    iterates over pages (any iterator, typically one of the client's *_yield generators) while a background
+    thread already fetches the next ones, so the round trip for page n+1 overlaps with processing page n.
+    At most depth pages are buffered ahead of the consumer; errors from the fetching side are re-raised here.
+    '''
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(pages)
+        try:
+            for page in iterator:
+                if not put(('page', page)):
+                    break
+            else:
+                put(('done', None))
+        except Exception as e:
+            put(('error', e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, name='marketo-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = queue.get()
+            if kind == 'page':
+                yield value
+            elif kind == 'error':
+                raise value
+            else:
+                return
+    finally:
+        # the consumer is done (or stopped early): let the producer finish its current call and exit
+        stop.set()
+        while True:
+            try:
+                queue.get_nowait()
+            except Empty:
+                break
+        thread.join()
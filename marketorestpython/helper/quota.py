@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+def quota_day(now=None):
+    '''
+    Marketo resets the daily API quota at midnight US Central time; days are keyed on CST (UTC-6)
+    '''
+    if now is None:
+        now = time.time()
+    return time.strftime('%Y-%m-%d', time.gmtime(now - 6 * 3600))
+
+
+class QuotaBackend(ABC):
+    '''
+    Storage for the call window used by RateLimiter and for the daily call count.
+    Every process that uses a backend with the same storage and key draws from the same budget.
+
+    try_acquire -> records a call and returns 0 if the window has room, otherwise returns the seconds to wait
+    count -> number of calls in the window
+    wait_time -> seconds until the window has room (0 if it has room now)
+    incr_daily -> adds to the daily count and returns the new total
+    get_daily -> current daily count
+    '''
+    @abstractmethod
+    def try_acquire(self, key, max_calls, period, now):
+        pass
+
+    @abstractmethod
+    def count(self, key, period, now):
+        pass
+
+    @abstractmethod
+    def wait_time(self, key, max_calls, period, now):
+        pass
+
+    @abstractmethod
+    def incr_daily(self, key, day, amount=1):
+        pass
+
+    @abstractmethod
+    def get_daily(self, key, day):
+        pass
+
+
+class MemoryQuotaBackend(QuotaBackend):
+    ''' in-process backend, the default; shared by threads but not by processes '''
+    def __init__(self):
+        self._calls = {}
+        self._daily = {}
+        self._lock = threading.Lock()
+
+    def _window(self, key, period, now):
+        calls = self._calls.setdefault(key, deque())
+        while calls and calls[0] <= now - period:
+            calls.popleft()
+        return calls
+
+    def try_acquire(self, key, max_calls, period, now):
+        with self._lock:
+            calls = self._window(key, period, now)
+            if len(calls) < max_calls:
+                calls.append(now)
+                return 0.0
+            return calls[len(calls) - max_calls] + period - now
+
+    def count(self, key, period, now):
+        with self._lock:
+            return len(self._window(key, period, now))
+
+    def wait_time(self, key, max_calls, period, now):
+        with self._lock:
+            calls = self._window(key, period, now)
+            if len(calls) < max_calls:
+                return 0.0
+            return calls[len(calls) - max_calls] + period - now
+
+    def incr_daily(self, key, day, amount=1):
+        with self._lock:
+            self._daily[(key, day)] = self._daily.get((key, day), 0) + amount
+            return self._daily[(key, day)]
+
+    def get_daily(self, key, day):
+        with self._lock:
+            return self._daily.get((key, day), 0)
+
+
+class SQLiteQuotaBackend(QuotaBackend):
+    '''
+    backend for several processes on one host: the window lives in a SQLite file and every update runs in an
+    immediate transaction, which holds the database's file lock for the duration of the check-and-record
+    '''
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS calls (key TEXT NOT NULL, ts REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS calls_key_ts ON calls (key, ts)')
+        conn.execute('CREATE TABLE IF NOT EXISTS daily (key TEXT NOT NULL, day TEXT NOT NULL, '
+                     'count INTEGER NOT NULL, PRIMARY KEY (key, day))')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    @staticmethod
+    def _window(conn, key, max_calls, period, now):
+        conn.execute('DELETE FROM calls WHERE key = ? AND ts <= ?', (key, now - period))
+        count = conn.execute('SELECT COUNT(*) FROM calls WHERE key = ?', (key,)).fetchone()[0]
+        if count < max_calls:
+            return count, 0.0
+        oldest = conn.execute('SELECT ts FROM calls WHERE key = ? ORDER BY ts LIMIT 1 OFFSET ?',
+                              (key, count - max_calls)).fetchone()[0]
+        return count, oldest + period - now
+
+    def try_acquire(self, key, max_calls, period, now):
+        def acquire(conn):
+            _, wait = self._window(conn, key, max_calls, period, now)
+            if wait <= 0:
+                conn.execute('INSERT INTO calls (key, ts) VALUES (?, ?)', (key, now))
+            return wait
+        return self._transaction(acquire)
+
+    def count(self, key, period, now):
+        return self._transaction(lambda conn: self._window(conn, key, float('inf'), period, now)[0])
+
+    def wait_time(self, key, max_calls, period, now):
+        return self._transaction(lambda conn: self._window(conn, key, max_calls, period, now)[1])
+
+    def incr_daily(self, key, day, amount=1):
+        def incr(conn):
+            conn.execute('INSERT INTO daily (key, day, count) VALUES (?, ?, ?) '
+                         'ON CONFLICT (key, day) DO UPDATE SET count = count + excluded.count', (key, day, amount))
+            return conn.execute('SELECT count FROM daily WHERE key = ? AND day = ?', (key, day)).fetchone()[0]
+        return self._transaction(incr)
+
+    def get_daily(self, key, day):
+        row = self._connection().execute('SELECT count FROM daily WHERE key = ? AND day = ?', (key, day)).fetchone()
+        return row[0] if row else 0
+
+
+class RedisQuotaBackend(QuotaBackend):
+    '''
+    backend for processes on several hosts, using any client that speaks the redis-py command interface.
+    The window is a sorted set of call timestamps per key; check-and-record runs under a short SET NX lock.
+    '''
+    lock_ttl_ms = 2000
+
+    def __init__(self, redis, prefix='marketorestpython', sleep=time.sleep):
+        self.redis = redis
+        self.prefix = prefix
+        self.sleep = sleep
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis  # optional dependency, only needed for this backend
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _locked(self, key, func):
+        lock_name = '{}:lock:{}'.format(self.prefix, key)
+        token = uuid.uuid4().hex
+        while not self.redis.set(lock_name, token, nx=True, px=self.lock_ttl_ms):
+            self.sleep(0.005)
+        try:
+            return func('{}:window:{}'.format(self.prefix, key))
+        finally:
+            current = self.redis.get(lock_name)
+            if current is not None and (current.decode('utf-8') if isinstance(current, bytes) else current) == token:
+                self.redis.delete(lock_name)
+
+    def _window(self, name, max_calls, period, now):
+        self.redis.zremrangebyscore(name, '-inf', now - period)
+        count = self.redis.zcard(name)
+        if count < max_calls:
+            return count, 0.0
+        index = count - max_calls
+        oldest = self.redis.zrange(name, index, index, withscores=True)[0][1]
+        return count, oldest + period - now
+
+    def try_acquire(self, key, max_calls, period, now):
+        def acquire(name):
+            _, wait = self._window(name, max_calls, period, now)
+            if wait <= 0:
+                self.redis.zadd(name, {'{}:{}'.format(now, uuid.uuid4().hex): now})
+                self.redis.pexpire(name, int(period * 1000) + 1000)
+            return wait
+        return self._locked(key, acquire)
+
+    def count(self, key, period, now):
+        return self._locked(key, lambda name: self._window(name, float('inf'), period, now)[0])
+
+    def wait_time(self, key, max_calls, period, now):
+        return self._locked(key, lambda name: self._window(name, max_calls, period, now)[1])
+
+    def incr_daily(self, key, day, amount=1):
+        name = '{}:daily:{}:{}'.format(self.prefix, key, day)
+        total = self.redis.incrby(name, amount)
+        self.redis.expire(name, 2 * 24 * 3600)
+        return int(total)
+
+    def get_daily(self, key, day):
+        value = self.redis.get('{}:daily:{}:{}'.format(self.prefix, key, day))
+        return int(value) if value is not None else 0
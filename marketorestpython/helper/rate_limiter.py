@@ -0,0 +1,82 @@
+import threading
+import time
+
+from marketorestpython.helper.quota import MemoryQuotaBackend
+
+
+class RateLimiter:
+    '''
+    Enforces Marketo's API limits for every call that goes through it:
+    - a sliding window of max_calls per period seconds (100 calls per 20 seconds)
+    - at most max_concurrent calls in flight at the same time (10)
+
+    One limiter is meant to be shared by all methods and all clients that talk to the same Marketo instance,
+    see shared_rate_limiter(). The window is kept in a QuotaBackend under key; with a SQLite or Redis backend
+    several processes or hosts share the window, the concurrency cap stays per process.
+    clock and sleep can be replaced to test without waiting.
+    '''
+    def __init__(self, max_calls=100, period=20, max_concurrent=10, clock=time.time, sleep=time.sleep,
+                 backend=None, key='default'):
+        self.max_calls = max_calls
+        self.period = period
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+        self.sleep = sleep
+        self.backend = backend if backend is not None else MemoryQuotaBackend()
+        self.key = key
+        self.in_flight = 0
+        self.total_wait = 0.0  # seconds spent waiting for the window, for metrics
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @property
+    def tokens(self):
+        ''' number of calls that can be started right now without waiting '''
+        return self.max_calls - self.backend.count(self.key, self.period, self.clock())
+
+    def wait_time(self):
+        ''' seconds until the next call is allowed by the window (0 if one can start now) '''
+        return max(self.backend.wait_time(self.key, self.max_calls, self.period, self.clock()), 0.0)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                wait = self.backend.try_acquire(self.key, self.max_calls, self.period, self.clock())
+                if wait <= 0:
+                    with self._lock:
+                        self.in_flight += 1
+                    return
+                with self._lock:
+                    self.total_wait += wait
+                self.sleep(wait)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+_shared_limiters = {}
+_shared_lock = threading.Lock()
+
+
+def shared_rate_limiter(key='default', backend=None):
+    '''
+    returns the process-wide limiter for key (MarketoClient uses the munchkin id), creating it on first use;
+    limiters with a quota backend are kept apart from the in-memory ones
+    '''
+    with _shared_lock:
+        if (key, backend) not in _shared_limiters:
+            _shared_limiters[(key, backend)] = RateLimiter(backend=backend, key=key)
+        return _shared_limiters[(key, backend)]
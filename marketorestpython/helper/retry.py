@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from urllib3.exceptions import NewConnectionError
+
+
+# one per attempt; outcome is 'success', 'retry' or 'giveup', backoff is the sleep before the next attempt
+RetryEvent = namedtuple('RetryEvent', ['method', 'endpoint', 'attempt', 'outcome', 'reason', 'elapsed', 'backoff'])
+
+
+def never_sent(exc):
+    ''' True for connection errors raised before the request could reach the server '''
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def parse_retry_after(value, now=None):
+    ''' Retry-After is either a number of seconds or an HTTP date; returns seconds or None '''
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at - (time.time() if now is None else now), 0.0)
+
+
+class RetryPolicy:
+    '''
+    Decides whether and how long to wait before another attempt at a Marketo call.
+
+    backoff curve: backoff * multiplier ** (attempt - 1), capped at max_backoff; jitter (0..1) takes a random
+    fraction off each delay so parallel workers don't retry in lockstep, and a Retry-After header is honoured
+    when it asks for a longer wait
+    max_attempts: attempts per call, including the first one
+    deadline: seconds a call may take in total, backoff included (None = no deadline)
+    code_rules: per Marketo error code overrides of max_attempts / backoff / multiplier; only codes listed here
+    are retried, every other error code is returned to the caller as before
+    retry_unsafe_posts: POSTs that change data are only retried after an exception if the request never
+    reached Marketo (connect errors), or for errors that mean the request was rejected (606, 615, 429, 503),
+    unless this is set; a 604 timeout may have been applied, so it is not retried for them
+    on_attempt: callables receiving a RetryEvent after every attempt
+    '''
+    default_code_rules = {
+        '606': {'description': 'rate limiter'},
+        '615': {'description': 'concurrent call limit', 'backoff': 1},
+        '604': {'description': 'timeout'},
+    }
+    retry_statuses = (429, 502, 503, 504)
+    rejected_reasons = ('606', '615', 429, 503)  # Marketo did not act on the request, safe to send again
+
+    def __init__(self, max_attempts=3, backoff=3, multiplier=2, max_backoff=60, jitter=0.5, deadline=None,
+                 code_rules=None, retry_unsafe_posts=False, on_attempt=None, clock=time.monotonic,
+                 sleep=time.sleep, rand=random.random):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.code_rules = {code: dict(rule) for code, rule in self.default_code_rules.items()}
+        for code, rule in (code_rules or {}).items():
+            self.code_rules.setdefault(code, {}).update(rule)
+        self.retry_unsafe_posts = retry_unsafe_posts
+        self.on_attempt = list(on_attempt or [])
+        self.clock = clock
+        self.sleep = sleep
+        self.rand = rand
+        # totals for metrics
+        self.attempts = 0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def describe(self, reason):
+        if isinstance(reason, str) and reason in self.code_rules:
+            return self.code_rules[reason].get('description', 'error')
+        if isinstance(reason, int):
+            return 'HTTP status'
+        return str(reason)
+
+    def is_retryable(self, reason, idempotent=True):
+        ''' reason is a Marketo error code (str), an HTTP status (int) or an exception '''
+        if isinstance(reason, BaseException):
+            if idempotent or self.retry_unsafe_posts:
+                return True
+            return never_sent(reason)
+        if isinstance(reason, int):
+            return reason in self.retry_statuses and \
+                (idempotent or self.retry_unsafe_posts or reason in self.rejected_reasons)
+        return reason in self.code_rules and \
+            (idempotent or self.retry_unsafe_posts or reason in self.rejected_reasons)
+
+    def delay(self, attempt, reason=None, retry_after=None):
+        ''' seconds to wait after failed attempt number attempt (1 based) '''
+        rule = self.code_rules.get(reason, {}) if isinstance(reason, str) else {}
+        delay = rule.get('backoff', self.backoff) * rule.get('multiplier', self.multiplier) ** (attempt - 1)
+        delay = min(delay, self.max_backoff)
+        if self.jitter:
+            delay *= 1 - self.jitter * self.rand()
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def next_backoff(self, attempt, reason, started, idempotent=True, retry_after=None):
+        ''' returns the seconds to sleep before the next attempt, or None to give up '''
+        if not self.is_retryable(reason, idempotent):
+            return None
+        rule = self.code_rules.get(reason, {}) if isinstance(reason, str) else {}
+        if attempt >= rule.get('max_attempts', self.max_attempts):
+            return None
+        delay = self.delay(attempt, reason, retry_after)
+        if self.deadline is not None and self.clock() - started + delay > self.deadline:
+            return None
+        return delay
+
+    def record(self, event):
+        with self._lock:
+            self.attempts += 1
+            if event.outcome == 'retry':
+                self.retries += 1
+                self.backoff_seconds += event.backoff
+        for callback in self.on_attempt:
+            callback(event)
+
+    def call(self, method, endpoint, attempt, idempotent=True, raise_on_giveup=False):
+        '''
+        runs attempt() until it succeeds or the policy gives up. attempt returns (result, reason, retry_after)
+        where reason is None on success, and result may be the error response; an exception raised by attempt is
+        used as the reason. Returns the result; when giving up, the last error response, so the caller sees the
+        Marketo error code (None if there is none, or raises the last error instead if raise_on_giveup is set).
+        '''
+        started = self.clock()
+        number = 0
+        while True:
+            number += 1
+            attempt_started = self.clock()
+            retry_after = None
+            try:
+                result, reason, retry_after = attempt()
+            except Exception as e:
+                result, reason = None, e
+            elapsed = self.clock() - attempt_started
+            if reason is None:
+                self.record(RetryEvent(method, endpoint, number, 'success', None, elapsed, 0.0))
+                return result
+            backoff = self.next_backoff(number, reason, started, idempotent, retry_after)
+            if backoff is None:
+                print('Attempt %s. Error %s, %s. This was the final attempt.' % (number, reason, self.describe(reason)))
+                self.record(RetryEvent(method, endpoint, number, 'giveup', reason, elapsed, 0.0))
+                if not raise_on_giveup:
+                    return result
+                if isinstance(reason, BaseException):
+                    raise reason
+                raise Exception({'message': self.describe(reason), 'code': str(reason)})
+            print('Attempt %s. Error %s, %s. Pausing %.1fs, then trying again.' % (
+                number, reason, self.describe(reason), backoff))
+            self.record(RetryEvent(method, endpoint, number, 'retry', reason, elapsed, backoff))
+            self.sleep(backoff)
@@ -0,0 +1,209 @@
+import os
+import shutil
+import threading
+import uuid
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Destinations for export files that take the bytes as they are downloaded, see retrieve_bulk_job(sink=...).
+# A sink's open(name) returns a writer with write(data), close() -> the location of the stored file, and
+# abort(), which drops whatever was written; nothing is visible at the location until close() returns.
+
+
+class FileSink:
+    ''' writes each file to name in directory path, through name + '.part' '''
+    def __init__(self, path=None):
+        self.path = path
+
+    def open(self, name):
+        return FileWriter(os.path.join(self.path, name) if self.path else name)
+
+
+class FileWriter:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.part_name = file_name + '.part'
+        self.handle = open(self.part_name, 'wb')
+
+    def write(self, data):
+        self.handle.write(data)
+
+    def close(self):
+        self.handle.close()
+        os.replace(self.part_name, self.file_name)
+        return self.file_name
+
+    def abort(self):
+        self.handle.close()
+        if os.path.exists(self.part_name):
+            os.remove(self.part_name)
+
+
+class GzipSink:
+    ''' gzip compresses each file on the way into another sink, as name + '.gz' '''
+    def __init__(self, sink, compresslevel=6):
+        self.sink = sink
+        self.compresslevel = compresslevel
+
+    def open(self, name):
+        return GzipWriter(self.sink.open(name + '.gz'), self.compresslevel)
+
+
+class GzipWriter:
+    def __init__(self, writer, compresslevel=6):
+        self.writer = writer
+        # wbits 31: gzip header and trailer, readable by gzip.open
+        self.compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+
+    def write(self, data):
+        compressed = self.compressor.compress(data)
+        if compressed:
+            self.writer.write(compressed)
+
+    def close(self):
+        self.writer.write(self.compressor.flush())
+        return self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+class ObjectStoreSink:
+    '''
+    uploads each file to an object store as a multipart upload of part_size byte parts, max_workers parts at a
+    time (so at most max_workers + 1 parts are held in memory). store needs create_multipart_upload(key),
+    upload_part(key, upload_id, number, data), complete_multipart_upload(key, upload_id, parts) and
+    abort_multipart_upload(key, upload_id); see S3ObjectStore and LocalObjectStore.
+    Parts (except the last) must be at least 5 MB for S3.
+    '''
+    def __init__(self, store, prefix='', part_size=8 * 1024 * 1024, max_workers=4):
+        self.store = store
+        self.prefix = prefix
+        self.part_size = part_size
+        self.max_workers = max_workers
+
+    def open(self, name):
+        return ObjectStoreWriter(self.store, self.prefix + name, self.part_size, self.max_workers)
+
+
+class ObjectStoreWriter:
+    def __init__(self, store, key, part_size, max_workers):
+        self.store = store
+        self.key = key
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.upload_id = store.create_multipart_upload(key)
+        self.buffer = bytearray()
+        self.parts = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _upload(self, data):
+        number = len(self.parts) + 1
+        pending = [future for future in self.parts.values() if not future.done()]
+        while len(pending) >= self.max_workers:
+            wait(pending, return_when=FIRST_COMPLETED)
+            pending = [future for future in pending if not future.done()]
+        self.parts[number] = self.executor.submit(self.store.upload_part, self.key, self.upload_id, number,
+                                                  bytes(data))
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+
+    def close(self):
+        try:
+            if self.buffer or not self.parts:
+                self._upload(self.buffer)
+                self.buffer = bytearray()
+            parts = [(number, self.parts[number].result()) for number in sorted(self.parts)]
+            self.store.complete_multipart_upload(self.key, self.upload_id, parts)
+        except BaseException:
+            self.abort()
+            raise
+        self.executor.shutdown()
+        return self.key
+
+    def abort(self):
+        self.executor.shutdown(wait=True)
+        self.store.abort_multipart_upload(self.key, self.upload_id)
+
+
+class S3ObjectStore:
+    ''' the object store interface of ObjectStoreSink on a boto3 S3 client '''
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def create_multipart_upload(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key, upload_id, number, data):
+        return self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                       Body=data)['ETag']
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={
+            'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in parts]})
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalObjectStore:
+    '''
+    an object store in a local directory, with the multipart upload calls of ObjectStoreSink: parts are kept
+    under root/.uploads until the upload is completed, then joined into root/key. For tests and local runs.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.uploads = {}
+
+    def _upload_dir(self, upload_id):
+        return os.path.join(self.root, '.uploads', upload_id)
+
+    def create_multipart_upload(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        with self.lock:
+            self.uploads[upload_id] = key
+        return upload_id
+
+    def upload_part(self, key, upload_id, number, data):
+        if self.uploads.get(upload_id) != key:
+            raise ValueError("Invalid argument: no upload {} for {}".format(upload_id, key))
+        with open(os.path.join(self._upload_dir(upload_id), str(number)), 'wb') as handle:
+            handle.write(data)
+        return '{}-{}'.format(upload_id, number)
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        file_name = self.path(key)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name + '.part', 'wb') as handle:
+            for number, _ in parts:
+                with open(os.path.join(self._upload_dir(upload_id), str(number)), 'rb') as part:
+                    shutil.copyfileobj(part, handle)
+        os.replace(file_name + '.part', file_name)
+        self.abort_multipart_upload(key, upload_id)
+
+    def abort_multipart_upload(self, key, upload_id):
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def keys(self):
+        ''' the keys of the completed objects '''
+        keys = []
+        for folder, dirs, files in os.walk(self.root):
+            dirs[:] = [name for name in dirs if name != '.uploads']
+            relative = os.path.relpath(folder, self.root)
+            for name in files:
+                keys.append(name if relative == '.' else '/'.join(relative.split(os.sep) + [name]))
+        return sorted(keys)
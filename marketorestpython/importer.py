@@ -0,0 +1,250 @@
+import csv
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from marketorestpython.helper.csv_join import raise_field_size_limit
+from marketorestpython.helper.exceptions import MarketoException
+
+
+# Marketo rejects import files over 10 MB and accepts at most 10 import batches in its queue
+MAX_IMPORT_FILE_SIZE = 10 * 1024 * 1024
+MAX_IMPORT_JOBS = 10
+IMPORT_DONE_STATUSES = ('Complete', 'Failed')
+
+
+class LeadImportPipeline:
+    '''
+    Imports any number of leads with import_lead: cuts a CSV file or a stream of records into files of at most
+    max_file_size bytes, uploads them (upload_workers at a time) while fewer than max_jobs batches are uploading
+    or waiting in Marketo's import queue, polls the status of the batches and fetches their failure and warning
+    files. The result is written as the input rows plus an importStatus (imported, warning or failed) and an
+    importMessage column, in the input order.
+
+    poll_interval, max_poll_interval, poll_multiplier: status polls start every poll_interval seconds and back
+    off up to max_poll_interval while nothing changes
+    path: directory for the chunk files (default: a temporary directory), removed afterwards unless keep_files
+    lookupField, listId, partitionName: passed on to import_lead
+    '''
+    def __init__(self, client, lookupField=None, listId=None, partitionName=None, fields=None,
+                 max_file_size=MAX_IMPORT_FILE_SIZE, max_jobs=MAX_IMPORT_JOBS, upload_workers=2, poll_interval=5,
+                 max_poll_interval=60, poll_multiplier=2, path=None, keep_files=False, sleep=time.sleep):
+        self.client = client
+        self.lookupField = lookupField
+        self.listId = listId
+        self.partitionName = partitionName
+        self.fields = fields
+        self.max_file_size = max_file_size
+        self.max_jobs = max_jobs
+        self.upload_workers = upload_workers
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_multiplier = poll_multiplier
+        self.path = path
+        self.keep_files = keep_files
+        self.sleep = sleep
+        self.batches = []
+
+    def _source_rows(self, source):
+        ''' (header, rows) of a CSV file name or an iterable of records (dicts) '''
+        if isinstance(source, str):
+            raise_field_size_limit()
+            handle = open(source, 'r', newline='', encoding='utf-8')
+
+            def rows():
+                with handle:
+                    yield from reader
+            reader = csv.reader(handle)
+            header = next(reader, None)
+            if header is None:
+                handle.close()
+                return [], iter(())
+            return header, rows()
+        records = iter(source)
+        first = next(records, None)
+        if first is None:
+            return [], iter(())
+        header = list(self.fields or first)
+
+        def rows():
+            for record in itertools.chain([first], records):
+                yield ['' if record.get(field) is None else record[field] for field in header]
+        return header, rows()
+
+    def chunks(self, header, rows, directory):
+        ''' writes rows into CSV files of at most max_file_size bytes, yielding a batch dict for each '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def encode(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue().encode('utf-8')
+
+        header_line = encode(header)
+        batch, handle, size = None, None, 0
+        for row in rows:
+            line = encode(row)
+            if len(header_line) + len(line) > self.max_file_size:
+                raise ValueError("Invalid argument: a row of {} bytes doesn't fit in an import file of {} "
+                                 "bytes.".format(len(line), self.max_file_size))
+            if batch is not None and size + len(line) > self.max_file_size:
+                handle.close()
+                yield batch
+                batch = None
+            if batch is None:
+                number = len(self.batches)
+                batch = {'number': number, 'filename': os.path.join(directory, 'import_{:05d}.csv'.format(number)),
+                         'rows': 0, 'batchId': None, 'status': 'Pending'}
+                self.batches.append(batch)
+                handle = open(batch['filename'], 'wb')
+                handle.write(header_line)
+                size = len(header_line)
+            handle.write(line)
+            size += len(line)
+            batch['rows'] += 1
+        if batch is not None:
+            handle.close()
+            yield batch
+
+    def _upload(self, batch):
+        return self.client.import_lead('csv', batch['filename'], lookupField=self.lookupField, listId=self.listId,
+                                       partitionName=self.partitionName)[0]
+
+    def _fetch_files(self, batch):
+        ''' the failure and warning files of a batch, parsed by _parse_rows '''
+        results = {}
+        if batch.get('numOfRowsFailed'):
+            results['failures'] = self._parse_rows(self.client.get_import_failure_file(batch['batchId']))
+        if batch.get('numOfRowsWithWarning'):
+            results['warnings'] = self._parse_rows(self.client.get_import_warning_file(batch['batchId']))
+        return results
+
+    @staticmethod
+    def _parse_rows(text):
+        ''' (columns, {values of those columns: deque of reasons}) of a failure or warning file '''
+        reader = csv.reader(io.StringIO(text))
+        header = next(reader, None)
+        if header is None:
+            return [], {}
+        messages = {}
+        for row in reader:
+            if row:
+                # the file repeats the columns of the input row, followed by the reason
+                messages.setdefault(tuple(row[:-1]), deque()).append(row[-1])
+        return header[:-1], messages
+
+    def run(self, source, output):
+        '''
+        imports source (a CSV file name, or an iterable of dicts with the fields as keys) and writes the
+        input rows with their import status to output (written to output + '.part' and renamed when complete).
+        Returns {'filename', 'rows', 'imported', 'warnings', 'failed', 'batches'}.
+        '''
+        header, rows = self._source_rows(source)
+        directory = self.path or tempfile.mkdtemp(prefix='marketo_import_')
+        os.makedirs(directory, exist_ok=True)
+        self.batches = []
+        chunks = self.chunks(header, rows, directory)
+        retry = deque()
+        uploads, active, fetches = {}, {}, {}
+        queue_full = False
+        delay = self.poll_interval
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+                while True:
+                    changed = False
+                    while not queue_full and len(uploads) + len(active) < self.max_jobs:
+                        batch = retry.popleft() if retry else next(chunks, None)
+                        if batch is None:
+                            break
+                        batch['status'] = 'Uploading'
+                        uploads[executor.submit(self._upload, batch)] = batch
+
+                    for future in [future for future in uploads if future.done()]:
+                        batch = uploads.pop(future)
+                        try:
+                            batch.update(future.result())
+                        except MarketoException as e:
+                            if e.code == '1016':
+                                # too many imports in Marketo's queue; upload again after the next poll
+                                print('Marketo: import queue full, waiting ({})'.format(e.message))
+                                batch['status'] = 'Pending'
+                                retry.appendleft(batch)
+                                queue_full = True
+                                continue
+                            batch.update(status='Failed', message=e.message)
+                            changed = True
+                            continue
+                        changed = True
+                        print('uploaded import batch: [{}] {} rows'.format(batch['batchId'], batch['rows']))
+                        active[batch['batchId']] = batch
+
+                    for batch_id, batch in list(active.items()):
+                        status = self.client.get_import_lead_status(batch_id)[0]
+                        changed = changed or status['status'] != batch['status']
+                        batch.update(status)
+                        if status['status'] in IMPORT_DONE_STATUSES:
+                            del active[batch_id]
+                            fetches[executor.submit(self._fetch_files, batch)] = batch
+
+                    for future in [future for future in fetches if future.done()]:
+                        batch = fetches.pop(future)
+                        changed = True
+                        batch.update(future.result())
+
+                    if not uploads and not active and not fetches and not retry:
+                        break
+
+                    delay = self.poll_interval if changed else min(delay * self.poll_multiplier,
+                                                                   self.max_poll_interval)
+                    if uploads or fetches:
+                        wait(list(uploads) + list(fetches), timeout=delay, return_when=FIRST_COMPLETED)
+                    else:
+                        self.sleep(delay)
+                        queue_full = False
+            return self._write(header, output)
+        finally:
+            if not self.keep_files:
+                for batch in self.batches:
+                    if os.path.exists(batch['filename']):
+                        os.remove(batch['filename'])
+                if self.path is None:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+    def _write(self, header, output):
+        counts = {'imported': 0, 'warning': 0, 'failed': 0}
+        part_name = output + '.part'
+        with open(part_name, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(header + ['importStatus', 'importMessage'])
+            for batch in self.batches:
+                matchers = []
+                for status, key in (('failed', 'failures'), ('warning', 'warnings')):
+                    columns, messages = batch.pop(key, ([], {}))
+                    indexes = [header.index(column) for column in columns if column in header]
+                    matchers.append((status, indexes, messages))
+                with open(batch['filename'], 'r', newline='', encoding='utf-8') as chunk:
+                    reader = csv.reader(chunk)
+                    next(reader)
+                    for row in reader:
+                        status, message = 'imported', ''
+                        if batch['status'] != 'Complete':
+                            status, message = 'failed', batch.get('message') or batch['status']
+                        else:
+                            for matcher_status, indexes, messages in matchers:
+                                found = messages.get(tuple(row[i] for i in indexes))
+                                if found:
+                                    status, message = matcher_status, found.popleft()
+                                    break
+                        counts[status] += 1
+                        writer.writerow(row + [status, message])
+        os.replace(part_name, output)
+        return {'filename': output, 'rows': sum(counts.values()), 'imported': counts['imported'],
+                'warnings': counts['warning'], 'failed': counts['failed'], 'batches': self.batches}
@@ -0,0 +1,190 @@
+import csv
+import heapq
+import itertools
+import os
+
+from datetime import datetime, timedelta, timezone
+
+from dateutil import tz
+
+from marketorestpython.helper.csv_join import _sort_key, external_sort
+from marketorestpython.planner import label_file_name
+from marketorestpython.reader import _parse_datetime
+from marketorestpython.scheduler import BulkExportScheduler
+
+
+# date filter of an incremental export by table: leads and program members by last update, activities by creation
+INCREMENTAL_FILTERS = {
+    'leads': 'updatedAt',
+    'activities': 'createdAt',
+    'program/members': 'updatedAt',
+}
+# column holding the filtered date, where it isn't named after the filter
+TIMESTAMP_COLUMNS = {
+    ('activities', 'createdAt'): 'activityDate',
+}
+# column identifying a record of each table
+RECORD_KEYS = {
+    'leads': 'id',
+    'activities': 'marketoGUID',
+    'program/members': 'leadId',
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _aware(dt):
+    # naive datetimes are local time, as in MarketoClientBatch._get_isodate
+    return dt.replace(tzinfo=tz.tzlocal()) if dt.tzinfo is None else dt
+
+
+def _stamp(value):
+    ''' sort key of a timestamp cell; empty cells come first '''
+    return _aware(_parse_datetime(value)) if value else EPOCH
+
+
+class IncrementalExport:
+    '''
+    Exports the records of a table changed since the last run, keeping a high-water mark per table (and filter)
+    in the client's ledger.
+
+    Each run exports from the watermark minus overlap up to now (split into windows of at most days days) with a
+    BulkExportScheduler, then merges the window files into one file deduplicated on key: a record exported twice
+    is written once, with its latest version, and records the previous run already wrote (same key and same
+    timestamp, in its overlap) are left out. The watermark only advances once that file is complete, so a failed
+    or interrupted run is simply repeated by the next one.
+
+    filter_field: the date filter (updatedAt for leads and program members, createdAt for activities)
+    timestamp_column: the column holding that date (activityDate for activities, otherwise the filter's name)
+    key: the column identifying a record (id, marketoGUID for activities, leadId for program members)
+    filter: other filters, e.g. {'programId': 1001} or {'activityTypeIds': [1, 6]}
+    fields: exported fields, by default the standard fields of the table; key and timestamp_column are added
+    keep_files: keep the window files after merging them
+    Other keyword arguments (max_queue, poll_interval, daily_quota, ...) are passed on to the scheduler.
+    '''
+    def __init__(self, client, table='leads', fields=None, filter_field=None, overlap=timedelta(hours=1),
+                 filter=None, key=None, timestamp_column=None, path=None, days=30, keep_files=False, **kwargs):
+        self.client = client
+        self.table = table
+        self.fields = fields
+        self.filter_field = filter_field or INCREMENTAL_FILTERS.get(table, 'updatedAt')
+        self.overlap = overlap
+        self.filter = dict(filter or {})
+        self.key = key or RECORD_KEYS.get(table, 'id')
+        self.timestamp_column = timestamp_column or TIMESTAMP_COLUMNS.get((table, self.filter_field),
+                                                                          self.filter_field)
+        self.path = path
+        self.days = days
+        self.keep_files = keep_files
+        self.kwargs = kwargs
+        self.scope = client._bulk_scope(table, self.filter)
+
+    @property
+    def watermark_key(self):
+        return '{}:{}'.format(self.scope, self.filter_field)
+
+    def watermark(self):
+        ''' the current high-water mark, or None before the first run '''
+        saved = self.client.ledger.get_watermark(self.watermark_key)
+        return saved['watermark'] if saved else None
+
+    def windows(self, start_dt, end_dt):
+        windows = []
+        while start_dt < end_dt:
+            step_dt = min(start_dt + timedelta(self.days), end_dt)
+            windows.append((start_dt, step_dt))
+            start_dt = step_dt
+        return windows
+
+    def _label(self, start_dt, end_dt):
+        return '{}:{}:{}'.format(self.scope, start_dt.strftime('%Y%m%dT%H%M%S'), end_dt.strftime('%Y%m%dT%H%M%S'))
+
+    def _fields(self):
+        fields = self.fields if self.fields is not None else self.client._bulk_fields(self.table)
+        if fields is None:
+            return None
+        return list(fields) + [field for field in (self.key, self.timestamp_column) if field not in fields]
+
+    def run(self, start_dt=None, end_dt=None):
+        '''
+        exports the changes since the watermark (or since start_dt, which the first run needs) up to end_dt
+        (default: now) and advances the watermark to end_dt. Returns {'filename', 'numberOfRecords',
+        'duplicates', 'start', 'end', 'jobs'}, or None when there is nothing to export.
+        '''
+        saved = self.client.ledger.get_watermark(self.watermark_key)
+        if saved is not None:
+            start_dt = saved['watermark'] - self.overlap
+        elif start_dt is None:
+            raise ValueError("Invalid argument: start_dt is required for the first run of {}.".format(
+                self.watermark_key))
+        start_dt = _aware(start_dt)
+        end_dt = _aware(end_dt) if end_dt is not None else datetime.now(timezone.utc)
+        windows = self.windows(start_dt, end_dt)
+        if not windows:
+            return None
+
+        scheduler = BulkExportScheduler(self.client, table=self.table, fields=self._fields(), path=self.path,
+                                        **self.kwargs)
+        for window_start, window_end in windows:
+            window_filter = dict(self.filter)
+            window_filter[self.filter_field] = {'startAt': window_start.isoformat(),
+                                                'endAt': window_end.isoformat()}
+            scheduler.add(window_filter, label=self._label(window_start, window_end))
+        jobs = scheduler.run()
+        failed = [job for job in jobs if job['status'] != 'Downloaded']
+        if failed:
+            raise Exception("{} of {} exports didn't complete ({}), the watermark of {} stays at {}".format(
+                len(failed), len(jobs), ', '.join(sorted(set(job['status'] for job in failed))),
+                self.watermark_key, saved['watermark'] if saved else None))
+
+        file_name = label_file_name(self._label(start_dt, end_dt), self.path)
+        previous = saved.get('keys', {}) if saved else {}
+        count, duplicates, keys = self.merge([job['filename'] for job in jobs], file_name, previous,
+                                             end_dt - self.overlap)
+        self.client.ledger.set_watermark(self.watermark_key, end_dt, {
+            'keys': keys, 'filename': file_name, 'numberOfRecords': count, 'start': start_dt})
+        if not self.keep_files:
+            for job in jobs:
+                os.remove(job['filename'])
+        return {'filename': file_name, 'numberOfRecords': count, 'duplicates': duplicates, 'start': start_dt,
+                'end': end_dt, 'jobs': jobs}
+
+    def merge(self, file_names, output, previous, boundary):
+        '''
+        merges export files into output, one row per key: the row with the latest timestamp, left out when
+        previous ({key: timestamp} of the last run's overlap) holds the same timestamp. Returns (rows written,
+        rows left out, {key: timestamp} of the rows from boundary on).
+        '''
+        sources = []
+        for file_name in file_names:
+            header, rows = external_sort(file_name, key=self.key, tmp_dir=self.path)
+            if header:
+                sources.append((header, rows))
+        count = duplicates = 0
+        keys = {}
+        part_name = output + '.part'
+        with open(part_name, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            if sources:
+                header = sources[0][0]
+                key_index, stamp_index = header.index(self.key), header.index(self.timestamp_column)
+                writer.writerow(header)
+
+                def keyed(rows):
+                    for row in rows:
+                        yield _sort_key(row[key_index]), row
+                merged = heapq.merge(*[keyed(rows) for _, rows in sources], key=lambda item: item[0])
+                for _, group in itertools.groupby(merged, key=lambda item: item[0]):
+                    versions = [row for _, row in group]
+                    row = max(versions, key=lambda row: _stamp(row[stamp_index]))
+                    duplicates += len(versions) - 1
+                    key, stamp = row[key_index], row[stamp_index]
+                    if _stamp(stamp) >= boundary:
+                        # the next run exports these again
+                        keys[key] = stamp
+                    if previous.get(key) == stamp:
+                        duplicates += 1
+                        continue
+                    writer.writerow(row)
+                    count += 1
+        os.replace(part_name, output)
+        return count, duplicates, keys
@@ -0,0 +1,67 @@
+import threading
+import time
+
+
+# statuses an export job can still move on from by itself; Created jobs only change when someone enqueues them
+ACTIVE_STATUSES = ('Queued', 'Processing')
+TERMINAL_STATUSES = ('Completed', 'Failed', 'Cancelled')
+
+
+class BulkJobCache:
+    '''
+    A local view of the export jobs of a table: what is created, queued, processing, completed...
+
+    refresh() lists every job (all pages of get_bulk_jobs) the first time and again every max_age seconds, to
+    pick up jobs created or enqueued elsewhere; in between it only asks status_bulk_job about the queued and
+    processing jobs, the only ones whose status changes without a call from us. Jobs this process creates or
+    enqueues are added with update(), so they're known without listing them again.
+    '''
+    def __init__(self, client, table='leads', max_age=300, clock=time.time):
+        self.client = client
+        self.table = table
+        self.max_age = max_age
+        self.clock = clock
+        self.listed_at = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def update(self, job):
+        ''' merges a job (as returned by create/enqueue/status) into the cache; returns True if its status changed '''
+        with self._lock:
+            cached = self._jobs.setdefault(job['exportId'], {})
+            changed = cached.get('status') != job.get('status')
+            cached.update(job)
+            return changed
+
+    def refresh(self, full=False):
+        ''' brings the cache up to date; returns the export ids of the jobs whose status changed '''
+        changed = []
+        if full or self.listed_at is None or self.clock() - self.listed_at >= self.max_age:
+            self.listed_at = self.clock()
+            for page in self.client.get_bulk_jobs_yield(table=self.table):
+                for job in page:
+                    if self.update(job):
+                        changed.append(job['exportId'])
+            return changed
+        for export_id in [job['exportId'] for job in self.jobs(ACTIVE_STATUSES)]:
+            if self.update(self.client.status_bulk_job(export_id, table=self.table)[0]):
+                changed.append(export_id)
+        return changed
+
+    def get(self, export_id):
+        with self._lock:
+            job = self._jobs.get(export_id)
+            return dict(job) if job is not None else None
+
+    def jobs(self, status=None):
+        ''' the cached jobs, optionally only those with status (a string or a list of statuses) '''
+        statuses = [status] if isinstance(status, str) else status
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if statuses is None or job.get('status') in statuses]
+
+    def counts(self):
+        ''' {status: number of jobs} '''
+        counts = {}
+        for job in self.jobs():
+            counts[job.get('status')] = counts.get(job.get('status'), 0) + 1
+        return counts
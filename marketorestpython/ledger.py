@@ -0,0 +1,254 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from datetime import datetime
+
+
+# Marketo job fields that get their own (indexed) column; every field is also kept in the row's JSON data
+EXPORT_COLUMNS = {
+    'status': 'status',
+    'table': 'table_name',
+    'format': 'format',
+    'fileSize': 'file_size',
+    'numberOfRecords': 'number_of_records',
+    'filename': 'filename',
+    'name': 'name',
+    'batch': 'batch',
+}
+DATETIME_FIELDS = ('start', 'end', 'requested', 'startAt', 'endAt', 'watermark')
+
+
+def _encode(value):
+    def default(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return str(obj)
+    return json.dumps(value, default=default)
+
+
+def _decode(text):
+    value = json.loads(text)
+    for key in DATETIME_FIELDS:
+        if isinstance(value.get(key), str):
+            try:
+                value[key] = datetime.fromisoformat(value[key])
+            except ValueError:
+                pass
+    return value
+
+
+class JobLedger:
+    '''
+    Bulk export job state for MarketoClientBatch, in SQLite (WAL mode, so readers don't block the writer).
+
+    Every export is one row, updated in place by update_export; the status and download state are indexed, so
+    updates and lookups take the same time however many exports the ledger holds. Calls (the responses of
+    create/enqueue/retrieve) are appended to their own table. Batches are the date ranges run_batch split a
+    request into. Watermarks are the high-water marks of incremental exports (see incremental.py).
+    '''
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS exports (export_id TEXT PRIMARY KEY, table_name TEXT, '
+                     'status TEXT, format TEXT, file_size INTEGER, number_of_records INTEGER, filename TEXT, '
+                     'name TEXT, batch TEXT, updated_at REAL, data TEXT NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS exports_status ON exports (status, table_name)')
+        conn.execute('CREATE INDEX IF NOT EXISTS exports_not_downloaded ON exports (status, table_name) '
+                     'WHERE filename IS NULL')
+        conn.execute('CREATE TABLE IF NOT EXISTS calls (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                     'export_id TEXT NOT NULL, recorded_at REAL NOT NULL, data TEXT NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS calls_export_id ON calls (export_id)')
+        conn.execute('CREATE TABLE IF NOT EXISTS batches (label TEXT PRIMARY KEY, export_id TEXT, '
+                     'data TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, created_at REAL NOT NULL, '
+                     'data TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS watermarks (key TEXT PRIMARY KEY, watermark TEXT NOT NULL, '
+                     'updated_at REAL NOT NULL, data TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --------- exports ---------
+    @staticmethod
+    def _update_export(conn, export_id, values):
+        row = conn.execute('SELECT data FROM exports WHERE export_id = ?', (export_id,)).fetchone()
+        record = _decode(row[0]) if row else {'exportId': export_id}
+        record.update(values)
+        columns = {column: record.get(field) for field, column in EXPORT_COLUMNS.items()}
+        names = ['export_id', 'updated_at', 'data'] + list(columns)
+        # an upsert keeps the row (and its rowid, the insertion order) in place
+        conn.execute('INSERT INTO exports ({}) VALUES ({}) ON CONFLICT (export_id) DO UPDATE SET {}'.format(
+            ', '.join(names), ', '.join('?' * len(names)),
+            ', '.join('{0} = excluded.{0}'.format(name) for name in names[1:])),
+            [export_id, time.time(), _encode(record)] + list(columns.values()))
+        return record
+
+    def update_export(self, export_id, values):
+        ''' merges values (Marketo job fields, filename, ...) into the export's row; returns the whole record '''
+        return self._transaction(lambda conn: self._update_export(conn, export_id, values))
+
+    def get_export(self, export_id):
+        row = self._connection().execute('SELECT data FROM exports WHERE export_id = ?', (export_id,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def _select(self, where, params):
+        query = 'SELECT data FROM exports'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        return [_decode(row[0]) for row in self._connection().execute(query + ' ORDER BY rowid', params)]
+
+    def exports(self, status=None, table=None):
+        ''' exports, optionally only those with status (a string or a list) for table '''
+        where, params = [], []
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else list(status)
+            where.append('status IN ({})'.format(', '.join('?' * len(statuses))))
+            params.extend(statuses)
+        if table is not None:
+            where.append('table_name = ?')
+            params.append(table)
+        return self._select(where, params)
+
+    def not_downloaded(self, table=None):
+        ''' Completed exports that have no file yet '''
+        where, params = ["status = 'Completed'", 'filename IS NULL'], []
+        if table is not None:
+            where.append('table_name = ?')
+            params.append(table)
+        return self._select(where, params)
+
+    # --------- calls ---------
+    @staticmethod
+    def _add_call(conn, export_id, call):
+        conn.execute('INSERT INTO calls (export_id, recorded_at, data) VALUES (?, ?, ?)',
+                     (export_id, time.time(), _encode(call)))
+
+    def add_call(self, export_id, call):
+        self._transaction(lambda conn: self._add_call(conn, export_id, call))
+
+    def calls(self, export_id):
+        return [_decode(row[0]) for row in self._connection().execute(
+            'SELECT data FROM calls WHERE export_id = ? ORDER BY id', (export_id,))]
+
+    # --------- batches ---------
+    @staticmethod
+    def _update_batch(conn, label, values):
+        row = conn.execute('SELECT data FROM batches WHERE label = ?', (label,)).fetchone()
+        record = _decode(row[0]) if row else {}
+        record.update(values)
+        conn.execute('INSERT INTO batches (label, export_id, data) VALUES (?, ?, ?) ON CONFLICT (label) '
+                     'DO UPDATE SET export_id = excluded.export_id, data = excluded.data',
+                     (label, record.get('export_id'), _encode(record)))
+        return record
+
+    def update_batch(self, label, values):
+        return self._transaction(lambda conn: self._update_batch(conn, label, values))
+
+    def get_batch(self, label):
+        row = self._connection().execute('SELECT data FROM batches WHERE label = ?', (label,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def batches(self):
+        return {label: _decode(data) for label, data in self._connection().execute(
+            'SELECT label, data FROM batches ORDER BY rowid')}
+
+    # --------- plans ---------
+    def save_plan(self, key, windows):
+        ''' stores a list of (start, end) datetime windows under key '''
+        data = _encode([[start, end] for start, end in windows])
+        self._transaction(lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO plans (key, created_at, data) VALUES (?, ?, ?)', (key, time.time(), data)))
+
+    def get_plan(self, key):
+        row = self._connection().execute('SELECT data FROM plans WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return [(datetime.fromisoformat(start), datetime.fromisoformat(end)) for start, end in json.loads(row[0])]
+
+    # --------- watermarks ---------
+    def set_watermark(self, key, watermark, values=None):
+        ''' stores the high-water mark (a datetime) of an incremental export, with values kept alongside it '''
+        record = dict(values or {}, watermark=watermark)
+        self._transaction(lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO watermarks (key, watermark, updated_at, data) VALUES (?, ?, ?, ?)',
+            (key, watermark.isoformat(), time.time(), _encode(record))))
+        return record
+
+    def get_watermark(self, key):
+        ''' the record stored by set_watermark ('watermark' plus its values), or None '''
+        row = self._connection().execute('SELECT data FROM watermarks WHERE key = ?', (key,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    # --------- compatibility ---------
+    def to_dict(self):
+        ''' the ledger in the layout of the old pickle: {'batches': {...}, export_id: {..., 'calls': [...]}} '''
+        data = {'requests': {}, 'batches': self.batches()}
+        # one query for the exports and their calls, rather than one per export
+        rows = self._connection().execute(
+            'SELECT exports.export_id, exports.data, calls.data FROM exports LEFT JOIN calls '
+            'ON calls.export_id = exports.export_id ORDER BY exports.rowid, calls.id')
+        for export_id, export, call in rows:
+            if export_id not in data:
+                data[export_id] = dict(_decode(export), calls=[])
+            if call is not None:
+                data[export_id]['calls'].append(_decode(call))
+        return data
+
+    def migrate_pickle(self, pickle_name):
+        '''
+        imports the state MarketoClientBatch used to keep in a pickle file; returns the number of exports
+        imported (0 if this file was imported before). The pickle file is left as it is.
+        '''
+        key = 'migrated:' + os.path.abspath(pickle_name)
+        if self._connection().execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+            return 0
+        print('Migrating Saved Data... [%s]' % pickle_name)
+        with open(pickle_name, 'rb') as handle:
+            data = pickle.load(handle)
+
+        def migrate(conn):
+            count = 0
+            for label, batch in data.get('batches', {}).items():
+                self._update_batch(conn, label, batch)
+            for export_id, item in data.items():
+                if export_id in ('batches', 'requests'):
+                    continue
+                item = dict(item)
+                for call in item.pop('calls', []):
+                    self._add_call(conn, export_id, call)
+                self._update_export(conn, export_id, item)
+                count += 1
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (key, datetime.now().isoformat()))
+            return count
+        return self._transaction(migrate)
@@ -0,0 +1,136 @@
+import math
+import os
+import re
+
+from datetime import datetime, timedelta
+
+
+def fixed_windows(start_dt, end_dt, days):
+    ''' the windows run_batch has always used: start_dt + days, the next one starting the day after '''
+    windows = []
+    step_dt = start_dt
+    while step_dt < end_dt:
+        step_dt = min(start_dt + timedelta(days), end_dt)
+        windows.append((start_dt, step_dt))
+        start_dt = step_dt + timedelta(1)
+    return windows
+
+
+def partition_fields(fields, max_fields, key='id'):
+    '''
+    splits a field list into column groups of at most max_fields fields, each starting with the key field so the
+    exports can be joined on it afterwards; the other fields are spread evenly, in their original order
+    '''
+    others = [field for field in fields if field != key]
+    if max_fields is None or len(others) + 1 <= max_fields:
+        return [[key] + others]
+    if max_fields < 2:
+        raise ValueError("Invalid argument: max_fields needs room for the key field and at least one other.")
+    count = int(math.ceil(len(others) / float(max_fields - 1)))
+    size, extra = divmod(len(others), count)
+    groups = []
+    start = 0
+    for number in range(count):
+        end = start + size + (1 if number < extra else 0)
+        groups.append([key] + others[start:end])
+        start = end
+    return groups
+
+
+def parse_label(label):
+    ''' (table, start, end) from a run_batch label like leads:2018-01-01:2018-01-31, or None '''
+    try:
+        table, start, end = label.split(':')
+        return table, datetime.strptime(start, '%Y-%m-%d'), datetime.strptime(end, '%Y-%m-%d')
+    except (AttributeError, ValueError):
+        return None
+
+
+def label_file_name(label, path=None, extension='csv'):
+    ''' a file name for the joined export of a label, e.g. leads_2018-01-01_2018-01-31.csv '''
+    file_name = '{}.{}'.format(re.sub(r'[^\w.-]+', '_', label), extension)
+    return os.path.join(path, file_name) if path else file_name
+
+
+class ExportPlanner:
+    '''
+    Splits a date range into export windows of about target_size bytes each, based on the completed exports in
+    the ledger: their numberOfRecords per day (for the days they covered) and fileSize per record. Busy periods
+    get short windows and quiet ones get long windows (up to max_days, the longest range Marketo accepts).
+    Days no export covered yet are assumed to be as busy as the average day.
+
+    Plans are stored in the ledger; planning the same range and target again returns the stored plan, so a
+    re-run creates the same windows (and skips those already requested).
+    scope is the first part of the labels of the exports to learn from (default: the table); run_batch uses
+    the table plus its filters, so e.g. each program's members are planned on that program's exports only.
+    '''
+    def __init__(self, ledger, table='leads', target_size=100 * 1024 * 1024, max_days=31, min_days=1,
+                 scope=None):
+        self.ledger = ledger
+        self.table = table
+        self.target_size = target_size
+        self.max_days = max_days
+        self.min_days = min_days
+        self.scope = scope if scope is not None else table.lower()
+
+    def observations(self):
+        ''' (start, end, numberOfRecords, fileSize) for each completed export of the table '''
+        observations = []
+        for export in self.ledger.exports(status='Completed', table=self.table):
+            window = parse_label(export.get('name'))
+            if window is None or window[0] != self.scope:
+                continue
+            if export.get('numberOfRecords') is None or export.get('fileSize') is None:
+                continue
+            observations.append((window[1], window[2], export['numberOfRecords'], export['fileSize']))
+        return observations
+
+    def estimator(self):
+        ''' returns a function estimating the export size for one day, or None without observations '''
+        observations = self.observations()
+        records = sum(observation[2] for observation in observations)
+        if not records:
+            return None
+        bytes_per_record = sum(observation[3] for observation in observations) / records
+        total_days = sum((end - start).days + 1 for start, end, _, _ in observations)
+        average = records / total_days
+
+        def estimate(day):
+            densities = [count / ((end - start).days + 1)
+                         for start, end, count, _ in observations if start <= day <= end]
+            density = sum(densities) / len(densities) if densities else average
+            return density * bytes_per_record
+        return estimate
+
+    def plan_key(self, start_dt, end_dt):
+        return '{}:{}:{}:{}'.format(self.scope, start_dt.strftime('%Y-%m-%d'), end_dt.strftime('%Y-%m-%d'),
+                                    self.target_size)
+
+    def plan(self, start_dt, end_dt, reuse=True):
+        '''
+        list of (start, end) windows covering start_dt..end_dt (both days included), or None when there are no
+        completed exports to go by yet
+        '''
+        key = self.plan_key(start_dt, end_dt)
+        if reuse:
+            windows = self.ledger.get_plan(key)
+            if windows is not None:
+                return windows
+        estimate = self.estimator()
+        if estimate is None:
+            return None
+        windows = []
+        window_start = start_dt
+        while window_start <= end_dt:
+            window_end = window_start
+            size = estimate(window_start)
+            while window_end < end_dt and (window_end - window_start).days + 1 < self.max_days:
+                next_size = estimate(window_end + timedelta(1))
+                if size + next_size > self.target_size and (window_end - window_start).days + 1 >= self.min_days:
+                    break
+                window_end += timedelta(1)
+                size += next_size
+            windows.append((window_start, window_end))
+            window_start = window_end + timedelta(1)
+        self.ledger.save_plan(key, windows)
+        return windows
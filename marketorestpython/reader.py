@@ -0,0 +1,226 @@
+import csv
+import gzip
+import json
+import os
+import sys
+
+from datetime import datetime, date
+
+from marketorestpython.helper.csv_join import raise_field_size_limit
+
+
+# columns of an activities export, which has no describe call
+ACTIVITY_FIELDS = {
+    'marketoGUID': 'string',
+    'leadId': 'integer',
+    'activityDate': 'datetime',
+    'activityTypeId': 'integer',
+    'campaignId': 'integer',
+    'primaryAttributeValueId': 'integer',
+    'primaryAttributeValue': 'string',
+    'attributes': 'json',
+}
+
+
+if sys.version_info >= (3, 11):
+    _parse_datetime = datetime.fromisoformat
+else:
+    def _parse_datetime(value):
+        # Marketo writes UTC as 2018-01-21T11:47:30Z, which fromisoformat only accepts from Python 3.11 on
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value)
+
+
+def _parse_boolean(value):
+    return value.lower() in ('true', '1', 'yes')
+
+
+CASTS = {
+    'integer': int,
+    'reference': int,
+    'score': int,
+    'float': float,
+    'currency': float,
+    'percent': float,
+    'boolean': _parse_boolean,
+    'datetime': _parse_datetime,
+    'date': date.fromisoformat,
+    'json': json.loads,
+}
+
+# Arrow types by Marketo dataType, everything else is a string
+ARROW_TYPES = {
+    'integer': 'int64',
+    'reference': 'int64',
+    'score': 'int64',
+    'float': 'float64',
+    'currency': 'float64',
+    'percent': 'float64',
+    'boolean': 'bool_',
+    'date': 'date32',
+}
+
+
+def field_types(describe_result):
+    '''
+    {field name: dataType} from the result of describe() (leads) or describe_program_members()
+    '''
+    if describe_result and 'fields' in describe_result[0]:
+        return {field['name']: field['dataType'] for field in describe_result[0]['fields']}
+    return {field['rest']['name']: field['dataType'] for field in describe_result if 'rest' in field}
+
+
+class BulkExportReader:
+    '''
+    Streams a bulk export CSV as typed records: empty cells become None, and columns are cast by their Marketo
+    dataType (types: {column: dataType}, see field_types; columns without a type stay strings). Integers,
+    floats, booleans, dates and datetimes (timezone aware) are converted; the attributes column of an
+    activities export is decoded from JSON. A cell that can't be cast keeps its text, and is listed in errors
+    as (row number, column, value), for up to max_errors cells (error_count has them all).
+
+    batches() yields lists of at most batch_size records, so memory use depends on batch_size, not on the file
+    size. to_ndjson and to_parquet convert the whole file in one pass.
+    '''
+    def __init__(self, file_name, types=None, batch_size=10000, encoding='utf-8', max_errors=100):
+        self.file_name = file_name
+        self.types = types or {}
+        self.batch_size = batch_size
+        self.encoding = encoding
+        self.max_errors = max_errors
+        self.errors = []
+        self.error_count = 0
+
+    @classmethod
+    def for_table(cls, client, file_name, table='leads', **kwargs):
+        ''' reader with the types of table: leads and program/members are described through client '''
+        if table == 'activities':
+            types = ACTIVITY_FIELDS
+        elif table == 'program/members':
+            types = field_types(client.describe_program_members())
+        else:
+            types = field_types(client.describe())
+        return cls(file_name, types, **kwargs)
+
+    def _casts(self, header):
+        return [CASTS.get(self.types.get(column)) for column in header]
+
+    def column_types(self, header):
+        return [self.types.get(column, 'string') for column in header]
+
+    def _rows(self):
+        raise_field_size_limit()
+        with open(self.file_name, 'r', newline='', encoding=self.encoding) as handle:
+            reader = csv.reader(handle)
+            header = next(reader, None)
+            if header is None:
+                return
+            yield header
+            yield from reader
+
+    def batches(self, columns=False):
+        '''
+        yields lists of records (dicts); with columns=True, dicts of {column: list of values} instead
+        '''
+        rows = self._rows()
+        header = next(rows, None)
+        if header is None:
+            return
+        typed = [(i, cast) for i, cast in enumerate(self._casts(header)) if cast is not None]
+        self.errors = []
+        self.error_count = 0
+        batch = []
+        for number, row in enumerate(rows, 1):
+            row = [value or None for value in row]
+            for i, cast in typed:
+                if row[i] is not None:
+                    try:
+                        row[i] = cast(row[i])
+                    except ValueError:
+                        # one bad cell keeps its text rather than stopping the whole export
+                        self.error_count += 1
+                        if len(self.errors) < self.max_errors:
+                            self.errors.append((number, header[i], row[i]))
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield self._batch(header, batch, columns)
+                batch = []
+        if batch:
+            yield self._batch(header, batch, columns)
+
+    @staticmethod
+    def _batch(header, rows, columns):
+        if columns:
+            return {column: [row[i] for row in rows] for i, column in enumerate(header)}
+        return [dict(zip(header, row)) for row in rows]
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def header(self):
+        rows = self._rows()
+        try:
+            return next(rows, [])
+        finally:
+            rows.close()
+
+    def to_ndjson(self, output, compress=True, compresslevel=6):
+        '''
+        writes one JSON object per line (gzip compressed unless compress is False, at compresslevel); dates are
+        written in ISO format. The file is written to output + '.part' and renamed when complete. Returns the record count.
+        '''
+        def default(value):
+            if isinstance(value, (datetime, date)):
+                return value.isoformat()
+            raise TypeError(value)
+
+        encode = json.JSONEncoder(default=default).encode
+        count = 0
+        part_name = output + '.part'
+        if compress:
+            handle = gzip.open(part_name, 'wt', encoding='utf-8', compresslevel=compresslevel)
+        else:
+            handle = open(part_name, 'w', encoding='utf-8')
+        with handle:
+            for batch in self.batches():
+                handle.writelines(encode(record) + '\n' for record in batch)
+                count += len(batch)
+        os.replace(part_name, output)
+        return count
+
+    def arrow_schema(self, header):
+        import pyarrow  # optional dependency, only needed for Parquet/Arrow output
+        fields = []
+        for column, data_type in zip(header, self.column_types(header)):
+            if data_type == 'datetime':
+                arrow_type = pyarrow.timestamp('us', tz='UTC')
+            else:
+                arrow_type = getattr(pyarrow, ARROW_TYPES.get(data_type, 'string'))()
+            fields.append(pyarrow.field(column, arrow_type))
+        return pyarrow.schema(fields)
+
+    def to_parquet(self, output, compression='snappy', block_size=16 * 1024 * 1024):
+        '''
+        writes the records to a Parquet file (requires pyarrow). The CSV is parsed by pyarrow's streaming CSV
+        reader in blocks of block_size bytes (one row group each), with the column types from arrow_schema; JSON
+        columns are kept as strings. Written to output + '.part' and renamed when complete; returns the record
+        count.
+        '''
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        header = self.header()
+        schema = self.arrow_schema(header)
+        read_options = pyarrow.csv.ReadOptions(block_size=block_size, encoding=self.encoding)
+        convert_options = pyarrow.csv.ConvertOptions(column_types=schema, strings_can_be_null=True,
+                                                     true_values=['true', '1'], false_values=['false', '0'])
+        count = 0
+        part_name = output + '.part'
+        reader = pyarrow.csv.open_csv(self.file_name, read_options=read_options, convert_options=convert_options)
+        with pyarrow.parquet.ParquetWriter(part_name, schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_table(pyarrow.Table.from_batches([batch], schema=schema))
+                count += batch.num_rows
+        os.replace(part_name, output)
+        return count
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+from marketorestpython.batch import BULK_DATE_FILTERS
+from marketorestpython.helper.csv_join import join_csv
+from marketorestpython.helper.exceptions import MarketoException
+from marketorestpython.helper.quota import MemoryQuotaBackend, quota_day
+from marketorestpython.job_cache import BulkJobCache, ACTIVE_STATUSES
+from marketorestpython.planner import partition_fields, label_file_name
+
+
+WAITING_STATUSES = ('Pending', 'Created')
+
+
+def next_quota_reset(now):
+    ''' timestamp of the next midnight CST, when Marketo resets the daily quotas (see quota_day) '''
+    day = 24 * 3600
+    return ((now - 6 * 3600) // day + 1) * day + 6 * 3600
+
+
+class BulkExportScheduler:
+    '''
+    Runs bulk export jobs from start to end: creates them, enqueues them as soon as the export queue has room,
+    polls their status and downloads completed files while the other jobs are still processing.
+
+    client: a MarketoClientBatch
+    max_queue: jobs Marketo accepts in its queue (queued + processing, shared with other users of the instance)
+    download_workers: completed files downloaded at the same time
+    daily_quota: bytes that may be exported per day (Marketo's default is 500 MB). Exported bytes are counted in
+    the client's quota backend, so processes sharing a backend share the quota; jobs are only enqueued while
+    the bytes used plus the expected size of the jobs in the queue stay under it
+    wait_for_quota: when the quota is used up, wait for the reset at midnight CST instead of returning with the
+    remaining jobs still waiting
+    poll_interval, max_poll_interval, poll_multiplier: status polls start every poll_interval seconds and back
+    off up to max_poll_interval while nothing changes
+    path, segments, chunk_size: passed on to retrieve_bulk_job
+    on_complete: called with the job dict after each download
+    list_interval: seconds between full listings of the export jobs (to see the queue of other users); between
+    them each poll only asks for the status of the queued and processing jobs (see BulkJobCache)
+    Jobs added with max_fields are split into column groups; once all groups of a window are downloaded, their
+    files are joined on id into one file named after the label (the jobs get its name as 'joined').
+
+    Every create, enqueue, status change, download and join is recorded in the client's ledger (each job under
+    a batch keyed by its label, filter and fields), so adding the same jobs to a new scheduler after a crash or a
+    restart picks them up where they were: exports already created aren't created again, and files already
+    downloaded aren't downloaded again.
+    '''
+    def __init__(self, client, table='leads', fields=None, format='CSV', path=None, max_queue=10,
+                 download_workers=2, daily_quota=500 * 1024 * 1024, wait_for_quota=False, poll_interval=5,
+                 max_poll_interval=60, poll_multiplier=2, segments=1, chunk_size=None, on_complete=None,
+                 list_interval=300, clock=time.time, sleep=time.sleep):
+        self.client = client
+        self.table = table
+        self.fields = fields
+        self.format = format
+        self.path = path
+        self.max_queue = max_queue
+        self.download_workers = download_workers
+        self.daily_quota = daily_quota
+        self.wait_for_quota = wait_for_quota
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_multiplier = poll_multiplier
+        self.segments = segments
+        self.chunk_size = chunk_size
+        self.on_complete = on_complete
+        self.clock = clock
+        self.sleep = sleep
+        self.quota_backend = client.quota_backend if client.quota_backend is not None else MemoryQuotaBackend()
+        self.quota_key = '{}:export_bytes'.format(client.munchkin_id)
+        self.ledger = client.ledger
+        self.jobs = []
+        self.quota_exhausted = False
+        # job statuses, listed in full every list_interval seconds and otherwise polled only for active jobs
+        self.cache = BulkJobCache(client, table, max_age=list_interval, clock=clock)
+
+    def add(self, filter, fields=None, label=None, max_fields=None):
+        '''
+        adds an export job (one per column group with max_fields); it is created and enqueued by run(), unless
+        the ledger has it from an earlier run, which it then continues. Returns the list of jobs added.
+        '''
+        fields = fields if fields is not None else self.fields
+        groups = partition_fields(fields, max_fields) if max_fields and fields else [fields]
+        jobs = []
+        for number, group_fields in enumerate(groups):
+            job = {
+                'label': label,
+                'filter': filter,
+                'fields': group_fields,
+                'exportId': None,
+                'status': 'Pending',
+            }
+            if len(groups) > 1:
+                job.update(group=number, groups=len(groups))
+            job['key'] = self._job_key(job)
+            self._resume(job)
+            jobs.append(job)
+        self.jobs.extend(jobs)
+        return jobs
+
+    def add_date_range(self, start_dt, end_dt, days=30, filter_field=None, filter=None, max_fields=None):
+        '''
+        adds one job per days days between start_dt and end_dt (both included), filtered on filter_field
+        (by default createdAt, or updatedAt for program members) and on the other filters in filter
+        '''
+        filter_field = filter_field or BULK_DATE_FILTERS.get(self.table, 'createdAt')
+        jobs = []
+        while start_dt <= end_dt:
+            step_dt = min(start_dt + timedelta(days - 1), end_dt)
+            label = '{}:{}:{}'.format(self.client._bulk_scope(self.table, filter), start_dt.strftime("%Y-%m-%d"),
+                                      step_dt.strftime("%Y-%m-%d"))
+            jobs.extend(self.add(self.client._bulk_filter(self.table, start_dt, step_dt, filter_field, filter),
+                                 label=label, max_fields=max_fields))
+            start_dt = step_dt + timedelta(1)
+        return jobs
+
+    def _job_key(self, job):
+        ''' the ledger batch label of a job: the same window and fields always get the same one '''
+        data = json.dumps([job['filter'], job['fields']], sort_keys=True, default=str)
+        digest = hashlib.sha1(data.encode('utf-8'))
+        return 'scheduler:{}:{}:{}'.format(self.table, job['label'] or '', digest.hexdigest()[:12])
+
+    def _resume(self, job):
+        ''' takes over the state of the job's export from the ledger, if an earlier run created it '''
+        saved = self.ledger.get_batch(job['key'])
+        export = self.ledger.get_export(saved['export_id']) if saved and saved.get('export_id') else None
+        if export is None:
+            return
+        job.update((key, value) for key, value in export.items() if key not in ('name', 'batch', 'table'))
+        if job.get('filename'):
+            job['status'] = 'Downloaded'
+        elif job['status'] in ACTIVE_STATUSES:
+            self.cache.update({'exportId': job['exportId'], 'status': job['status']})
+
+    def _record(self, job, call=None):
+        ''' saves the job in the ledger (with the Marketo response call, if any) '''
+        values = {key: value for key, value in job.items() if key not in ('label', 'filter', 'fields', 'key')}
+        # the ledger keeps Marketo's status; a downloaded job is a Completed export with a filename
+        if values['status'] == 'Downloaded':
+            values['status'] = 'Completed'
+        values.update(name=job['label'], batch='scheduler', table=self.table)
+        self.ledger.update_export(job['exportId'], values)
+        if call is not None:
+            self.ledger.add_call(job['exportId'], call)
+
+    def bytes_used(self):
+        return self.quota_backend.get_daily(self.quota_key, quota_day(self.clock()))
+
+    def _expected_size(self):
+        sizes = [job['fileSize'] for job in self.jobs if job.get('fileSize') is not None]
+        return sum(sizes) / len(sizes) if sizes else 0
+
+    def _queue_occupancy(self):
+        return len(self.cache.jobs(ACTIVE_STATUSES))
+
+    def _fill(self, active):
+        ''' creates and enqueues waiting jobs while the queue has room; returns True if any job was enqueued '''
+        waiting = [job for job in self.jobs if job['status'] in WAITING_STATUSES]
+        if not waiting or len(active) >= self.max_queue:
+            return False
+        room = self.max_queue - self._queue_occupancy()
+        enqueued = False
+        for job in waiting:
+            if room <= 0:
+                break
+            if self.daily_quota is not None and \
+                    self.bytes_used() + (len(active) + 1) * self._expected_size() > self.daily_quota:
+                self.quota_exhausted = True
+                break
+            try:
+                if job['exportId'] is None:
+                    result = self.client.create_bulk_extract(table=self.table, fields=job['fields'],
+                                                             filter=job['filter'], format=self.format)
+                    job.update(result[0])
+                    self.cache.update(result[0])
+                    self.ledger.update_batch(job['key'], {'requested': datetime.now(), 'table': self.table,
+                                                          'filter': job['filter'], 'export_id': job['exportId']})
+                    self._record(job, result[0])
+                result = self.client.start_bulk_job(job['exportId'], table=self.table)
+            except MarketoException as e:
+                if e.code == '1029':
+                    # too many jobs in the queue, or the export quota is used up
+                    print('Marketo: unable to enqueue {}: {}'.format(job['exportId'], e.message))
+                    if 'quota' in (e.message or '').lower():
+                        self.quota_exhausted = True
+                    break
+                job['status'] = 'Failed'
+                job['error'] = e
+                if job['exportId'] is not None:
+                    self._record(job)
+                continue
+            job.update(result[0])
+            self.cache.update(result[0])
+            self._record(job, result[0])
+            active[job['exportId']] = job
+            print('enqueued export: [{}] {}'.format(job['exportId'], job['label'] or ''))
+            room -= 1
+            enqueued = True
+        return enqueued
+
+    def _download(self, job):
+        return self.client.retrieve_bulk_job(job['exportId'], format=job['format'].lower(), table=self.table,
+                                             file_size=job.get('fileSize'), segments=self.segments,
+                                             chunk_size=self.chunk_size, path=self.path)
+
+    def _groups_to_join(self, job):
+        ''' the jobs of job's window once all its column groups are downloaded, else None '''
+        if 'groups' not in job:
+            return None
+        jobs = [other for other in self.jobs if other['label'] == job['label'] and 'groups' in other]
+        if len(jobs) == job['groups'] and all(other['status'] == 'Downloaded' for other in jobs):
+            return sorted(jobs, key=lambda other: other['group'])
+        return None
+
+    def _join(self, jobs):
+        file_name = label_file_name(jobs[0]['label'] or jobs[0]['exportId'], self.path)
+        join_csv([job['filename'] for job in jobs], file_name)
+        return file_name
+
+    def run(self):
+        '''
+        runs until every job is downloaded, failed or cancelled (or until the daily quota is used up, unless
+        wait_for_quota is set) and returns the jobs
+        '''
+        active = {job['exportId']: job for job in self.jobs if job['status'] in ACTIVE_STATUSES}
+        downloads = {}
+        joins = {}
+        delay = self.poll_interval
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            # an earlier run may have stopped before downloading completed jobs, or before joining their groups
+            for job in self.jobs:
+                if job['status'] == 'Completed':
+                    downloads[executor.submit(self._download, job)] = job
+            joining = set()
+            for job in self.jobs:
+                group = self._groups_to_join(job)
+                if group is not None and not job.get('joined') and job['label'] not in joining:
+                    joining.add(job['label'])
+                    joins[executor.submit(self._join, group)] = group
+            while True:
+                changed = False
+                self.cache.refresh()
+                for export_id, job in list(active.items()):
+                    status = self.cache.get(export_id)
+                    moved = status['status'] != job['status']
+                    job.update(status)
+                    if moved:
+                        changed = True
+                        self._record(job)
+                    if status['status'] in ACTIVE_STATUSES:
+                        continue
+                    del active[export_id]
+                    if status['status'] == 'Completed':
+                        self.quota_backend.incr_daily(self.quota_key, quota_day(self.clock()),
+                                                      status.get('fileSize') or 0)
+                        downloads[executor.submit(self._download, job)] = job
+
+                for future in [future for future in downloads if future.done()]:
+                    job = downloads.pop(future)
+                    changed = True
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        job['error'] = e
+                        continue
+                    job.update(result)
+                    job['status'] = 'Downloaded'
+                    self._record(job, result)
+                    if self.on_complete is not None:
+                        self.on_complete(job)
+                    group = self._groups_to_join(job)
+                    if group is not None:
+                        joins[executor.submit(self._join, group)] = group
+
+                for future in [future for future in joins if future.done()]:
+                    group = joins.pop(future)
+                    changed = True
+                    for job in group:
+                        try:
+                            job['joined'] = future.result()
+                        except Exception as e:
+                            job['error'] = e
+                            continue
+                        self._record(job)
+
+                self.quota_exhausted = False
+                changed = self._fill(active) or changed
+                waiting = any(job['status'] in WAITING_STATUSES for job in self.jobs)
+                if not active and not downloads and not joins:
+                    if not waiting:
+                        break
+                    if self.quota_exhausted:
+                        if not self.wait_for_quota:
+                            print('Daily export quota used up, stopping.')
+                            break
+                        now = self.clock()
+                        print('Daily export quota used up, waiting for the reset.')
+                        self.sleep(next_quota_reset(now) - now)
+                        continue
+
+                delay = self.poll_interval if changed else min(delay * self.poll_multiplier, self.max_poll_interval)
+                if downloads or joins:
+                    # wake up early when a download finishes
+                    wait(list(downloads) + list(joins), timeout=delay, return_when=FIRST_COMPLETED)
+                else:
+                    self.sleep(delay)
+        return self.jobs
@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from marketorestpython.helper.chunked import run_chunked
+
+
+class WriteBuffer:
+    '''
+    Collects single records from any number of threads (add) or coroutines (add_async) and writes them with one
+    create_update_leads or add_custom_activities call per max_size records (300, the API limit), instead of one
+    call per record.
+
+    Leads written again before their batch is sent are merged into one record (later values win), by the
+    lookupField value (key: the field to merge on, None to never merge; activities aren't merged by default).
+    A batch is sent when max_size records are waiting, when the oldest one has waited max_delay seconds, on
+    flush() and on close(); up to concurrency batches are sent at a time, through run_chunked so records Marketo
+    skipped with 1022 (object in use) are sent again (max_retries). A call that failed as a whole is not sent
+    again, as it may have written the records already (a createOnly lead would then come back skipped).
+
+    add returns a concurrent.futures.Future with the record's result ({'id': .., 'status': .., 'reasons': [..]},
+    status 'failed' if it couldn't be written); merged records share the result.
+    '''
+    def __init__(self, client, method='create_update_leads', action=None, lookupField=None, partitionName=None,
+                 key=None, max_size=300, max_delay=1.0, concurrency=2, max_retries=2):
+        if method == 'create_update_leads':
+            def send(records):
+                return client.create_update_leads(records, action=action, lookupField=lookupField,
+                                                  partitionName=partitionName)
+            if key is None:
+                key = lookupField or 'email'
+        elif method == 'add_custom_activities':
+            send = client.add_custom_activities
+        else:
+            raise ValueError("Invalid argument: method should be create_update_leads or add_custom_activities.")
+        self.send = send
+        self.key = key
+        self.max_size = min(max_size, 300)
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.stats = {'records': 0, 'merged': 0, 'batches': 0}
+        self._pending = OrderedDict()  # merge key -> [record, [futures]]
+        self._first_at = None
+        self._flush = False
+        self._closed = False
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def _merge_key(self, record):
+        value = record.get(self.key) if self.key is not None else None
+        if value is None:
+            return ('record', next(self._counter))
+        return ('key', str(value).lower())
+
+    def add(self, record):
+        ''' queues a record; returns a Future for its result '''
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise Exception("WriteBuffer is closed")
+            self.stats['records'] += 1
+            merge_key = self._merge_key(record)
+            if merge_key in self._pending:
+                pending = self._pending[merge_key]
+                pending[0] = dict(pending[0], **record)
+                pending[1].append(future)
+                self.stats['merged'] += 1
+            else:
+                self._pending[merge_key] = [dict(record), [future]]
+                if self._first_at is None:
+                    # wakes the worker to start the max_delay timer
+                    self._first_at = time.monotonic()
+                    self._cond.notify()
+                elif len(self._pending) >= self.max_size:
+                    self._cond.notify()
+        return future
+
+    async def add_async(self, record):
+        ''' add for coroutines: waits for and returns the record's result '''
+        return await asyncio.wrap_future(self.add(record))
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return (self._flush or self._closed or len(self._pending) >= self.max_size
+                or time.monotonic() - self._first_at >= self.max_delay)
+
+    def _take(self):
+        batch = []
+        while self._pending and len(batch) < self.max_size:
+            batch.append(self._pending.popitem(last=False)[1])
+        self._first_at = time.monotonic() if self._pending else None
+        if not self._pending:
+            self._flush = False
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed:
+                        return
+                    timeout = None if self._first_at is None else \
+                        max(0, self._first_at + self.max_delay - time.monotonic())
+                    self._cond.wait(timeout)
+                batch = self._take()
+                self.stats['batches'] += 1
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            results = run_chunked(self.send, [record for record, _ in batch], chunk_size=self.max_size,
+                                  max_workers=1, max_retries=self.max_retries, retry_codes=('1022',),
+                                  retry_calls=False)
+        except Exception as e:
+            for _, futures in batch:
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for (_, futures), result in zip(batch, results):
+            for future in futures:
+                future.set_result(result)
+
+    def flush(self):
+        ''' sends everything waiting now and waits for the results '''
+        with self._cond:
+            futures = [future for _, pending in self._pending.values() for future in pending]
+            if self._pending:
+                self._flush = True
+                self._cond.notify()
+        for future in futures:
+            future.exception()
+
+    def close(self):
+        ''' sends everything waiting, waits for the results and stops the buffer '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
@@ -28,6 +28,9 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     keywords = ['Marketo', 'REST API', 'Wrapper', 'Client'],
     description='Python Client for the Marketo REST API',
     long_description=long_description
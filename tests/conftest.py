@@ -0,0 +1,206 @@
+import json
+import re
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from marketorestpython.batch import MarketoClientBatch
+from marketorestpython.client import MarketoClient
+from marketorestpython.helper.rate_limiter import RateLimiter
+
+
+class StubServer:
+    '''
+    minimal local stand-in for a Marketo instance; routes map (HTTP method, path) to a function taking
+    (query, body) and returning the JSON response as a dict, or bytes to send as a file. A path given as a
+    compiled regex matches any path it fully matches, and its groups are passed on after body.
+    '''
+    def __init__(self):
+        self.routes = {
+            ('GET', '/identity/oauth/token'): lambda query, body: {
+                'access_token': 'stub-token', 'token_type': 'bearer', 'expires_in': 3600, 'scope': 'stub'}
+        }
+        self.calls = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf-8') if length else ''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/json'):
+                    body = json.loads(body)
+                elif body and content_type.startswith('multipart/form-data'):
+                    # uploads are passed on as the raw body
+                    pass
+                elif body:
+                    body = {k: v[0] for k, v in parse_qs(body).items()}
+                stub.calls.append((self.command, url.path, query, body))
+                route, groups = stub.match(self.command, url.path)
+                if route is None:
+                    payload, status = {'success': False, 'errors': [{'code': '404', 'message': 'not found'}]}, 404
+                else:
+                    payload, status = route(query, body, *groups), 200
+                if isinstance(payload, bytes):
+                    data, content_type = payload, 'text/csv'
+                else:
+                    data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def route(self, method, path, func):
+        self.routes[(method, path)] = func
+
+    def match(self, method, path):
+        if (method, path) in self.routes:
+            return self.routes[(method, path)], ()
+        for (route_method, pattern), func in self.routes.items():
+            if route_method == method and not isinstance(pattern, str):
+                match = pattern.fullmatch(path)
+                if match:
+                    return func, match.groups()
+        return None, ()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeBulkExports:
+    '''
+    bulk export endpoints on a StubServer. Every status or list call is a clock tick: queued jobs start
+    processing while fewer than max_processing are, and processing jobs complete after ticks_to_complete ticks.
+    make_file(job) returns the file contents for a completed job.
+    '''
+    def __init__(self, stub, max_queue=10, max_processing=2, ticks_to_complete=2, daily_quota=None,
+                 make_file=None):
+        self.max_queue = max_queue
+        self.max_processing = max_processing
+        self.ticks_to_complete = ticks_to_complete
+        self.daily_quota = daily_quota
+        self.make_file = make_file or (lambda job: 'id,exportId\n1,{}\n'.format(job['exportId']).encode('utf-8'))
+        self.jobs = {}
+        self.bytes_exported = 0
+        self.peak_queue = 0
+        self.lock = threading.Lock()
+        base = r'/bulk/v1/(\w+|program/members)/export'
+        stub.route('POST', re.compile(base + r'/create\.json'), self.create)
+        stub.route('POST', re.compile(base + r'/([^/]+)/enqueue\.json'), self.enqueue)
+        stub.route('GET', re.compile(base + r'/([^/]+)/status\.json'), self.status)
+        stub.route('POST', re.compile(base + r'/([^/]+)/cancel\.json'), self.cancel)
+        stub.route('GET', re.compile(base + r'/([^/]+)/file\.json'), self.file)
+        stub.route('GET', re.compile(base + r'\.json'), self.list)
+
+    def _public(self, job):
+        return {k: v for k, v in job.items() if k not in ('ticks', 'fields', 'filter', 'table')}
+
+    def _error(self, code, message):
+        return {'success': False, 'errors': [{'code': code, 'message': message}]}
+
+    def _tick(self):
+        for job in self.jobs.values():
+            if job['status'] == 'Processing':
+                job['ticks'] += 1
+                if job['ticks'] >= self.ticks_to_complete:
+                    data = self.make_file(job)
+                    job.update(status='Completed', fileSize=len(data), numberOfRecords=data.count(b'\n') - 1,
+                               finishedAt='2018-01-01T00:00:00Z')
+                    self.bytes_exported += len(data)
+        processing = sum(1 for job in self.jobs.values() if job['status'] == 'Processing')
+        for job in sorted(self.jobs.values(), key=lambda job: job.get('queuedAt', '')):
+            if job['status'] == 'Queued' and processing < self.max_processing:
+                job.update(status='Processing', ticks=0)
+                processing += 1
+
+    def create(self, query, body, table):
+        with self.lock:
+            export_id = 'export-{}'.format(len(self.jobs) + 1)
+            self.jobs[export_id] = {'exportId': export_id, 'status': 'Created', 'format': body['format'],
+                                    'createdAt': '2018-01-01T00:00:00Z', 'table': table,
+                                    'fields': body.get('fields'), 'filter': body['filter']}
+            return {'success': True, 'result': [self._public(self.jobs[export_id])]}
+
+    def enqueue(self, query, body, table, export_id):
+        with self.lock:
+            job = self.jobs[export_id]
+            queued = sum(1 for job in self.jobs.values() if job['status'] in ('Queued', 'Processing'))
+            if queued >= self.max_queue:
+                return self._error('1029', 'Too many jobs ({}) in queue'.format(self.max_queue))
+            if self.daily_quota is not None and self.bytes_exported >= self.daily_quota:
+                return self._error('1029', 'Export daily quota {} MB exceeded'.format(self.daily_quota))
+            job.update(status='Queued', queuedAt='2018-01-01T00:00:{:02d}Z'.format(len(self.jobs)))
+            self.peak_queue = max(self.peak_queue, queued + 1)
+            return {'success': True, 'result': [self._public(job)]}
+
+    def status(self, query, body, table, export_id):
+        with self.lock:
+            self._tick()
+            return {'success': True, 'result': [self._public(self.jobs[export_id])]}
+
+    def cancel(self, query, body, table, export_id):
+        with self.lock:
+            self.jobs[export_id]['status'] = 'Cancelled'
+            return {'success': True, 'result': [self._public(self.jobs[export_id])]}
+
+    def file(self, query, body, table, export_id):
+        with self.lock:
+            return self.make_file(self.jobs[export_id])
+
+    def list(self, query, body, table):
+        with self.lock:
+            self._tick()
+            statuses = query.get('status')
+            jobs = [self._public(job) for job in self.jobs.values()
+                    if job['table'] == table and (statuses is None or job['status'] in statuses.split(','))]
+            # pages of batchSize jobs (300 at most), the next one at the offset in nextPageToken
+            start = int(query.get('nextPageToken', 0))
+            end = start + min(int(query.get('batchSize', 300)), 300)
+            response = {'success': True, 'result': jobs[start:end]}
+            if end < len(jobs):
+                response['nextPageToken'] = str(end)
+            return response
+
+
+@pytest.fixture
+def marketo_stub():
+    stub = StubServer()
+    yield stub
+    stub.shutdown()
+
+
+@pytest.fixture
+def stub_client(marketo_stub):
+    ''' MarketoClient talking to marketo_stub, with a rate limiter that doesn't slow the tests down '''
+    client = MarketoClient('123-FDY-456', 'id', 'secret', rate_limiter=RateLimiter(max_calls=10000))
+    client.host = marketo_stub.host
+    return client
+
+
+@pytest.fixture
+def stub_batch_client(marketo_stub, tmp_path):
+    ''' MarketoClientBatch talking to marketo_stub, with its ledger in tmp_path '''
+    client = MarketoClientBatch('123-FDY-456', 'id', 'secret', rate_limiter=RateLimiter(max_calls=10000),
+                                ledger=str(tmp_path / 'ledger.db'))
+    client.host = marketo_stub.host
+    return client
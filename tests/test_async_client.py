@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+import time
+
+from marketorestpython.async_client import AsyncMarketoClient
+from marketorestpython.client import MarketoClient
+
+
+def test_method_surface():
+    for name, method in inspect.getmembers(MarketoClient, inspect.isfunction):
+        if name.startswith('_') or name == 'execute':
+            continue
+        assert hasattr(AsyncMarketoClient, name)
+        if inspect.isgeneratorfunction(method):
+            assert inspect.isasyncgenfunction(getattr(AsyncMarketoClient, name))
+        else:
+            assert inspect.iscoroutinefunction(getattr(AsyncMarketoClient, name))
+
+
+def test_coroutines(stub_client, marketo_stub):
+    marketo_stub.route('GET', '/rest/v1/lead/1.json',
+                       lambda query, body: {'success': True, 'result': [{'id': 1, 'token': query['access_token']}]})
+    marketo_stub.route('GET', '/rest/v1/lead/2.json',
+                       lambda query, body: {'success': True, 'result': [{'id': 2}]})
+
+    async def run():
+        async with AsyncMarketoClient('123-FDY-456', 'id', 'secret', client=stub_client) as mc:
+            return await asyncio.gather(mc.get_lead_by_id(1), mc.execute(method='get_lead_by_id', id=2))
+
+    first, second = asyncio.run(run())
+    assert first == [{'id': 1, 'token': 'stub-token'}]
+    assert second == [{'id': 2}]
+    token_calls = [call for call in marketo_stub.calls if call[1] == '/identity/oauth/token']
+    assert len(token_calls) == 1
+
+
+def test_async_generator(stub_client, marketo_stub):
+    def leads(query, body):
+        if 'nextPageToken' not in query:
+            return {'success': True, 'result': [{'id': 1}, {'id': 2}], 'nextPageToken': 'page2'}
+        return {'success': True, 'result': [{'id': 3}]}
+    marketo_stub.route('POST', '/rest/v1/list/676/leads.json', leads)
+
+    async def run():
+        async with AsyncMarketoClient('123-FDY-456', 'id', 'secret', client=stub_client) as mc:
+            return [page async for page in mc.get_multiple_leads_by_list_id_yield(676)]
+
+    assert asyncio.run(run()) == [[{'id': 1}, {'id': 2}], [{'id': 3}]]
+
+
+def test_close_does_not_block_the_loop(stub_client, marketo_stub):
+    def slow(query, body):
+        time.sleep(0.3)
+        return {'success': True, 'result': [{'id': 3}]}
+    marketo_stub.route('GET', '/rest/v1/lead/3.json', slow)
+
+    async def run():
+        mc = AsyncMarketoClient('123-FDY-456', 'id', 'secret', client=stub_client)
+        await mc.authenticate()
+        call = asyncio.ensure_future(mc.get_lead_by_id(3))
+        await asyncio.sleep(0.05)
+        ticks = []
+
+        async def tick():
+            while not call.done():
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+        ticker = asyncio.ensure_future(tick())
+        await mc.close()
+        await ticker
+        return await call, len(ticks)
+
+    result, ticks = asyncio.run(run())
+    assert result == [{'id': 3}]
+    assert ticks > 5
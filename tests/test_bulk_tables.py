@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import FakeBulkExports
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # download_batch writes to the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def test_activities_batch(stub_batch_client, marketo_stub):
+    bulk = FakeBulkExports(marketo_stub)
+    stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 2, 15), table='activities',
+                                activityTypeIds=[1, 6])
+    jobs = list(bulk.jobs.values())
+    assert [job['table'] for job in jobs] == ['activities', 'activities']
+    assert all(job['filter']['activityTypeIds'] == [1, 6] and 'createdAt' in job['filter'] for job in jobs)
+    assert jobs[0]['fields'] is None
+    assert list(stub_batch_client.ledger.batches())[1] == 'activities?activityTypeIds=1,6:2018-01-01:2018-01-31'
+    stub_batch_client.process_batch(table='activities')
+    stub_batch_client.check_batch(table='activities')
+    stub_batch_client.check_batch(table='activities')
+    assert len(stub_batch_client.download_batch(table='activities')) == 2
+    assert [call[1] for call in marketo_stub.calls if call[0] == 'POST'][-1] == \
+        '/bulk/v1/activities/export/export-2/enqueue.json'
+
+
+def test_program_members_batch(stub_batch_client, marketo_stub):
+    bulk = FakeBulkExports(marketo_stub)
+    marketo_stub.route('GET', '/rest/v1/programs/members/describe.json', lambda query, body: {
+        'success': True, 'result': [{'name': 'API Program Membership',
+                                     'fields': [{'name': 'leadId'}, {'name': 'statusName'}]}]})
+    with pytest.raises(ValueError):
+        stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 1, 15),
+                                    table='program/members')
+    stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 1, 15), table='program/members',
+                                programId=1044)
+    job = bulk.jobs['export-1']
+    assert job['table'] == 'program/members'
+    assert job['fields'] == ['leadId', 'statusName']
+    assert job['filter']['programId'] == 1044 and 'updatedAt' in job['filter']
+    # the same dates for another program are a new batch
+    stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 1, 15), table='program/members',
+                                programId=1045)
+    assert len(bulk.jobs) == 2
+    assert [e['name'] for e in stub_batch_client.ledger.exports(table='program/members')] == [
+        'program/members?programId=1044:2018-01-01:2018-01-15',
+        'program/members?programId=1045:2018-01-01:2018-01-15']
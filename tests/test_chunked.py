@@ -0,0 +1,110 @@
+import threading
+import time
+
+from marketorestpython.helper.chunked import run_chunked
+from marketorestpython.helper.exceptions import MarketoException
+
+
+def test_chunks_in_order_and_concurrent():
+    state = {'active': 0, 'peak': 0, 'sizes': []}
+    lock = threading.Lock()
+
+    def send(chunk):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            state['sizes'].append(len(chunk))
+        time.sleep(0.01)
+        with lock:
+            state['active'] -= 1
+        return [{'id': item, 'status': 'updated'} for item in chunk]
+
+    results = run_chunked(send, iter(range(1000)), chunk_size=300, max_workers=3)
+    assert [result['id'] for result in results] == list(range(1000))
+    assert sorted(state['sizes']) == [100, 300, 300, 300]
+    assert 1 < state['peak'] <= 3
+    assert run_chunked(send, []) == []
+
+
+def test_only_failed_items_are_retried():
+    sent = []
+    seen = set()
+    lock = threading.Lock()
+
+    def send(chunk):
+        with lock:
+            sent.append(list(chunk))
+            first = [item for item in chunk if item not in seen]
+            seen.update(chunk)
+        results = []
+        for item in chunk:
+            if item % 10 == 0 and item in first:
+                results.append({'status': 'skipped', 'reasons': [{'code': '1022', 'message': 'Object in use'}]})
+            elif item == 7:
+                results.append({'status': 'skipped', 'reasons': [{'code': '1006', 'message': 'Field not found'}]})
+            else:
+                results.append({'id': item, 'status': 'created'})
+        return results
+
+    results = run_chunked(send, range(50), chunk_size=20, max_workers=2, backoff=0)
+    # 0, 10, 20, 30, 40 fail once and go again together; 7 is not transient
+    assert sorted(sent[-1]) == [0, 10, 20, 30, 40]
+    assert len(sent) == 4
+    assert [result['status'] for result in results].count('created') == 49
+    assert results[7]['reasons'][0]['code'] == '1006'
+    assert results[10] == {'id': 10, 'status': 'created'}
+
+
+def test_failed_calls_retry_then_give_up():
+    attempts = []
+
+    def send(chunk):
+        attempts.append(chunk)
+        if chunk[0] == 'bad':
+            raise MarketoException({'code': '611', 'message': 'System error'})
+        return [{'status': 'updated'} for _ in chunk]
+
+    waits = []
+    results = run_chunked(send, ['ok', 'bad'], chunk_size=1, max_retries=2, backoff=1, sleep=waits.append)
+    assert results[0] == {'status': 'updated'}
+    assert results[1] == {'status': 'failed', 'reasons': [{'code': '611', 'message': 'System error'}]}
+    assert attempts.count(['bad']) == 3
+    assert waits == [1, 2]
+
+
+def test_create_update_leads_bulk(stub_client, marketo_stub):
+    calls = []
+    lock = threading.Lock()
+
+    def leads(query, body):
+        with lock:
+            calls.append(body)
+            retry = len([call for call in calls if body['input'][0] in call['input']]) == 1
+        result = []
+        for lead in body['input']:
+            if lead['email'].startswith('busy') and retry:
+                result.append({'status': 'skipped', 'reasons': [{'code': '1022', 'message': 'Object in use'}]})
+            else:
+                result.append({'id': int(lead['email'].split('@')[0][4:]), 'status': 'created'})
+        return {'success': True, 'result': result}
+    marketo_stub.route('POST', '/rest/v1/leads.json', leads)
+
+    input = [{'email': '{}{}@example.com'.format('busy' if index == 500 else 'lead', index)} for index in range(700)]
+    results = stub_client.execute(method='create_update_leads_bulk', leads=input, lookupField='email', concurrency=2)
+    assert [result['id'] for result in results] == list(range(700))
+    assert sorted(len(call['input']) for call in calls) == [1, 100, 300, 300]
+    assert all(call['lookupField'] == 'email' for call in calls)
+
+
+def test_create_update_leads_bulk_not_sent_again_after_timeout(stub_client, marketo_stub):
+    calls = []
+
+    def leads(query, body):
+        calls.append(body['input'])
+        return {'success': False, 'errors': [{'code': '604', 'message': 'Request timed out'}]}
+    marketo_stub.route('POST', '/rest/v1/leads.json', leads)
+
+    input = [{'email': 'lead{}@example.com'.format(index)} for index in range(3)]
+    results = stub_client.create_update_leads_bulk(input, action='createOnly')
+    assert len(calls) == 1
+    assert results == [{'status': 'failed', 'reasons': [{'code': '604', 'message': 'Request timed out'}]}] * 3
@@ -22,6 +22,18 @@ def test_marketo_client(client):
     assert client.API_LIMIT == 20
 
 
+def test_session_is_shared(client):
+    assert client.session is not None
+    adapter = client.session.get_adapter(client.host)
+    assert adapter._pool_maxsize == 10
+
+    session = Mock()
+    client = MarketoClient('123-FDY-456', 'randomclientid', 'supersecret', session=session)
+    assert client.session is session
+    client.close()
+    session.close.assert_called_once_with()
+
+
 @patch('marketorestpython.client.HttpLib')
 def test_api_call(m_http_lib, client):
     get_request_mock = Mock(return_value={
@@ -32,6 +44,7 @@ def test_api_call(m_http_lib, client):
     args = (1, 2, 3)
     kwargs = {'a': 1, 'b': 2}
     client._api_call('get', '/test', *args, **kwargs)
+    m_http_lib.assert_called_with(client.session, client.rate_limiter, client.retry_policy)
     get_request_mock.assert_called_with(*(('/test',) + args), **kwargs)
     assert client.API_CALLS_MADE == 1
 
@@ -93,3 +106,17 @@ def test_authenticate(m_client_api_call, client):
     with pytest.raises(Exception) as excinfo:
         client.authenticate()
         assert excinfo.value == 'invalid secret'
+
+
+@patch('marketorestpython.client.MarketoClient._api_call')
+def test_get_deleted_leads_yield_prefetch(m_client_api_call, client):
+    client.valid_until = time.time() + 3600
+    client.token = 'token'
+    m_client_api_call.side_effect = [
+        {'success': True, 'nextPageToken': 'token1'},
+        {'success': True, 'moreResult': True, 'nextPageToken': 'token2', 'result': [{'id': 1}]},
+        {'success': True, 'moreResult': False, 'nextPageToken': 'token3', 'result': [{'id': 2}]},
+    ]
+    pages = list(client.get_deleted_leads_yield(sinceDatetime='2018-01-01', prefetch=2))
+    assert pages == [[{'id': 1}], [{'id': 2}]]
+    assert m_client_api_call.call_args_list[2][0][2]['nextPageToken'] == 'token2'
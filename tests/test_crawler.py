@@ -0,0 +1,49 @@
+import threading
+import time
+
+from marketorestpython.helper.crawler import crawl_offsets
+
+
+def make_fetch(total, page_size, delay=0.0):
+    state = {'active': 0, 'peak': 0, 'offsets': []}
+    lock = threading.Lock()
+
+    def fetch_page(offset):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            state['offsets'].append(offset)
+        time.sleep(delay)
+        with lock:
+            state['active'] -= 1
+        if offset >= total:
+            return None  # Marketo returns no 'result' node past the end
+        return list(range(offset, min(offset + page_size, total)))
+    return fetch_page, state
+
+
+def test_results_in_order_and_stop_at_short_page():
+    fetch_page, state = make_fetch(95, 10, delay=0.01)
+    assert crawl_offsets(fetch_page, 10, max_workers=4) == list(range(95))
+    assert 1 < state['peak'] <= 4
+    assert max(state['offsets']) < 95 + 4 * 10
+
+
+def test_exact_multiple_of_page_size():
+    fetch_page, _ = make_fetch(40, 10)
+    assert crawl_offsets(fetch_page, 10, max_workers=3) == list(range(40))
+    fetch_page, state = make_fetch(40, 10)
+    assert crawl_offsets(fetch_page, 10, max_workers=1) == list(range(40))
+    assert state['offsets'] == [0, 10, 20, 30, 40]
+
+
+def test_browse_programs_concurrently(stub_client, marketo_stub):
+    def programs(query, body):
+        offset = int(query.get('offset', 0))
+        if offset >= 45:
+            return {'success': True, 'warnings': ['No assets found for the given search criteria.']}
+        return {'success': True, 'result': [{'id': i} for i in range(offset, min(offset + 20, 45))]}
+    marketo_stub.route('GET', '/rest/asset/v1/programs.json', programs)
+
+    assert stub_client.browse_programs(concurrency=5) == [{'id': i} for i in range(45)]
+    assert stub_client.browse_programs() == [{'id': i} for i in range(45)]
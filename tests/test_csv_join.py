@@ -0,0 +1,91 @@
+import csv
+import random
+
+from datetime import datetime
+
+from conftest import FakeBulkExports
+from marketorestpython.helper.csv_join import external_sort, join_csv
+from marketorestpython.planner import partition_fields
+from marketorestpython.scheduler import BulkExportScheduler
+
+
+def write_csv(file_name, header, rows):
+    with open(file_name, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(file_name)
+
+
+def read_csv(file_name):
+    with open(file_name, newline='', encoding='utf-8') as handle:
+        return list(csv.reader(handle))
+
+
+def export_file(job):
+    ''' the requested fields for leads 1..50, in random order, as a bulk export would return them '''
+    ids = list(range(1, 51))
+    random.Random(job['exportId']).shuffle(ids)
+    lines = [','.join(job['fields'])]
+    lines.extend(','.join(str(i) if f == 'id' else '{}-{}'.format(f, i) for f in job['fields']) for i in ids)
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def test_partition_fields():
+    fields = ['email', 'id', 'a__c', 'b__c', 'c__c', 'd__c']
+    assert partition_fields(fields, 3) == [['id', 'email', 'a__c'], ['id', 'b__c', 'c__c'], ['id', 'd__c']]
+    assert partition_fields(fields, 10) == [['id', 'email', 'a__c', 'b__c', 'c__c', 'd__c']]
+
+
+def test_external_sort_in_runs(tmp_path):
+    ids = list(range(1, 1001))
+    random.Random(1).shuffle(ids)
+    file_name = write_csv(tmp_path / 'a.csv', ['email', 'id'], [['x{}'.format(i), str(i)] for i in ids])
+    header, rows = external_sort(file_name, chunk_rows=64, tmp_dir=str(tmp_path))
+    assert header == ['email', 'id']
+    assert [int(row[1]) for row in rows] == list(range(1, 1001))
+
+
+def test_join_csv(tmp_path):
+    first = write_csv(tmp_path / 'a.csv', ['id', 'email'], [['10', 'c'], ['2', 'a'], ['3', 'b']])
+    second = write_csv(tmp_path / 'b.csv', ['score__c', 'id'], [['7', '3'], ['9', '2'], ['1', '11']])
+    output = str(tmp_path / 'joined.csv')
+    assert join_csv([first, second], output, chunk_rows=2) == 4
+    assert read_csv(output) == [['id', 'email', 'score__c'], ['2', 'a', '9'], ['3', 'b', '7'], ['10', 'c', ''],
+                                ['11', '', '1']]
+
+
+def test_run_batch_column_groups(stub_batch_client, marketo_stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    FakeBulkExports(marketo_stub, ticks_to_complete=1, make_file=export_file)
+    marketo_stub.route('GET', '/rest/v1/leads/describe.json', lambda query, body: {'success': True, 'result': [
+        {'displayName': name, 'dataType': 'string', 'rest': {'name': name}}
+        for name in ['id', 'email', 'a__c', 'b__c', 'c__c']]})
+    assert stub_batch_client._bulk_fields('leads', custom_fields=False) == ['id', 'email']
+    # custom fields are exported by default
+    stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 1, 10), max_fields=3)
+    assert [e['group'] for e in stub_batch_client.ledger.exports()] == [0, 1]
+    stub_batch_client.process_batch()
+    stub_batch_client.check_batch()
+    stub_batch_client.check_batch()
+    stub_batch_client.download_batch()
+    results = stub_batch_client.join_batch()
+    assert [r['filename'] for r in results] == ['leads_2018-01-01_2018-01-10.csv']
+    rows = read_csv(results[0]['filename'])
+    assert rows[0] == ['id', 'email', 'a__c', 'b__c', 'c__c']
+    assert rows[1:] == [[str(i), 'email-%d' % i, 'a__c-%d' % i, 'b__c-%d' % i, 'c__c-%d' % i] for i in range(1, 51)]
+    assert stub_batch_client.join_batch() == []
+
+
+def test_scheduler_column_groups(stub_batch_client, marketo_stub, tmp_path):
+    FakeBulkExports(marketo_stub, make_file=export_file)
+    scheduler = BulkExportScheduler(stub_batch_client, fields=['id', 'email', 'a__c', 'b__c'], path=str(tmp_path),
+                                    poll_interval=0.01, max_poll_interval=0.02)
+    scheduler.add_date_range(datetime(2018, 1, 1), datetime(2018, 1, 20), days=10, max_fields=2)
+    jobs = scheduler.run()
+    assert len(jobs) == 6
+    joined = sorted(set(job['joined'] for job in jobs))
+    assert joined == [str(tmp_path / 'leads_2018-01-01_2018-01-10.csv'),
+                      str(tmp_path / 'leads_2018-01-11_2018-01-20.csv')]
+    assert read_csv(joined[0])[0] == ['id', 'email', 'a__c', 'b__c']
+    assert len(read_csv(joined[1])) == 51
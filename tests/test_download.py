@@ -0,0 +1,120 @@
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from marketorestpython.helper.download import download_file, DownloadSizeError
+from marketorestpython.helper.http_lib import create_session
+from marketorestpython.helper.rate_limiter import RateLimiter
+from marketorestpython.helper.retry import RetryPolicy
+
+
+DATA = b''.join(b'%d,lead%d@example.com\n' % (i, i) for i in range(5000))
+
+
+class FileServer:
+    ''' serves DATA with Range support; drop_after cuts the first n responses short after that many bytes '''
+    def __init__(self, drop_after=None, drops=1):
+        self.ranges = []
+        self.drop_after = drop_after
+        self.drops = drops
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                start, end = 0, len(DATA) - 1
+                header = self.headers.get('Range')
+                server.ranges.append(header)
+                if header:
+                    first, last = header[len('bytes='):].split('-')
+                    start, end = int(first), int(last) if last else len(DATA) - 1
+                    if start >= len(DATA):
+                        self.send_response(416)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(DATA)))
+                else:
+                    self.send_response(200)
+                body = DATA[start:end + 1]
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if server.drop_after is not None and server.drops:
+                    server.drops -= 1
+                    self.wfile.write(body[:server.drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/bulk/v1/leads/export/abc/file.json'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fetch():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(FileServer(**kwargs))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def download(url, file_name, **kwargs):
+    return download_file(create_session(), url, file_name, rate_limiter=RateLimiter(),
+                         retry_policy=RetryPolicy(sleep=lambda seconds: None), **kwargs)
+
+
+def test_download_is_atomic_and_verified(fetch, tmp_path):
+    server = fetch()
+    file_name = str(tmp_path / 'abc.csv')
+    assert download(server.url, file_name, expected_size=len(DATA), chunk_size=4096) == len(DATA)
+    assert open(file_name, 'rb').read() == DATA
+    assert not os.path.exists(file_name + '.part')
+    with pytest.raises(DownloadSizeError):
+        download(server.url, str(tmp_path / 'other.csv'), expected_size=len(DATA) + 1)
+    assert not os.path.exists(str(tmp_path / 'other.csv'))
+
+
+def test_dropped_connection_resumes_with_range(fetch, tmp_path):
+    server = fetch(drop_after=10000)
+    file_name = str(tmp_path / 'abc.csv')
+    assert download(server.url, file_name, expected_size=len(DATA), chunk_size=1000) == len(DATA)
+    assert open(file_name, 'rb').read() == DATA
+    # whole chunks received before the drop are kept
+    assert server.ranges == [None, 'bytes=10000-']
+
+
+def test_existing_part_file_is_resumed(fetch, tmp_path):
+    server = fetch()
+    file_name = str(tmp_path / 'abc.csv')
+    with open(file_name + '.part', 'wb') as handle:
+        handle.write(DATA[:777])
+    download(server.url, file_name, expected_size=len(DATA))
+    assert open(file_name, 'rb').read() == DATA
+    assert server.ranges == ['bytes=777-']
+
+
+def test_segmented_download(fetch, tmp_path):
+    server = fetch(drop_after=100, drops=2)
+    file_name = str(tmp_path / 'abc.csv')
+    assert download(server.url, file_name, expected_size=len(DATA), segments=4, chunk_size=10) == len(DATA)
+    assert open(file_name, 'rb').read() == DATA
+    assert len([r for r in server.ranges if r]) == 6
+    assert os.listdir(str(tmp_path)) == ['abc.csv']
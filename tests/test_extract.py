@@ -0,0 +1,93 @@
+import json
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from marketorestpython.extract import ShardedActivityExtractor
+
+
+START = datetime(2018, 1, 1)
+# one activity every hour for three days
+ACTIVITIES = [{'id': i, 'activityDate': (START + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%SZ')}
+              for i in range(72)]
+
+
+def route_activities(stub, page_size=5, fail_after=None):
+    def paging_token(query, body):
+        since = datetime.strptime(query['sinceDatetime'], '%Y-%m-%dT%H:%M:%SZ')
+        position = next((i for i, a in enumerate(ACTIVITIES)
+                         if datetime.strptime(a['activityDate'], '%Y-%m-%dT%H:%M:%SZ') >= since), len(ACTIVITIES))
+        return {'success': True, 'nextPageToken': str(position)}
+
+    def activities(query, body):
+        position = int(query['nextPageToken'])
+        if fail_after is not None and position >= fail_after:
+            return {'success': False, 'errors': [{'code': '611', 'message': 'System error'}]}
+        page = ACTIVITIES[position:position + page_size]
+        more = position + page_size < len(ACTIVITIES)
+        return {'success': True, 'result': page, 'moreResult': more,
+                'nextPageToken': str(position + page_size)}
+
+    stub.route('GET', '/rest/v1/activities/pagingtoken.json', paging_token)
+    stub.route('GET', '/rest/v1/activities.json', activities)
+
+
+def test_make_shards(stub_client):
+    extractor = ShardedActivityExtractor(stub_client, '1 6', '2018-01-01', '2018-01-03T12:00:00', shard_days=1)
+    assert [shard[1] for shard in extractor.shards] == [
+        datetime(2018, 1, 2), datetime(2018, 1, 3), datetime(2018, 1, 3, 12)]
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01', '2018-01-02', shards=7)
+    assert len(extractor.shards) == 7
+    assert extractor.shards[0][0] == START and extractor.shards[-1][1] == datetime(2018, 1, 2)
+    with pytest.raises(ValueError):
+        ShardedActivityExtractor(stub_client, [1], '2018-01-02', '2018-01-01')
+
+
+def test_offsets_converted_to_utc(stub_client):
+    eastern = timezone(timedelta(hours=-5))
+    extractor = ShardedActivityExtractor(stub_client, [1], datetime(2018, 1, 1, 9, tzinfo=eastern),
+                                         '2018-01-02T09:00:00-05:00', shards=1)
+    assert extractor.shards[0][:2] == (datetime(2018, 1, 1, 14), datetime(2018, 1, 2, 14))
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01T00:00:00Z', '2018-01-01T06:00:00', shards=1)
+    assert extractor.since == START
+    with pytest.raises(ValueError):
+        ShardedActivityExtractor(stub_client, [1], '01/01/2018', '2018-01-02')
+
+
+def test_ordered_run_matches_serial(stub_client, marketo_stub):
+    route_activities(marketo_stub)
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01', '2018-01-03T23:00:00', shards=4,
+                                         max_workers=4)
+    ids = [a['id'] for page in extractor.run() for a in page]
+    assert ids == list(range(72))
+
+
+def test_unordered_run_has_no_duplicates(stub_client, marketo_stub):
+    route_activities(marketo_stub, page_size=7)
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01T05:00:00', '2018-01-02T05:00:00', shards=5)
+    pages = list(extractor.run(ordered=False))
+    ids = sorted(a['id'] for shard, page in pages for a in page)
+    # both ends are included, like get_lead_activities
+    assert ids == list(range(5, 30))
+    for shard, page in pages:
+        assert all(shard[0] <= datetime.strptime(a['activityDate'], '%Y-%m-%dT%H:%M:%SZ') for a in page)
+
+
+def test_checkpoint_resume(stub_client, marketo_stub, tmp_path):
+    checkpoint = str(tmp_path / 'activities.json')
+    route_activities(marketo_stub, fail_after=40)
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01', '2018-01-03T23:00:00', shard_days=1,
+                                         checkpoint=checkpoint)
+    first = []
+    with pytest.raises(Exception):
+        for page in extractor.run():
+            first.extend(a['id'] for a in page)
+    state = json.load(open(checkpoint))
+    assert state['2018-01-01T00:00:00/2018-01-02T00:00:00']['done'] is True
+
+    route_activities(marketo_stub)
+    extractor = ShardedActivityExtractor(stub_client, [1], '2018-01-01', '2018-01-03T23:00:00', shard_days=1,
+                                         checkpoint=checkpoint)
+    second = [a['id'] for page in extractor.run() for a in page]
+    assert sorted(first + second) == list(range(72))
@@ -0,0 +1,44 @@
+import threading
+
+from marketorestpython.helper.chunked import split_values
+
+
+def test_split_values():
+    assert split_values(range(250)) == [list(range(100)), list(range(100, 200)), list(range(200, 250))]
+    assert split_values(['aaaa', 'bbbb', 'cccc'], max_length=9) == [['aaaa', 'bbbb'], ['cccc']]
+    assert split_values(['a' * 20, 'b'], max_length=9) == [['a' * 20], ['b']]
+    assert split_values([]) == []
+
+
+def test_get_leads_by_filter_values(stub_client, marketo_stub):
+    leads = [{'id': index, 'email': 'lead{}@example.com'.format(index)} for index in range(500)]
+    leads += [{'id': 1000 + index, 'email': 'shared@example.com'} for index in range(3)]
+    calls, answered = [], []
+    lock = threading.Lock()
+
+    def lookup(query, body):
+        values = body['filterValues'].split(',')
+        with lock:
+            calls.append(values)
+        assert body['filterType'] == 'email' and body['fields'] == 'firstName,email'
+        assert len(values) <= 40
+        matches = [lead for lead in leads if lead['email'] in [value.lower() for value in values]]
+        if len(matches) > 12:
+            return {'success': False, 'errors': [{'code': '1003', 'message': 'Too many results match the filter'}]}
+        with lock:
+            answered.append(values)
+        return {'success': True, 'result': matches}
+    marketo_stub.route('POST', '/rest/v1/leads.json', lookup)
+
+    values = ['lead{}@example.com'.format(index) for index in range(0, 100)] + ['Shared@Example.com',
+                                                                                'lead5@example.com', 'nobody@x.com']
+    result = stub_client.execute(method='get_leads_by_filter_values', filterType='email', filterValues=values,
+                                 fields=['firstName'], maxValues=40, concurrency=4)
+    assert len(result) == 102
+    assert [lead['id'] for lead in result['lead7@example.com']] == [7]
+    assert sorted(lead['id'] for lead in result['Shared@Example.com']) == [1000, 1001, 1002]
+    assert result['nobody@x.com'] == []
+    # 102 distinct values in 3 queries of up to 40, bisected on 1003 down to at most 12 matches
+    asked = sorted(value.lower() for group in answered for value in group)
+    assert asked == sorted(set(value.lower() for value in values))
+    assert any(len(values) == 40 for values in calls)
@@ -0,0 +1,71 @@
+from marketorestpython.fingerprints import FingerprintStore
+
+
+def test_changes_and_record(tmp_path):
+    now = [1000.0]
+    store = FingerprintStore(str(tmp_path / 'fingerprints.db'), max_age=3600, clock=lambda: now[0])
+    leads = [{'email': 'a@example.com', 'score': 5, 'active': True}, {'email': 'b@example.com', 'city': None}]
+    assert store.changes(leads) == leads
+    assert store.record(leads, [{'id': 1, 'status': 'updated'}, {'status': 'skipped', 'reasons': []}]) == 1
+
+    changed = store.changes([{'email': 'A@example.com', 'score': '5', 'active': 'true'},
+                             {'email': 'a@example.com', 'score': 6, 'active': True},
+                             {'email': 'b@example.com', 'city': None},
+                             {'firstName': 'no key'}])
+    assert changed == [None, {'email': 'a@example.com', 'score': 6}, {'email': 'b@example.com', 'city': None},
+                       {'firstName': 'no key'}]
+
+    now[0] += 3600 + 1
+    assert store.changes(leads[:1]) == leads[:1]
+    store.record(leads[:1])
+    store.forget(['A@EXAMPLE.COM'])
+    assert store.changes(leads[:1]) == leads[:1]
+
+
+def test_seed_from_export(tmp_path):
+    export = tmp_path / 'leads.csv'
+    export.write_text('id,email,firstName,score\n1,a@example.com,Ann,\n2,b@example.com,Bob,7\n')
+    store = FingerprintStore(str(tmp_path / 'fingerprints.db'))
+    assert store.seed_from_export(str(export), fields=['firstName', 'score']) == 2
+    assert store.changes([{'email': 'a@example.com', 'firstName': 'Ann', 'score': None},
+                          {'email': 'b@example.com', 'firstName': 'Bobby', 'score': 7}]) == [
+        None, {'email': 'b@example.com', 'firstName': 'Bobby'}]
+
+
+def test_upsert_skips_unchanged_leads(stub_client, tmp_path, marketo_stub):
+    sent = []
+
+    def leads(query, body):
+        sent.append(body['input'])
+        return {'success': True, 'result': [{'id': int(lead['email'][1:].split('@')[0]), 'status': 'updated'}
+                                            for lead in body['input']]}
+    marketo_stub.route('POST', '/rest/v1/leads.json', leads)
+    store = FingerprintStore(str(tmp_path / 'fingerprints.db'))
+
+    input = [{'email': 'l{}@example.com'.format(index), 'score': 1, 'city': 'Paris'} for index in range(1200)]
+    results = stub_client.create_update_leads_bulk(input, lookupField='email', fingerprints=store)
+    assert [result['id'] for result in results] == list(range(1200))
+    assert sum(len(chunk) for chunk in sent) == 1200
+
+    sent.clear()
+    input[5]['score'] = 2
+    input[1100]['city'] = 'Lyon'
+    results = stub_client.execute(method='create_update_leads_bulk', leads=iter(input), lookupField='email',
+                                  fingerprints=store)
+    assert sent == [[{'email': 'l5@example.com', 'score': 2}, {'email': 'l1100@example.com', 'city': 'Lyon'}]]
+    assert results[5] == {'id': 5, 'status': 'updated'} and results[1100]['id'] == 1100
+    assert [result['status'] for result in results].count('unchanged') == 1198
+
+
+def test_upsert_keeps_lookup_field(stub_client, tmp_path, marketo_stub):
+    sent = []
+
+    def leads(query, body):
+        sent.append(body['input'])
+        return {'success': True, 'result': [{'id': lead['id'], 'status': 'updated'} for lead in body['input']]}
+    marketo_stub.route('POST', '/rest/v1/leads.json', leads)
+    store = FingerprintStore(str(tmp_path / 'fingerprints.db'))
+
+    stub_client.create_update_leads_bulk([{'id': 1, 'email': 'a@x', 'score': 1}], lookupField='id', fingerprints=store)
+    stub_client.create_update_leads_bulk([{'id': 1, 'email': 'a@x', 'score': 2}], lookupField='id', fingerprints=store)
+    assert sent[-1] == [{'id': 1, 'email': 'a@x', 'score': 2}]
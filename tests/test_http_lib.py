@@ -0,0 +1,28 @@
+from mock import Mock
+
+from marketorestpython.helper.http_lib import HttpLib, create_session
+
+
+def test_create_session():
+    session = create_session(pool_connections=2, pool_maxsize=4, pool_block=True)
+    adapter = session.get_adapter('https://123-FDY-456.mktorest.com')
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block is True
+
+
+def test_requests_go_through_session():
+    response = Mock(status_code=200, headers={})
+    response.json.return_value = {'success': True, 'result': []}
+    session = Mock()
+    session.get.return_value = response
+    session.post.return_value = response
+    session.delete.return_value = response
+    http_lib = HttpLib(session)
+
+    assert http_lib.get('https://host/rest/v1/lists.json', {'access_token': '1'}) == {'success': True, 'result': []}
+    http_lib.post('https://host/rest/v1/leads.json', {'access_token': '1'}, data={'input': []})
+    http_lib.delete('https://host/rest/v1/leads.json', {'access_token': '1'}, {'input': []})
+    assert session.get.call_count == 1
+    assert session.post.call_count == 1
+    assert session.delete.call_count == 1
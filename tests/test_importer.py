@@ -0,0 +1,151 @@
+import csv
+import io
+import re
+import threading
+
+import pytest
+
+from marketorestpython.importer import LeadImportPipeline
+
+
+class FakeBulkImports:
+    '''
+    bulk lead import endpoints: rows without an @ in the email fail, rows without a lastName get a warning.
+    Every status call is a tick; at most max_processing batches import at a time and max_jobs are accepted.
+    '''
+    def __init__(self, stub, max_jobs=10, max_processing=2, ticks_to_complete=2):
+        self.max_jobs = max_jobs
+        self.max_processing = max_processing
+        self.ticks_to_complete = ticks_to_complete
+        self.batches = {}
+        self.peak_jobs = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        stub.route('POST', '/bulk/v1/leads.json', self.create)
+        stub.route('GET', re.compile(r'/bulk/v1/leads/batch/(\d+)\.json'), self.status)
+        stub.route('GET', re.compile(r'/bulk/v1/leads/batch/(\d+)/failures\.json'), self.failures)
+        stub.route('GET', re.compile(r'/bulk/v1/leads/batch/(\d+)/warnings\.json'), self.warnings)
+
+    @staticmethod
+    def _file(body):
+        boundary = body.split('\r\n', 1)[0]
+        part = body.split(boundary)[1]
+        return part.split('\r\n\r\n', 1)[1].rsplit('\r\n', 1)[0]
+
+    def _active(self):
+        return [batch for batch in self.batches.values() if batch['status'] in ('Queued', 'Importing')]
+
+    def create(self, query, body):
+        with self.lock:
+            if len(self._active()) >= self.max_jobs:
+                self.rejected += 1
+                return {'success': False, 'errors': [{'code': '1016', 'message': 'Too many imports'}]}
+            rows = list(csv.DictReader(io.StringIO(self._file(body))))
+            batch_id = len(self.batches) + 1
+            failed = [row for row in rows if '@' not in row['email']]
+            warned = [row for row in rows if '@' in row['email'] and not row['lastName']]
+            self.batches[batch_id] = {'batchId': batch_id, 'status': 'Queued', 'rows': rows, 'failed': failed,
+                                      'warned': warned, 'ticks': 0}
+            self.peak_jobs = max(self.peak_jobs, len(self._active()))
+            return {'success': True, 'result': [{'batchId': batch_id, 'status': 'Queued'}]}
+
+    def _tick(self):
+        for batch in self.batches.values():
+            if batch['status'] == 'Importing':
+                batch['ticks'] += 1
+                if batch['ticks'] >= self.ticks_to_complete:
+                    batch['status'] = 'Complete'
+        importing = sum(1 for batch in self.batches.values() if batch['status'] == 'Importing')
+        for batch in self.batches.values():
+            if batch['status'] == 'Queued' and importing < self.max_processing:
+                batch['status'] = 'Importing'
+                importing += 1
+
+    def status(self, query, body, batch_id):
+        with self.lock:
+            self._tick()
+            batch = self.batches[int(batch_id)]
+            result = {'batchId': batch['batchId'], 'status': batch['status'], 'numOfLeadsProcessed': 0}
+            if batch['status'] == 'Complete':
+                result.update(numOfLeadsProcessed=len(batch['rows']) - len(batch['failed']),
+                              numOfRowsFailed=len(batch['failed']), numOfRowsWithWarning=len(batch['warned']))
+            return {'success': True, 'result': [result]}
+
+    def _report(self, rows, column, reason):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['email', 'lastName', column])
+        for row in rows:
+            writer.writerow([row['email'], row['lastName'], reason])
+        return out.getvalue().encode('utf-8')
+
+    def failures(self, query, body, batch_id):
+        return self._report(self.batches[int(batch_id)]['failed'], 'Import Failure Reason', 'Invalid email')
+
+    def warnings(self, query, body, batch_id):
+        return self._report(self.batches[int(batch_id)]['warned'], 'Import Warning Reason', 'Missing lastName')
+
+
+def make_leads(count):
+    leads = []
+    for index in range(count):
+        email = 'lead{}@example.com'.format(index) if index % 7 else 'lead{}'.format(index)
+        leads.append({'email': email, 'lastName': '' if index % 5 == 1 else 'Name {}'.format(index)})
+    return leads
+
+
+def make_pipeline(client, tmp_path, **kwargs):
+    return LeadImportPipeline(client, lookupField='email', path=str(tmp_path / 'chunks'), poll_interval=0.01,
+                              max_poll_interval=0.02, **kwargs)
+
+
+def test_imports_records_in_chunks(stub_client, marketo_stub, tmp_path):
+    bulk = FakeBulkImports(marketo_stub, max_jobs=3)
+    leads = make_leads(200)
+    pipeline = make_pipeline(stub_client, tmp_path, max_file_size=1024, max_jobs=3)
+    result = pipeline.run(iter(leads), str(tmp_path / 'result.csv'))
+
+    assert len(result['batches']) > 5
+    assert all(batch['status'] == 'Complete' for batch in result['batches'])
+    assert bulk.peak_jobs <= 3
+    # all rows were uploaded once, in the order of the chunks
+    uploaded = [row['email'] for batch in result['batches'] for row in bulk.batches[batch['batchId']]['rows']]
+    assert uploaded == [lead['email'] for lead in leads]
+    assert list((tmp_path / 'chunks').iterdir()) == []
+
+    with open(result['filename'], newline='') as handle:
+        rows = list(csv.DictReader(handle))
+    assert [row['email'] for row in rows] == [lead['email'] for lead in leads]
+    for lead, row in zip(leads, rows):
+        if '@' not in lead['email']:
+            assert (row['importStatus'], row['importMessage']) == ('failed', 'Invalid email')
+        elif not lead['lastName']:
+            assert (row['importStatus'], row['importMessage']) == ('warning', 'Missing lastName')
+        else:
+            assert (row['importStatus'], row['importMessage']) == ('imported', '')
+    assert result['rows'] == 200
+    assert result['failed'] == sum(1 for lead in leads if '@' not in lead['email'])
+    assert result['imported'] + result['warnings'] + result['failed'] == 200
+
+
+def test_waits_when_import_queue_full(stub_client, marketo_stub, tmp_path):
+    bulk = FakeBulkImports(marketo_stub, max_jobs=2)
+    source = tmp_path / 'leads.csv'
+    with open(source, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, ['email', 'lastName'])
+        writer.writeheader()
+        writer.writerows(make_leads(100))
+    pipeline = make_pipeline(stub_client, tmp_path, max_file_size=512, max_jobs=5, keep_files=True)
+    result = pipeline.run(str(source), str(tmp_path / 'result.csv'))
+    # Marketo's queue took fewer batches than the pipeline tried to keep in it
+    assert bulk.rejected > 0
+    assert all(batch['status'] == 'Complete' for batch in result['batches'])
+    assert result['rows'] == 100
+    assert all((tmp_path / 'chunks' / 'import_{:05d}.csv'.format(batch['number'])).stat().st_size <= 512
+               for batch in result['batches'])
+
+
+def test_rejects_rows_over_the_file_limit(stub_client, tmp_path):
+    pipeline = LeadImportPipeline(stub_client, max_file_size=20)
+    with pytest.raises(ValueError):
+        pipeline.run([{'email': 'someone.with.a.long.address@example.com'}], str(tmp_path / 'result.csv'))
@@ -0,0 +1,86 @@
+import csv
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import FakeBulkExports
+from marketorestpython.incremental import IncrementalExport
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def fake_leads(marketo_stub, leads):
+    ''' bulk exports of leads ({id: updatedAt}) filtered on updatedAt '''
+    def make_file(job):
+        window = job['filter']['updatedAt']
+        start, end = datetime.fromisoformat(window['startAt']), datetime.fromisoformat(window['endAt'])
+        lines = ['id,email,updatedAt']
+        for lead_id, updated in sorted(leads.items()):
+            if start <= datetime.fromisoformat(updated) <= end:
+                lines.append('{},lead{}@example.com,{}'.format(lead_id, lead_id, updated))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+    return FakeBulkExports(marketo_stub, make_file=make_file)
+
+
+def make_export(client, tmp_path, **kwargs):
+    return IncrementalExport(client, fields=['email'], path=str(tmp_path), days=5, poll_interval=0.01,
+                             max_poll_interval=0.02, **kwargs)
+
+
+def read_rows(file_name):
+    with open(file_name, newline='') as handle:
+        return list(csv.DictReader(handle))
+
+
+def test_first_run_needs_start(stub_batch_client, tmp_path):
+    with pytest.raises(ValueError):
+        make_export(stub_batch_client, tmp_path).run()
+
+
+def test_runs_from_watermark_and_dedupes_overlap(stub_batch_client, marketo_stub, tmp_path):
+    leads = {1: '2018-01-02T10:00:00+00:00', 2: '2018-01-06T00:00:00+00:00', 3: '2018-01-09T23:30:00+00:00'}
+    bulk = fake_leads(marketo_stub, leads)
+    export = make_export(stub_batch_client, tmp_path)
+
+    result = export.run(start_dt=utc(2018, 1, 1), end_dt=utc(2018, 1, 10))
+    # two windows, split at 2018-01-06, which both include lead 2
+    assert len(bulk.jobs) == 2
+    assert [job['fields'] for job in bulk.jobs.values()] == [['email', 'id', 'updatedAt']] * 2
+    assert [row['id'] for row in read_rows(result['filename'])] == ['1', '2', '3']
+    assert result['duplicates'] == 1
+    assert export.watermark() == utc(2018, 1, 10)
+    # the window files are removed once merged
+    assert all(not (tmp_path / '{}.csv'.format(export_id)).exists() for export_id in bulk.jobs)
+
+    leads[1] = '2018-01-10T03:00:00+00:00'
+    leads[4] = '2018-01-10T05:00:00+00:00'
+    result = export.run(end_dt=utc(2018, 1, 11))
+    # starts an hour before the watermark; lead 3 is in the overlap but unchanged
+    assert result['start'] == utc(2018, 1, 9, 23)
+    assert bulk.jobs['export-3']['filter']['updatedAt']['startAt'] == '2018-01-09T23:00:00+00:00'
+    rows = read_rows(result['filename'])
+    assert [(row['id'], row['updatedAt']) for row in rows] == [('1', leads[1]), ('4', leads[4])]
+    assert result['duplicates'] == 1
+    assert export.watermark() == utc(2018, 1, 11)
+
+
+def test_watermark_stays_when_exports_fail(stub_batch_client, marketo_stub, tmp_path):
+    fake_leads(marketo_stub, {1: '2018-01-02T10:00:00+00:00'})
+    export = make_export(stub_batch_client, tmp_path, daily_quota=1, max_queue=1)
+    with pytest.raises(Exception) as error:
+        export.run(start_dt=utc(2018, 1, 1), end_dt=utc(2018, 1, 10))
+    assert 'Pending' in str(error.value)
+    assert export.watermark() is None
+
+
+def test_activities_filter_and_key(stub_batch_client, tmp_path):
+    export = IncrementalExport(stub_batch_client, table='activities', filter={'activityTypeIds': [1, 6]},
+                               overlap=timedelta(minutes=5))
+    assert export.filter_field == 'createdAt'
+    assert export.timestamp_column == 'activityDate'
+    assert export.key == 'marketoGUID'
+    assert export.watermark_key == 'activities?activityTypeIds=1,6:createdAt'
+    assert export._fields() is None
@@ -0,0 +1,71 @@
+from conftest import FakeBulkExports
+from marketorestpython.job_cache import BulkJobCache
+from marketorestpython.scheduler import BulkExportScheduler
+
+
+def create_jobs(client, count, enqueue=0):
+    export_ids = []
+    for index in range(count):
+        export_id = client.create_bulk_extract(table='leads', fields=['id'], filter={'index': index})[0]['exportId']
+        if index < enqueue:
+            client.start_bulk_job(export_id)
+        export_ids.append(export_id)
+    return export_ids
+
+
+def list_calls(marketo_stub):
+    return [call for call in marketo_stub.calls if call[1] == '/bulk/v1/leads/export.json']
+
+
+def test_get_bulk_jobs_pages(stub_batch_client, marketo_stub, capsys):
+    FakeBulkExports(marketo_stub)
+    export_ids = create_jobs(stub_batch_client, 7)
+    pages = list(stub_batch_client.get_bulk_jobs_yield(table='leads', status='Created', batch_size=3))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [job['exportId'] for page in pages for job in page] == export_ids
+    calls = list_calls(marketo_stub)
+    assert [call[2].get('nextPageToken') for call in calls] == [None, '3', '6']
+    assert all(call[2]['status'] == 'Created' and call[2]['batchSize'] == '3' for call in calls)
+    assert len(stub_batch_client.get_all_bulk_jobs(table='leads', batch_size=2)) == 7
+    assert stub_batch_client.get_bulk_jobs(table='leads', batch_size=2)[1]['exportId'] == export_ids[1]
+    # the access token stays out of the log
+    assert 'stub-token' not in capsys.readouterr().out
+
+
+def test_cache_polls_only_changing_jobs(stub_batch_client, marketo_stub):
+    bulk = FakeBulkExports(marketo_stub, max_processing=1, ticks_to_complete=100)
+    now = [0]
+    cache = BulkJobCache(stub_batch_client, max_age=60, clock=lambda: now[0])
+    export_ids = create_jobs(stub_batch_client, 5, enqueue=2)
+
+    assert sorted(cache.refresh()) == sorted(export_ids)
+    assert len(list_calls(marketo_stub)) == 1
+    assert cache.counts() == {'Created': 3, 'Queued': 1, 'Processing': 1}
+    assert cache.get(export_ids[0])['status'] == 'Processing'
+
+    marketo_stub.calls.clear()
+    # one status call per queued or processing job, no listing
+    assert cache.refresh() == []
+    assert sorted(call[1] for call in marketo_stub.calls) == sorted(
+        '/bulk/v1/leads/export/{}/status.json'.format(export_id) for export_id in export_ids[:2])
+    assert [job['exportId'] for job in cache.jobs('Created')] == export_ids[2:]
+
+    # jobs enqueued elsewhere show up at the next full listing
+    stub_batch_client.start_bulk_job(export_ids[2])
+    now[0] = 60
+    marketo_stub.calls.clear()
+    cache.refresh()
+    assert len(list_calls(marketo_stub)) == 1
+    assert cache.counts() == {'Created': 2, 'Queued': 2, 'Processing': 1}
+    assert bulk.jobs[export_ids[2]]['status'] == 'Queued'
+
+
+def test_scheduler_lists_jobs_once(stub_batch_client, marketo_stub, tmp_path):
+    FakeBulkExports(marketo_stub, max_queue=3)
+    scheduler = BulkExportScheduler(stub_batch_client, fields=['id', 'email'], path=str(tmp_path), poll_interval=0.01,
+                                    max_poll_interval=0.02)
+    for index in range(6):
+        scheduler.add({'createdAt': {'startAt': '2018-01-0{}'.format(index + 1)}})
+    jobs = scheduler.run()
+    assert [job['status'] for job in jobs] == ['Downloaded'] * 6
+    assert len(list_calls(marketo_stub)) == 1
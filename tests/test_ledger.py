@@ -0,0 +1,75 @@
+import json
+import pickle
+
+from datetime import datetime
+
+from conftest import FakeBulkExports
+from marketorestpython.batch import MarketoClientBatch
+from marketorestpython.ledger import JobLedger
+
+
+def test_export_rows(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.db'))
+    ledger.update_export('a', {'status': 'Created', 'format': 'CSV', 'table': 'leads'})
+    ledger.update_export('b', {'status': 'Created', 'format': 'CSV', 'table': 'leads'})
+    ledger.update_export('a', {'status': 'Completed', 'fileSize': 120, 'numberOfRecords': 3})
+    assert ledger.get_export('a') == {'exportId': 'a', 'status': 'Completed', 'format': 'CSV', 'table': 'leads',
+                                      'fileSize': 120, 'numberOfRecords': 3}
+    assert ledger.get_export('c') is None
+    assert [e['exportId'] for e in ledger.exports(status=['Created', 'Queued'])] == ['b']
+    assert [e['exportId'] for e in ledger.not_downloaded(table='leads')] == ['a']
+    ledger.update_export('a', {'filename': 'a.csv'})
+    assert ledger.not_downloaded() == []
+    ledger.add_call('a', {'status': 'Queued'})
+    ledger.add_call('a', {'status': 'Completed'})
+    assert [c['status'] for c in ledger.calls('a')] == ['Queued', 'Completed']
+    # a second connection (another process) sees the same rows
+    assert JobLedger(str(tmp_path / 'jobs.db')).get_export('a')['filename'] == 'a.csv'
+
+
+def test_migrate_pickle(tmp_path):
+    data = {
+        'requests': {},
+        'batches': {'leads:2018-01-01:2018-01-31': {'start': datetime(2018, 1, 1), 'end': datetime(2018, 1, 31),
+                                                    'export_id': 'a'}},
+        'a': {'status': 'Completed', 'exportId': 'a', 'format': 'CSV', 'filename': 'a.csv',
+              'calls': [{'status': 'Created'}, {'status': 'Queued'}]},
+        'b': {'status': 'Completed', 'exportId': 'b', 'format': 'CSV', 'calls': []},
+    }
+    pickle_name = str(tmp_path / 'batch.pickle')
+    with open(pickle_name, 'wb') as handle:
+        pickle.dump(data, handle)
+    ledger = JobLedger(str(tmp_path / 'jobs.db'))
+    assert ledger.migrate_pickle(pickle_name) == 2
+    assert ledger.migrate_pickle(pickle_name) == 0
+    assert ledger.batches()['leads:2018-01-01:2018-01-31']['start'] == datetime(2018, 1, 1)
+    assert [e['exportId'] for e in ledger.not_downloaded()] == ['b']
+    assert ledger.to_dict()['a']['calls'] == [{'status': 'Created'}, {'status': 'Queued'}]
+
+
+def test_batch_client_uses_ledger(stub_batch_client, marketo_stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bulk = FakeBulkExports(marketo_stub, ticks_to_complete=1)
+    batch = stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 3, 1), table='leads',
+                                        fields=['id'])
+    assert batch['label'] == 'leads:2018-01-01:2018-03-01' and batch['export_ids'] == ['export-1', 'export-2']
+    assert batch['start'] == datetime(2018, 1, 1)
+    assert len(stub_batch_client.ledger.exports(status='Created')) == 2
+    stub_batch_client.process_batch()
+    stub_batch_client.check_batch()
+    stub_batch_client.check_batch()
+    assert len(stub_batch_client.ledger.not_downloaded(table='leads')) == 2
+    results = stub_batch_client.download_batch()
+    assert len(results) == 2
+    assert stub_batch_client.ledger.not_downloaded() == []
+    # the token goes as a parameter of the file requests, and stays out of the ledger
+    assert all(call[2].get('access_token') == 'stub-token' for call in marketo_stub.calls
+               if call[1].endswith('/file.json'))
+    assert all('access_token' not in call.get('url', '') for call in stub_batch_client.ledger.calls('export-1'))
+    assert 'stub-token' not in json.dumps(stub_batch_client.data, default=str)
+    # without ledger=, the ledger is a file in the working directory
+    assert MarketoClientBatch('123-FDY-456', 'id', 'secret').ledger.path == 'MarketoClientBatch_123-FDY-456_batch.db'
+    assert (tmp_path / 'MarketoClientBatch_123-FDY-456_batch.db').exists()
+    assert set(stub_batch_client.data) == {'requests', 'batches', 'export-1', 'export-2'}
+    assert stub_batch_client.data['export-1']['calls'][0]['status'] == 'Created'
+    assert bulk.jobs['export-1']['status'] == 'Completed'
@@ -0,0 +1,72 @@
+import threading
+
+
+class FakeList:
+    ''' a static list on a StubServer: reading members (pages of 300), adding, removing and ismember '''
+    def __init__(self, stub, list_id, members):
+        self.members = set(members)
+        self.changes = []
+        self.lock = threading.Lock()
+        stub.route('POST', '/rest/v1/list/{}/leads.json'.format(list_id), self.read)
+        stub.route('POST', '/rest/v1/lists/{}/leads.json'.format(list_id), self.add)
+        stub.route('DELETE', '/rest/v1/lists/{}/leads.json'.format(list_id), self.remove)
+        stub.route('POST', '/rest/v1/lists/{}/leads/ismember.json'.format(list_id), self.ismember)
+
+    def read(self, query, body):
+        members = sorted(self.members)
+        start = int(query.get('nextPageToken', 0))
+        end = start + int(body.get('batchSize', 300))
+        result = {'success': True, 'result': [{'id': lead_id} for lead_id in members[start:end]]}
+        if end < len(members):
+            result['nextPageToken'] = str(end)
+        return result
+
+    def _change(self, body, action, status):
+        ids = [lead['id'] for lead in body['input']]
+        if len(ids) > 300:
+            return {'success': False, 'errors': [{'code': '1003', 'message': 'Too many ids'}]}
+        with self.lock:
+            self.changes.append((action, len(ids)))
+            getattr(self.members, action)(ids)
+        return {'success': True, 'result': [{'id': lead_id, 'status': status} for lead_id in ids]}
+
+    def add(self, query, body):
+        return self._change(body, 'update', 'added')
+
+    def remove(self, query, body):
+        return self._change(body, 'difference_update', 'removed')
+
+    def ismember(self, query, body):
+        return {'success': True, 'result': [{'id': lead['id'], 'status': 'memberof' if lead['id'] in self.members
+                                             else 'notmemberof'} for lead in body['input']]}
+
+
+def test_sync_list(stub_client, marketo_stub):
+    fake = FakeList(marketo_stub, 42, range(0, 1000))
+    wanted = list(range(500, 1700)) + [600]
+    result = stub_client.execute(method='sync_list', listId=42, id=wanted)
+    assert fake.members == set(range(500, 1700))
+    assert [r['id'] for r in result['added']] == list(range(1000, 1700))
+    assert all(r['status'] == 'added' for r in result['added'])
+    assert [r['id'] for r in result['removed']] == list(range(0, 500))
+    assert result['unchanged'] == 500
+    assert sorted(fake.changes) == sorted([('update', 300), ('update', 300), ('update', 100),
+                                           ('difference_update', 300), ('difference_update', 200)])
+
+    # nothing left to do
+    fake.changes.clear()
+    result = stub_client.sync_list(42, wanted)
+    assert result == {'added': [], 'removed': [], 'unchanged': 1200}
+    assert fake.changes == []
+
+
+def test_list_operations_in_chunks(stub_client, marketo_stub):
+    fake = FakeList(marketo_stub, 7, [])
+    stub_client.add_leads_to_list_bulk(7, range(650), concurrency=3)
+    assert stub_client.get_list_member_ids(7) == set(range(650))
+    results = stub_client.member_of_list_bulk(7, [1, 2000, 649])
+    assert [r['status'] for r in results] == ['memberof', 'notmemberof', 'memberof']
+    results = stub_client.remove_leads_from_list_bulk(7, range(600))
+    assert len(results) == 600 and fake.members == set(range(600, 650))
+    assert stub_client.sync_list(7, [1, 2], remove=False)['removed'] == []
+    assert fake.members == set(range(600, 650)) | {1, 2}
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from conftest import FakeBulkExports
+from marketorestpython.ledger import JobLedger
+from marketorestpython.planner import ExportPlanner, fixed_windows
+
+
+def test_fixed_windows():
+    windows = fixed_windows(datetime(2018, 1, 1), datetime(2018, 3, 1), 30)
+    assert windows == [(datetime(2018, 1, 1), datetime(2018, 1, 31)),
+                       (datetime(2018, 2, 1), datetime(2018, 3, 1))]
+
+
+def test_plan_follows_density(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.db'))
+    planner = ExportPlanner(ledger, target_size=1000, max_days=31)
+    assert planner.plan(datetime(2018, 1, 1), datetime(2018, 2, 28)) is None
+    # 100 bytes per record; January has 31 records a day, February 1 a day
+    ledger.update_export('jan', {'status': 'Completed', 'table': 'leads', 'name': 'leads:2018-01-01:2018-01-31',
+                                 'numberOfRecords': 31 * 31, 'fileSize': 31 * 31 * 100})
+    ledger.update_export('feb', {'status': 'Completed', 'table': 'leads', 'name': 'leads:2018-02-01:2018-02-28',
+                                 'numberOfRecords': 28, 'fileSize': 2800})
+    windows = planner.plan(datetime(2018, 1, 1), datetime(2018, 2, 28))
+    # one day per window in January (each day alone is over the target), ten days per window in February
+    assert windows[:31] == [(datetime(2018, 1, d), datetime(2018, 1, d)) for d in range(1, 32)]
+    assert windows[31:] == [(datetime(2018, 2, 1), datetime(2018, 2, 10)),
+                            (datetime(2018, 2, 11), datetime(2018, 2, 20)),
+                            (datetime(2018, 2, 21), datetime(2018, 2, 28))]
+    # the plan is stored and reused, even after new observations
+    ledger.update_export('feb', {'numberOfRecords': 280, 'fileSize': 28000})
+    assert planner.plan(datetime(2018, 1, 1), datetime(2018, 2, 28)) == windows
+    assert planner.plan(datetime(2018, 1, 1), datetime(2018, 2, 28), reuse=False) != windows
+
+
+def test_unknown_days_use_average_and_max_days(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'jobs.db'))
+    ledger.update_export('a', {'status': 'Completed', 'table': 'leads', 'name': 'leads:2018-01-01:2018-01-10',
+                               'numberOfRecords': 10, 'fileSize': 1000})
+    planner = ExportPlanner(ledger, target_size=10 ** 6, max_days=31)
+    windows = planner.plan(datetime(2018, 6, 1), datetime(2018, 8, 31))
+    assert all((end - start).days + 1 <= 31 for start, end in windows)
+    assert windows[0][0] == datetime(2018, 6, 1) and windows[-1][1] == datetime(2018, 8, 31)
+    assert all(b[0] - a[1] == timedelta(1) for a, b in zip(windows, windows[1:]))
+
+
+def test_run_batch_with_probe(stub_batch_client, marketo_stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('marketorestpython.batch.time.sleep', lambda seconds: None)
+    # every file holds 10 records of 10 bytes
+    FakeBulkExports(marketo_stub, make_file=lambda job: b'id,email\n' + b'123456789\n' * 10)
+    stub_batch_client.run_batch(start_dt=datetime(2018, 1, 1), end_dt=datetime(2018, 1, 20), table='leads',
+                                fields=['id'], target_size=400, probe=True)
+    labels = [export['name'] for export in stub_batch_client.ledger.exports()]
+    assert labels[0] == 'leads:2018-01-01:2018-01-01'
+    # the probe saw about 11 bytes a record and 10 records a day
+    assert labels[1:] == ['leads:2018-01-{:02d}:2018-01-{:02d}'.format(day, min(day + 2, 20))
+                          for day in range(1, 21, 3)]
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from marketorestpython.helper.prefetch import prefetch_pages
+
+
+def test_pages_in_order():
+    release = threading.Event()
+
+    def pages():
+        for n in range(10):
+            yield [n]
+            if n == 0:
+                release.wait(5)
+
+    iterator = prefetch_pages(pages(), depth=2)
+    assert next(iterator) == [0]
+    release.set()
+    assert list(iterator) == [[n] for n in range(1, 10)]
+
+
+def test_buffer_is_bounded():
+    fetched = []
+
+    def pages():
+        for n in range(100):
+            fetched.append(n)
+            yield [n]
+
+    iterator = prefetch_pages(pages(), depth=3)
+    next(iterator)
+    time.sleep(0.2)
+    # one page with the consumer, three buffered, one waiting to be queued
+    assert len(fetched) <= 5
+    iterator.close()
+
+
+def test_errors_are_raised_to_the_consumer():
+    def pages():
+        yield [1]
+        raise ValueError('boom')
+
+    iterator = prefetch_pages(pages(), depth=2)
+    assert next(iterator) == [1]
+    with pytest.raises(ValueError):
+        next(iterator)
+
+
+def test_stopping_early_closes_the_source():
+    closed = threading.Event()
+
+    def pages():
+        try:
+            n = 0
+            while True:
+                yield [n]
+                n += 1
+        finally:
+            closed.set()
+
+    for page in prefetch_pages(pages(), depth=2):
+        if page == [3]:
+            break
+    assert closed.wait(1)
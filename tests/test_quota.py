@@ -0,0 +1,141 @@
+import threading
+
+import pytest
+
+from mock import patch, Mock
+
+from marketorestpython.client import MarketoClient
+from marketorestpython.helper.quota import (MemoryQuotaBackend, QuotaBackend, SQLiteQuotaBackend, RedisQuotaBackend,
+                                            quota_day)
+from marketorestpython.helper.rate_limiter import RateLimiter
+
+
+class FakeRedis:
+    ''' in-memory stand-in for the handful of redis commands RedisQuotaBackend uses '''
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, name, value, nx=False, px=None):
+        with self.lock:
+            if nx and name in self.data:
+                return None
+            self.data[name] = value.encode('utf-8')
+            return True
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+    def zremrangebyscore(self, name, min, max):
+        zset = self.data.setdefault(name, {})
+        for member in [m for m, score in zset.items() if score <= max]:
+            del zset[member]
+
+    def zcard(self, name):
+        return len(self.data.get(name, {}))
+
+    def zrange(self, name, start, end, withscores=False):
+        items = sorted(self.data.get(name, {}).items(), key=lambda item: item[1])[start:end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def zadd(self, name, mapping):
+        self.data.setdefault(name, {}).update(mapping)
+
+    def pexpire(self, name, ms):
+        pass
+
+    def expire(self, name, seconds):
+        pass
+
+    def incrby(self, name, amount):
+        self.data[name] = int(self.data.get(name, 0)) + amount
+        return self.data[name]
+
+
+def shared_backends(kind, tmp_path):
+    ''' two backend objects that share storage, as two processes would '''
+    if kind == 'memory':
+        backend = MemoryQuotaBackend()
+        return backend, backend
+    if kind == 'sqlite':
+        path = str(tmp_path / 'quota.db')
+        return SQLiteQuotaBackend(path), SQLiteQuotaBackend(path)
+    redis = FakeRedis()
+    return RedisQuotaBackend(redis), RedisQuotaBackend(redis)
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite', 'redis'])
+def test_window_is_shared(kind, tmp_path):
+    first, second = shared_backends(kind, tmp_path)
+    for i in range(3):
+        assert first.try_acquire('123-FDY-456', 5, 20, 100.0 + i) == 0
+    for i in range(2):
+        assert second.try_acquire('123-FDY-456', 5, 20, 103.0 + i) == 0
+    assert first.count('123-FDY-456', 20, 105.0) == 5
+    # the window is full for both; the oldest call (t=100) expires at t=120
+    assert second.try_acquire('123-FDY-456', 5, 20, 105.0) == 15.0
+    assert first.wait_time('123-FDY-456', 5, 20, 110.0) == 10.0
+    # other instances have their own window
+    assert first.try_acquire('999-XXX-999', 5, 20, 105.0) == 0
+    assert second.try_acquire('123-FDY-456', 5, 20, 120.0) == 0
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite', 'redis'])
+def test_daily_count_is_shared(kind, tmp_path):
+    first, second = shared_backends(kind, tmp_path)
+    assert first.incr_daily('123-FDY-456', '2018-01-01') == 1
+    assert second.incr_daily('123-FDY-456', '2018-01-01', 2) == 3
+    assert first.get_daily('123-FDY-456', '2018-01-01') == 3
+    assert first.get_daily('123-FDY-456', '2018-01-02') == 0
+
+
+def test_incomplete_backend_fails_on_construction():
+    class DailyOnly(QuotaBackend):
+        def incr_daily(self, key, day, amount=1):
+            return amount
+
+        def get_daily(self, key, day):
+            return 0
+    with pytest.raises(TypeError):
+        DailyOnly()
+
+
+def test_rate_limiter_with_backend(tmp_path):
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    path = str(tmp_path / 'quota.db')
+    worker_a = RateLimiter(max_calls=2, period=20, clock=lambda: now[0], sleep=sleep,
+                           backend=SQLiteQuotaBackend(path), key='123-FDY-456')
+    worker_b = RateLimiter(max_calls=2, period=20, clock=lambda: now[0], sleep=sleep,
+                           backend=SQLiteQuotaBackend(path), key='123-FDY-456')
+    with worker_a:
+        pass
+    with worker_b:
+        pass
+    assert worker_a.tokens == 0
+    with worker_a:
+        pass
+    assert sleeps == [20.0]
+
+
+def test_client_daily_limit_is_shared(tmp_path):
+    backend = SQLiteQuotaBackend(str(tmp_path / 'quota.db'))
+    first = MarketoClient('123-FDY-456', 'id', 'secret', api_limit=3, quota_backend=backend)
+    second = MarketoClient('123-FDY-456', 'id', 'secret', api_limit=3, quota_backend=backend)
+    assert first.rate_limiter.backend is backend
+    with patch('marketorestpython.client.HttpLib') as m_http_lib:
+        m_http_lib.return_value = Mock(get=Mock(return_value={}))
+        first._api_call('get', '/test')
+        second._api_call('get', '/test')
+        with pytest.raises(Exception):
+            first._api_call('get', '/test')
+    assert backend.get_daily('123-FDY-456', quota_day()) == 3
+    assert first.API_CALLS_MADE == 2
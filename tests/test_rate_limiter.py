@@ -0,0 +1,90 @@
+import threading
+import time
+
+from marketorestpython.client import MarketoClient
+from marketorestpython.helper.rate_limiter import RateLimiter, shared_rate_limiter
+
+
+class FakeClock:
+    ''' deterministic clock; sleeping just moves time forward '''
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_window_allows_burst_then_waits():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    for _ in range(100):
+        with limiter:
+            clock.now += 0.01
+    assert clock.sleeps == []
+    assert limiter.tokens == 0
+    assert abs(limiter.wait_time() - (20 - 1.0)) < 1e-9
+
+    with limiter:
+        pass
+    assert len(clock.sleeps) == 1
+    assert abs(clock.sleeps[0] - 19.0) < 1e-9
+    assert abs(limiter.total_wait - 19.0) < 1e-9
+
+
+def test_window_slides():
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_calls=3, period=20)
+    for step in range(3):
+        with limiter:
+            pass
+        clock.now += 5
+    # calls at 0, 5, 10; now is 15 -> the first call leaves the window at 20
+    assert limiter.tokens == 0
+    assert limiter.wait_time() == 5
+    clock.now += 5
+    assert limiter.tokens == 1
+    assert limiter.wait_time() == 0
+
+
+def test_concurrency_cap():
+    limiter = RateLimiter(max_concurrent=2)
+    leave = threading.Event()
+    peak = []
+
+    def call():
+        with limiter:
+            peak.append(limiter.in_flight)
+            leave.wait()
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while len(peak) < 2:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    assert len(peak) == 2
+    leave.set()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
+    assert limiter.in_flight == 0
+
+
+def test_shared_between_clients():
+    assert shared_rate_limiter('111-AAA-222') is shared_rate_limiter('111-AAA-222')
+    first = MarketoClient('111-AAA-222', 'id', 'secret')
+    second = MarketoClient('111-AAA-222', 'id', 'secret')
+    assert first.rate_limiter is second.rate_limiter
+
+    limiter = RateLimiter()
+    client = MarketoClient('111-AAA-222', 'id', 'secret', rate_limiter=limiter)
+    assert client.rate_limiter is limiter
@@ -0,0 +1,102 @@
+import gzip
+import json
+
+from datetime import datetime, date, timezone
+
+import pytest
+
+from marketorestpython.reader import BulkExportReader, field_types, ACTIVITY_FIELDS
+
+
+DESCRIBE = [
+    {'id': 1, 'displayName': 'Id', 'dataType': 'integer', 'rest': {'name': 'id'}},
+    {'id': 2, 'displayName': 'Email', 'dataType': 'email', 'length': 255, 'rest': {'name': 'email'}},
+    {'id': 3, 'displayName': 'Score', 'dataType': 'float', 'rest': {'name': 'score__c'}},
+    {'id': 4, 'displayName': 'Unsubscribed', 'dataType': 'boolean', 'rest': {'name': 'unsubscribed'}},
+    {'id': 5, 'displayName': 'Created', 'dataType': 'datetime', 'rest': {'name': 'createdAt'}},
+    {'id': 6, 'displayName': 'Birthday', 'dataType': 'date', 'rest': {'name': 'dateOfBirth'}},
+]
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    file_name = tmp_path / 'export.csv'
+    lines = ['id,email,score__c,unsubscribed,createdAt,dateOfBirth,notes']
+    for i in range(1, 26):
+        lines.append('{0},lead{0}@example.com,{1},{2},2018-01-{0:02d}T10:00:00Z,,"a, ""quoted"" note"'.format(
+            i, i / 2.0 if i % 5 else '', 'true' if i % 2 else 'false'))
+    file_name.write_text('\n'.join(lines) + '\n')
+    return str(file_name)
+
+
+def test_field_types():
+    assert field_types(DESCRIBE)['score__c'] == 'float'
+    assert field_types([{'name': 'API Program Membership', 'fields': [{'name': 'leadId', 'dataType': 'integer'}]}]) \
+        == {'leadId': 'integer'}
+
+
+def test_typed_batches(export_file):
+    reader = BulkExportReader(export_file, field_types(DESCRIBE), batch_size=10)
+    batches = list(reader.batches())
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    first = batches[0][0]
+    assert first == {'id': 1, 'email': 'lead1@example.com', 'score__c': 0.5, 'unsubscribed': True,
+                     'createdAt': datetime(2018, 1, 1, 10, tzinfo=timezone.utc), 'dateOfBirth': None,
+                     'notes': 'a, "quoted" note'}
+    assert batches[0][4]['score__c'] is None
+    columns = next(reader.batches(columns=True))
+    assert columns['id'] == list(range(1, 11))
+    assert len(list(reader)) == 25
+
+
+def test_cast_dates():
+    reader = BulkExportReader(None, {'d': 'date', 't': 'datetime'})
+    date_cast, datetime_cast = reader._casts(['d', 't'])
+    assert date_cast('2018-02-03') == date(2018, 2, 3)
+    assert datetime_cast('2018-02-03T04:05:06-08:00').utcoffset().total_seconds() == -8 * 3600
+
+
+def test_bad_cells_keep_their_text(tmp_path):
+    file_name = tmp_path / 'export.csv'
+    file_name.write_text('id,leadScore,createdAt\n1,12,2018-01-01T00:00:00Z\n2,n/a,2018-01-02T00:00:00Z\n'
+                         '3,7,yesterday\n')
+    reader = BulkExportReader(str(file_name), {'id': 'integer', 'leadScore': 'score', 'createdAt': 'datetime'})
+    output = str(tmp_path / 'export.ndjson')
+    assert reader.to_ndjson(output, compress=False) == 3
+    with open(output) as handle:
+        records = [json.loads(line) for line in handle]
+    assert [record['leadScore'] for record in records] == [12, 'n/a', 7]
+    assert records[2]['createdAt'] == 'yesterday'
+    assert reader.errors == [(2, 'leadScore', 'n/a'), (3, 'createdAt', 'yesterday')]
+    assert reader.error_count == 2
+
+
+def test_ndjson(export_file, tmp_path):
+    output = str(tmp_path / 'export.ndjson.gz')
+    assert BulkExportReader(export_file, field_types(DESCRIBE)).to_ndjson(output) == 25
+    with gzip.open(output, 'rt') as handle:
+        records = [json.loads(line) for line in handle]
+    assert records[1]['createdAt'] == '2018-01-02T10:00:00+00:00'
+    assert records[1]['unsubscribed'] is False
+
+
+def test_activities(tmp_path):
+    file_name = tmp_path / 'activities.csv'
+    file_name.write_text('marketoGUID,leadId,activityDate,activityTypeId,campaignId,primaryAttributeValueId,'
+                         'primaryAttributeValue,attributes\n'
+                         '123,5,2018-01-01T00:00:00Z,1,,12,Page,"{""Client IP Address"": ""1.2.3.4""}"\n')
+    record = next(iter(BulkExportReader(str(file_name), ACTIVITY_FIELDS)))
+    assert record['attributes'] == {'Client IP Address': '1.2.3.4'}
+    assert record['campaignId'] is None and record['leadId'] == 5
+
+
+def test_parquet(export_file, tmp_path):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    output = str(tmp_path / 'export.parquet')
+    assert BulkExportReader(export_file, field_types(DESCRIBE), batch_size=10).to_parquet(output) == 25
+    table = pyarrow_parquet.read_table(output)
+    assert table.num_rows == 25
+    assert str(table.schema.field('score__c').type) == 'double'
+    first = table.slice(0, 1).to_pylist()[0]
+    assert first['unsubscribed'] is True and first['dateOfBirth'] is None and first['score__c'] == 0.5
+    assert first['createdAt'] == datetime(2018, 1, 1, 10, tzinfo=timezone.utc)
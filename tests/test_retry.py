@@ -0,0 +1,117 @@
+import requests
+
+from mock import Mock
+
+from marketorestpython.helper.http_lib import HttpLib
+from marketorestpython.helper.rate_limiter import RateLimiter
+from marketorestpython.helper.retry import RetryPolicy, parse_retry_after
+
+
+def make_policy(**kwargs):
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    policy = RetryPolicy(clock=lambda: now[0], sleep=sleep, **kwargs)
+    return policy, sleeps
+
+
+def response(payload, status_code=200, headers=None):
+    r = Mock(status_code=status_code, headers=headers or {})
+    r.json.return_value = payload
+    return r
+
+
+RATE_LIMITED = {'success': False, 'errors': [{'code': '606', 'message': 'Max rate limit exceeded'}]}
+OK = {'success': True, 'result': []}
+
+
+def test_backoff_curve_and_jitter():
+    policy, _ = make_policy(backoff=1, multiplier=2, max_backoff=5, jitter=0)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+    policy, _ = make_policy(backoff=4, jitter=0.5, rand=lambda: 1.0)
+    assert policy.delay(1) == 2.0
+    assert policy.delay(1, retry_after=10) == 10
+    assert policy.delay(1, reason='615') == 0.5  # 615 has its own 1 second base
+
+
+def test_retry_after_parsing():
+    assert parse_retry_after('7') == 7.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT', now=1445412480) == 10.0
+    assert parse_retry_after(None) is None
+
+
+def test_rules_deadline_and_idempotency():
+    policy, _ = make_policy(max_attempts=5, code_rules={'615': {'max_attempts': 2}, '1029': {}})
+    assert policy.next_backoff(1, '606', 0) is not None
+    assert policy.next_backoff(2, '615', 0) is None
+    assert policy.next_backoff(1, '1029', 0) is not None
+    assert policy.next_backoff(1, '1003', 0) is None  # not retryable
+
+    policy, _ = make_policy(deadline=5, jitter=0, backoff=3)
+    assert policy.next_backoff(1, '606', 0) == 3
+    assert policy.next_backoff(2, '606', 0) is None  # 6 more seconds would pass the deadline
+
+    policy, _ = make_policy()
+    read_timeout = requests.exceptions.ReadTimeout()
+    assert policy.is_retryable(read_timeout, idempotent=True)
+    assert not policy.is_retryable(read_timeout, idempotent=False)
+    assert policy.is_retryable(requests.exceptions.ConnectTimeout(), idempotent=False)
+    assert policy.is_retryable(503, idempotent=False)
+    assert not policy.is_retryable(504, idempotent=False)
+    assert policy.is_retryable('604', idempotent=True)
+    assert not policy.is_retryable('604', idempotent=False)
+    assert policy.is_retryable('606', idempotent=False)
+    assert RetryPolicy(retry_unsafe_posts=True).is_retryable('604', idempotent=False)
+
+
+def test_upsert_not_sent_again_after_marketo_timeout():
+    policy, sleeps = make_policy(jitter=0)
+    session = Mock()
+    timed_out = {'success': False, 'errors': [{'code': '604', 'message': 'Request timed out'}]}
+    session.post.side_effect = [response(timed_out), response(OK)]
+    http_lib = HttpLib(session, RateLimiter(), policy)
+    # the error is returned, so the caller raises it with its code
+    assert http_lib.post('https://host/rest/v1/leads.json', {}, data={'input': []}) == timed_out
+    assert session.post.call_count == 1 and sleeps == []
+
+    # a read through POST with _method=GET is retried
+    session.post.side_effect = [response(timed_out), response(OK)]
+    assert http_lib.post('https://host/rest/v1/leads.json', {'_method': 'GET'}, data=[]) == OK
+    assert session.post.call_count == 3
+
+
+def test_http_lib_retries_all_methods_and_emits_events():
+    events = []
+    policy, sleeps = make_policy(jitter=0, on_attempt=[events.append])
+    session = Mock()
+    session.get.side_effect = [response(RATE_LIMITED), response(OK)]
+    session.delete.side_effect = [response({}, 503, {'Retry-After': '10'}), response(OK)]
+    session.post.side_effect = requests.exceptions.ReadTimeout()
+    http_lib = HttpLib(session, RateLimiter(), policy)
+
+    assert http_lib.get('https://host/rest/v1/lists.json', {}) == OK
+    assert http_lib.delete('https://host/rest/v1/leads.json', {}, {'input': []}) == OK
+    assert sleeps == [3, 10]
+    # an upsert that timed out may have been applied, so it is not sent again
+    assert http_lib.post('https://host/rest/v1/leads.json', {}, data={'input': []}) is None
+    assert session.post.call_count == 1
+
+    assert [(e.method, e.attempt, e.outcome, e.reason) for e in events] == [
+        ('get', 1, 'retry', '606'), ('get', 2, 'success', None),
+        ('delete', 1, 'retry', 503), ('delete', 2, 'success', None),
+        ('post', 1, 'giveup', events[-1].reason)]
+    assert policy.retries == 2
+    assert policy.backoff_seconds == 13
+
+
+def test_last_error_returned_on_giveup():
+    policy, sleeps = make_policy(max_attempts=2, jitter=0)
+    session = Mock()
+    session.get.side_effect = [response(RATE_LIMITED), response(RATE_LIMITED)]
+    http_lib = HttpLib(session, RateLimiter(), policy)
+    assert http_lib.get('https://host/rest/v1/lists.json', {}) == RATE_LIMITED
+    assert session.get.call_count == 2 and sleeps == [3]
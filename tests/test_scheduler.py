@@ -0,0 +1,85 @@
+from datetime import datetime
+
+from conftest import FakeBulkExports
+from marketorestpython.scheduler import BulkExportScheduler, next_quota_reset
+from marketorestpython.helper.quota import quota_day
+
+
+def make_scheduler(client, tmp_path, **kwargs):
+    return BulkExportScheduler(client, fields=['id', 'email'], path=str(tmp_path), poll_interval=0.01,
+                               max_poll_interval=0.02, **kwargs)
+
+
+def test_add_date_range(stub_batch_client, tmp_path):
+    scheduler = make_scheduler(stub_batch_client, tmp_path)
+    jobs = scheduler.add_date_range(datetime(2018, 1, 1), datetime(2018, 3, 1), days=30)
+    assert [job['label'] for job in jobs] == [
+        'leads:2018-01-01:2018-01-30', 'leads:2018-01-31:2018-03-01']
+    assert set(jobs[0]['filter']['createdAt']) == {'startAt', 'endAt'}
+
+
+def test_runs_jobs_to_download(stub_batch_client, marketo_stub, tmp_path):
+    bulk = FakeBulkExports(marketo_stub, max_queue=3)
+    completed = []
+    scheduler = make_scheduler(stub_batch_client, tmp_path, on_complete=completed.append)
+    for index in range(7):
+        scheduler.add({'createdAt': {'startAt': '2018-01-0{}'.format(index + 1)}})
+    jobs = scheduler.run()
+    assert [job['status'] for job in jobs] == ['Downloaded'] * 7
+    assert len(completed) == 7
+    # the queue was kept full, but never overfilled
+    assert bulk.peak_queue == 3
+    for job in jobs:
+        assert open(job['filename'], 'rb').read() == bulk.make_file(bulk.jobs[job['exportId']])
+    assert scheduler.bytes_used() == sum(job['fileSize'] for job in jobs)
+
+
+def test_resumes_from_the_ledger(stub_batch_client, marketo_stub, tmp_path):
+    bulk = FakeBulkExports(marketo_stub, max_queue=3)
+
+    def crash(job):
+        raise KeyboardInterrupt
+    scheduler = make_scheduler(stub_batch_client, tmp_path, on_complete=crash)
+    for index in range(4):
+        scheduler.add({'createdAt': {'startAt': '2018-01-0{}'.format(index + 1)}})
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    created = [job['exportId'] for job in scheduler.jobs if job['exportId'] is not None]
+    downloaded = [job['exportId'] for job in scheduler.jobs if job['status'] == 'Downloaded']
+    assert len(created) >= 3 and len(downloaded) == 1
+
+    # a new run with the same jobs creates only the missing exports and downloads the rest
+    scheduler = make_scheduler(stub_batch_client, tmp_path)
+    for index in range(4):
+        scheduler.add({'createdAt': {'startAt': '2018-01-0{}'.format(index + 1)}})
+    assert [job['exportId'] for job in scheduler.jobs][:len(created)] == created
+    fetched = []
+    scheduler.on_complete = lambda job: fetched.append(job['exportId'])
+    jobs = scheduler.run()
+    assert [job['status'] for job in jobs] == ['Downloaded'] * 4
+    assert len(bulk.jobs) == 4
+    assert sorted(fetched) == sorted(set(bulk.jobs) - set(downloaded))
+    saved = stub_batch_client.ledger.get_export('export-4')
+    assert saved['status'] == 'Completed' and saved['filename'] == jobs[3]['filename']
+    calls = stub_batch_client.ledger.calls('export-4')
+    assert [call.get('status') for call in calls[:2]] == ['Created', 'Queued'] and 'filename' in calls[-1]
+
+
+def test_stops_when_quota_used_up(stub_batch_client, marketo_stub, tmp_path):
+    FakeBulkExports(marketo_stub, max_queue=1)
+    size = len('id,exportId\n1,export-1\n')
+    scheduler = make_scheduler(stub_batch_client, tmp_path, daily_quota=2 * size)
+    for index in range(4):
+        scheduler.add({'createdAt': {'startAt': '2018-01-0{}'.format(index + 1)}})
+    jobs = scheduler.run()
+    assert [job['status'] for job in jobs] == ['Downloaded', 'Downloaded', 'Pending', 'Pending']
+    assert scheduler.quota_exhausted
+
+
+def test_next_quota_reset():
+    now = 1514786400.0 + 3600  # 2018-01-01 01:00 CST
+    reset = next_quota_reset(now)
+    assert reset - now == 23 * 3600
+    assert quota_day(reset) != quota_day(reset - 1)
@@ -0,0 +1,85 @@
+import gzip
+import os
+
+import pytest
+
+from conftest import FakeBulkExports
+from marketorestpython.helper.download import DownloadSizeError
+from marketorestpython.helper.retry import RetryPolicy
+from marketorestpython.helper.sinks import FileSink, GzipSink, LocalObjectStore, ObjectStoreSink
+
+
+DATA = b''.join(b'%d,lead%d@example.com\n' % (index, index) for index in range(5000))
+
+
+def write_all(sink, name, data, size=1000):
+    writer = sink.open(name)
+    for start in range(0, len(data), size):
+        writer.write(data[start:start + size])
+    return writer.close()
+
+
+def test_file_sink(tmp_path):
+    sink = FileSink(str(tmp_path))
+    writer = sink.open('a.csv')
+    writer.write(b'id\n')
+    # nothing at the location until the writer is closed
+    assert not (tmp_path / 'a.csv').exists()
+    assert writer.close() == str(tmp_path / 'a.csv')
+    assert (tmp_path / 'a.csv').read_bytes() == b'id\n'
+
+
+def test_gzip_sink(tmp_path):
+    location = write_all(GzipSink(FileSink(str(tmp_path))), 'a.csv', DATA)
+    assert location == str(tmp_path / 'a.csv.gz')
+    with gzip.open(location, 'rb') as handle:
+        assert handle.read() == DATA
+    assert os.path.getsize(location) < len(DATA)
+
+
+def test_object_store_sink_uploads_parts(tmp_path):
+    store = LocalObjectStore(str(tmp_path / 'store'))
+    uploaded = []
+    upload_part = store.upload_part
+    store.upload_part = lambda key, upload_id, number, data: uploaded.append(len(data)) or upload_part(
+        key, upload_id, number, data)
+    sink = ObjectStoreSink(store, prefix='exports/leads/', part_size=16 * 1024, max_workers=2)
+    assert write_all(sink, 'a.csv', DATA) == 'exports/leads/a.csv'
+    assert open(store.path('exports/leads/a.csv'), 'rb').read() == DATA
+    assert len(uploaded) == -(-len(DATA) // (16 * 1024))
+    assert store.keys() == ['exports/leads/a.csv']
+
+
+def test_object_store_abort(tmp_path):
+    store = LocalObjectStore(str(tmp_path / 'store'))
+    writer = ObjectStoreSink(store, part_size=1024).open('a.csv')
+    writer.write(DATA[:5000])
+    writer.abort()
+    assert store.keys() == []
+    assert os.listdir(str(tmp_path / 'store' / '.uploads')) == []
+
+
+def test_retrieve_bulk_job_into_sink(stub_batch_client, marketo_stub, tmp_path):
+    bulk = FakeBulkExports(marketo_stub, make_file=lambda job: DATA)
+    export_id = stub_batch_client.create_bulk_extract(table='leads', fields=['id', 'email'], filter={})[0]['exportId']
+    bulk.jobs[export_id].update(status='Completed', fileSize=len(DATA))
+    store = LocalObjectStore(str(tmp_path / 'store'))
+    sink = GzipSink(ObjectStoreSink(store, prefix='marketo/', part_size=8 * 1024))
+    result = stub_batch_client.retrieve_bulk_job(export_id, sink=sink)
+    assert result['filename'] == 'marketo/{}.csv.gz'.format(export_id)
+    assert result['size'] == len(DATA)
+    with gzip.open(store.path(result['filename']), 'rb') as handle:
+        assert handle.read() == DATA
+    # nothing was written locally
+    assert not os.path.exists('{}.csv'.format(export_id))
+
+
+def test_size_mismatch_aborts(stub_batch_client, marketo_stub, tmp_path):
+    bulk = FakeBulkExports(marketo_stub, make_file=lambda job: DATA)
+    export_id = stub_batch_client.create_bulk_extract(table='leads', fields=['id', 'email'], filter={})[0]['exportId']
+    store = LocalObjectStore(str(tmp_path / 'store'))
+    stub_batch_client.retry_policy = RetryPolicy(max_attempts=2, backoff=0)
+    with pytest.raises(DownloadSizeError):
+        stub_batch_client.retrieve_bulk_job(export_id, file_size=len(DATA) + 1,
+                                            sink=ObjectStoreSink(store, part_size=8 * 1024))
+    assert store.keys() == []
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from marketorestpython.helper.exceptions import MarketoException
+from marketorestpython.write_buffer import WriteBuffer
+
+
+class FakeClient:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def create_update_leads(self, leads, action=None, lookupField=None, asyncProcessing=None, partitionName=None):
+        with self.lock:
+            self.calls.append(('leads', leads, lookupField))
+        time.sleep(self.delay)
+        if any(lead.get('email') == 'broken' for lead in leads):
+            raise MarketoException({'code': '1003', 'message': 'Invalid value'})
+        return [{'id': int(lead['email'].split('@')[0]), 'status': 'updated'} for lead in leads]
+
+    def add_custom_activities(self, input):
+        with self.lock:
+            self.calls.append(('activities', input, None))
+        return [{'marketoGUID': str(index), 'status': 'added'} for index, _ in enumerate(input)]
+
+
+def test_many_producers_few_calls():
+    client = FakeClient(delay=0.01)
+    buffer = WriteBuffer(client, lookupField='email', max_size=300, max_delay=0.05)
+    futures = []
+    lock = threading.Lock()
+
+    def produce(start):
+        for index in range(start, start + 250):
+            future = buffer.add({'email': '{}@example.com'.format(index % 500), 'score': index})
+            with lock:
+                futures.append((index % 500, future))
+    threads = [threading.Thread(target=produce, args=(start,)) for start in range(0, 1000, 250)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buffer.close()
+
+    assert all(future.result()['id'] == index for index, future in futures)
+    assert buffer.stats['records'] == 1000
+    sent = [lead for _, leads, _ in client.calls for lead in leads]
+    assert len(sent) == 1000 - buffer.stats['merged']
+    assert len(client.calls) == buffer.stats['batches'] <= 10
+    assert all(len(leads) <= 300 and lookupField == 'email' for _, leads, lookupField in client.calls)
+
+
+def test_merges_repeated_writes_and_flushes_on_time():
+    client = FakeClient()
+    with WriteBuffer(client, max_delay=0.05) as buffer:
+        first = buffer.add({'email': '1@example.com', 'firstName': 'Jo'})
+        second = buffer.add({'email': '1@EXAMPLE.com', 'lastName': 'Smith'})
+        assert second.result(timeout=5) == first.result(timeout=5) == {'id': 1, 'status': 'updated'}
+        assert client.calls[0][1] == [{'email': '1@EXAMPLE.com', 'firstName': 'Jo', 'lastName': 'Smith'}]
+        broken = buffer.add({'email': 'broken'})
+        buffer.flush()
+        assert broken.result()['status'] == 'failed'
+    with pytest.raises(Exception):
+        buffer.add({'email': '2@example.com'})
+
+
+def test_activities_from_coroutines():
+    client = FakeClient()
+
+    async def main():
+        async with WriteBuffer(client, method='add_custom_activities', max_delay=10) as buffer:
+            tasks = [asyncio.ensure_future(buffer.add_async({'leadId': 1, 'activityTypeId': 100000}))
+                     for _ in range(5)]
+            await asyncio.sleep(0)
+        return await asyncio.gather(*tasks)
+    results = asyncio.run(main())
+    assert [result['status'] for result in results] == ['added'] * 5
+    assert len(client.calls) == 1 and len(client.calls[0][1]) == 5
+
+
+def test_not_sent_again_after_failed_call():
+    client = FakeClient()
+    calls = []
+
+    def send(input, **kwargs):
+        calls.append(input)
+        raise MarketoException({'code': '604', 'message': 'Request timed out'})
+    client.add_custom_activities = client.create_update_leads = send
+    with WriteBuffer(client, method='add_custom_activities', max_delay=10) as buffer:
+        activity = buffer.add({'leadId': 1, 'activityTypeId': 100000})
+    with WriteBuffer(client, action='createOnly', max_delay=10) as buffer:
+        lead = buffer.add({'email': '1@example.com'})
+    assert activity.result()['status'] == lead.result()['status'] == 'failed'
+    assert len(calls) == 2
+
+
+def test_empty_flush_does_not_send_the_next_record_alone():
+    client = FakeClient()
+    with WriteBuffer(client, max_delay=5) as buffer:
+        buffer.flush()
+        buffer.add({'email': '1@example.com'})
+        time.sleep(0.2)
+        assert client.calls == []
+        buffer.add({'email': '2@example.com'})
+    assert len(client.calls) == 1 and len(client.calls[0][1]) == 2